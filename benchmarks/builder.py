@@ -0,0 +1,120 @@
+"""
+UMU XML builder microbenchmark.
+
+Renders the UMU policies of dns_rate_limiting, rate_limiting and
+block_pod_address intents (the latter with growing pod lists, fanned out to
+one policy each) through the precompiled templates of umu_xml.py, next to the
+previous per-request path (FileSystemLoader lookup with auto-reload, then a
+scan of the output for placeholders):
+
+    python -m benchmarks.builder --pods 1,100,1000 --repeat 5
+"""
+import argparse
+import ipaddress
+import logging
+import timeit
+from typing import Any, Dict, List
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+
+from benchmarks import report
+from src.dispatch.builders import umu_xml
+from src.model.MitigationActionRequest import MitigationActionRequest
+
+COLUMNS = ("action", "pods", "path", "renders_s", "us_per_render")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pods", default="1,100,1000", help="comma-separated block_pod_address list lengths")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds; the best one is reported")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def intent(action: str, fields: Dict[str, Any]) -> MitigationActionRequest:
+    return MitigationActionRequest.model_validate({
+        "command": "add",
+        "intent_type": "mitigation",
+        "intent_id": f"bench-{action}",
+        "target_domain": "umu",
+        "action": {"name": action, "intent_id": f"bench-{action}", "fields": fields},
+    })
+
+
+def pods(count: int) -> List[str]:
+    first = int(ipaddress.IPv4Address("10.0.0.0"))
+    return [str(ipaddress.IPv4Address(first + i)) for i in range(count)]
+
+
+def _legacy_env() -> Environment:
+    # As umu_xml.py built it before templates were compiled up front
+    return Environment(
+        loader=FileSystemLoader(str(umu_xml.TEMPLATE_DIR)),
+        autoescape=select_autoescape(enabled_extensions=("xml",)),
+    )
+
+
+def _best(fn, repeat: int) -> float:
+    """Best per-call time of `fn` in seconds, over `repeat` rounds of ~0.2 s."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def measure(action: str, req: MitigationActionRequest, repeat: int) -> List[Dict[str, Any]]:
+    targets = len(umu_xml.block_targets(req.action.fields)[1])
+    if targets > 1:
+        policies, _ = umu_xml.build_umu_policies(req)
+        template = "filtering.xml.j2"
+        ctxs = [umu_xml._filtering_ctx(req, target, f"{req.action.intent_id}-{n}")
+                for n, (target, _) in enumerate(policies, start=1)]
+        precompiled = lambda: umu_xml.build_umu_policies(req)
+    else:
+        template, ctx = umu_xml.policy_context(req)
+        ctxs = [ctx]
+        precompiled = lambda: umu_xml.build_umu_xml(req)
+
+    legacy = _legacy_env()
+
+    def legacy_render():
+        for ctx in ctxs:
+            xml = legacy.get_template(template).render(**ctx)
+            if "{{" in xml:
+                raise ValueError("Unresolved placeholders in generated XML")
+            xml.encode()
+
+    rows = []
+    for path, fn in (("precompiled", precompiled), ("legacy", legacy_render)):
+        seconds = _best(fn, repeat) / len(ctxs)
+        rows.append({
+            "action": action,
+            "pods": targets if action == "block_pod_address" else "-",
+            "path": path,
+            "renders_s": 1 / seconds,
+            "us_per_render": seconds * 1e6,
+        })
+    return rows
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.getLogger("uvicorn.error").setLevel(logging.WARNING)
+    cases = [
+        ("dns_rate_limiting", {"rate": "20", "duration": "60", "source_ip_filter": ["malicious_ips"]}),
+        ("rate_limiting", {"device": "ceos1", "interface": "eth1", "rate": "100mbps"}),
+    ]
+    cases += [("block_pod_address", {"blocked_pod": pods(int(n)), "device": "ceos1", "interface": "eth1"})
+              for n in args.pods.split(",")]
+
+    rows: List[Dict[str, Any]] = []
+    for action, fields in cases:
+        rows.extend(measure(action, intent(action, fields), args.repeat))
+
+    print(report.render_table(rows, COLUMNS))
+    if args.json:
+        report.write_json(rows, vars(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+JSON codec microbenchmark.
+
+Encodes and decodes block_ip_addresses intents carrying growing blocked_ips
+lists with every codec src/utils/codec.py knows (orjson only if installed):
+
+    python -m benchmarks.codec --sizes 10,1000,50000 --repeat 5
+"""
+import argparse
+import copy
+import ipaddress
+import json
+import timeit
+from typing import Any, Dict, List
+
+from benchmarks import report
+from src.utils import codec
+from tests.incomingMessages import VALID_PAYLOAD_BLOCK_IP_ADDRESSES
+
+COLUMNS = ("codec", "blocked_ips", "bytes", "dumps_us", "loads_us", "dumps_MB_s", "loads_MB_s")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,1000,10000,50000", help="comma-separated blocked_ips list lengths")
+    parser.add_argument("--repeat", type=int, default=5, help="timing rounds; the best one is reported")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def intent(size: int) -> Dict[str, Any]:
+    """The block_ip_addresses fixture with `size` distinct addresses, as mitigate dumps it."""
+    doc = copy.deepcopy(VALID_PAYLOAD_BLOCK_IP_ADDRESSES)
+    first = int(ipaddress.IPv4Address("10.0.0.0"))
+    doc["action"]["fields"]["blocked_ips"] = [str(ipaddress.IPv4Address(first + i)) for i in range(size)]
+    return doc
+
+
+def _best(fn, repeat: int) -> float:
+    """Best per-call time of `fn` in seconds, over `repeat` rounds of ~0.2 s."""
+    timer = timeit.Timer(fn)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def measure(name: str, doc: Dict[str, Any], repeat: int) -> Dict[str, Any]:
+    dumps, loads = codec.CODECS[name]
+    encoded = dumps(doc)
+    assert loads(encoded) == json.loads(encoded), f"{name} does not round-trip"
+    dumps_s = _best(lambda: dumps(doc), repeat)
+    loads_s = _best(lambda: loads(encoded), repeat)
+    return {
+        "codec": name,
+        "blocked_ips": len(doc["action"]["fields"]["blocked_ips"]),
+        "bytes": len(encoded),
+        "dumps_us": dumps_s * 1e6,
+        "loads_us": loads_s * 1e6,
+        "dumps_MB_s": len(encoded) / dumps_s / 1e6,
+        "loads_MB_s": len(encoded) / loads_s / 1e6,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    rows: List[Dict[str, Any]] = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        doc = intent(size)
+        rows.extend(measure(name, doc, args.repeat) for name in codec.CODECS)
+
+    print(report.render_table(rows, COLUMNS))
+    if args.json:
+        report.write_json(rows, vars(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Async load generator: replays the request fixtures of tests/incomingMessages.py
+against a running DOC, each with a fresh intent_id, and records per-request
+latency. LoopLagMonitor samples how late the DOC event loop wakes up.
+"""
+import asyncio
+import copy
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional
+
+import httpx
+
+from tests.incomingMessages import (
+    VALID_PAYLOAD_BLOCK_IP_ADDRESSES,
+    VALID_PAYLOAD_DNS_RATE_LIMITING,
+    VALID_PAYLOAD_EXECUTE_TEST_1,
+    VALID_PAYLOAD_EXECUTE_TEST_2,
+    VALID_PAYLOAD_MULTI_DOMAIN_BLOCK_IP,
+    VALID_PAYLOAD_MULTI_DOMAIN_DNS_RATE_LIMITING,
+)
+
+# Flows assume DOC runs with current_domain "upc":
+#   single   - enforced locally: UPC JSON endpoints and the UMU XML endpoint
+#   multi    - fanned out: UPC locally, UMU through the remote DOC
+#   forward  - single-domain intents for UMU, forwarded to the remote DOC
+FLOWS: Dict[str, List[dict]] = {
+    "single": [
+        {**VALID_PAYLOAD_EXECUTE_TEST_1, "testbed": "upc"},
+        {**VALID_PAYLOAD_EXECUTE_TEST_2, "testbed": "upc"},
+        {**VALID_PAYLOAD_BLOCK_IP_ADDRESSES, "testbed": "upc"},
+        {**VALID_PAYLOAD_DNS_RATE_LIMITING, "testbed": "upc"},
+        {**VALID_PAYLOAD_DNS_RATE_LIMITING, "testbed": "umu"},
+    ],
+    "multi": [
+        VALID_PAYLOAD_MULTI_DOMAIN_DNS_RATE_LIMITING,
+        VALID_PAYLOAD_MULTI_DOMAIN_BLOCK_IP,
+    ],
+    "forward": [
+        {**VALID_PAYLOAD_DNS_RATE_LIMITING, "target_domain": "umu"},
+        {**VALID_PAYLOAD_BLOCK_IP_ADDRESSES, "target_domain": "umu"},
+    ],
+}
+
+
+@dataclass
+class Sample:
+    latency: float
+    status: int
+
+
+@dataclass
+class RunResult:
+    flow: str
+    samples: List[Sample] = field(default_factory=list)
+    elapsed: float = 0.0
+    loop_lag: List[float] = field(default_factory=list)
+
+
+def payloads(flow: str, callback_url: Optional[str] = None) -> Callable[[int], dict]:
+    """Factory of the n-th request body of `flow`: the fixtures in turn, each under a unique intent_id."""
+    fixtures = FLOWS[flow]
+    run_id = int(time.time() * 1000)
+
+    def make(n: int) -> dict:
+        body = copy.deepcopy(fixtures[n % len(fixtures)])
+        body["intent_id"] = f"bench-{flow}-{run_id}-{n}"
+        body["action"]["intent_id"] = body["intent_id"]
+        if callback_url:
+            body["callback_url"] = callback_url
+        return body
+
+    return make
+
+
+async def generate(base_url: str, flow: str, requests: int, concurrency: int,
+                   callback_url: Optional[str] = None, timeout: float = 60) -> RunResult:
+    """Send `requests` intents of `flow` with at most `concurrency` in flight."""
+    make = payloads(flow, callback_url)
+    counter = itertools.count()
+    result = RunResult(flow=flow)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        async def worker():
+            while (n := next(counter)) < requests:
+                body = make(n)
+                started = time.perf_counter()
+                try:
+                    resp = await client.post("/api/mitigate", json=body)
+                    status = resp.status_code
+                except httpx.HTTPError:
+                    status = 0
+                result.samples.append(Sample(time.perf_counter() - started, status))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result.elapsed = time.perf_counter() - started
+    return result
+
+
+class LoopLagMonitor:
+    """
+    Runs on the loop under test and records, every `interval` seconds, how much
+    later than requested a sleep returned: time the loop spent busy elsewhere.
+    """
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        async def _spawn():
+            self._task = asyncio.create_task(self._run())
+        asyncio.run_coroutine_threadsafe(_spawn(), loop).result()
+
+    def stop(self, loop: asyncio.AbstractEventLoop):
+        if self._task is not None:
+            loop.call_soon_threadsafe(self._task.cancel)
+
+    def collect(self) -> List[float]:
+        """Samples since the previous call."""
+        samples, self.samples = self.samples, []
+        return samples
@@ -0,0 +1,47 @@
+import json
+import math
+from typing import Any, Dict, List, Sequence
+
+from benchmarks.loadgen import RunResult
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile; 0.0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+
+def summarize(result: RunResult) -> Dict[str, Any]:
+    latencies = [s.latency for s in result.samples]
+    errors = sum(1 for s in result.samples if not 200 <= s.status < 300)
+    return {
+        "flow": result.flow,
+        "requests": len(result.samples),
+        "errors": errors,
+        "req_per_s": len(result.samples) / result.elapsed if result.elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "loop_lag_p99_ms": percentile(result.loop_lag, 99) * 1000,
+        "loop_lag_max_ms": max(result.loop_lag, default=0.0) * 1000,
+    }
+
+
+COLUMNS = ("flow", "requests", "errors", "req_per_s", "p50_ms", "p95_ms", "p99_ms", "loop_lag_p99_ms", "loop_lag_max_ms")
+
+
+def render_table(rows: List[Dict[str, Any]], columns: Sequence[str] = COLUMNS) -> str:
+    cells = [[f"{row[c]:.1f}" if isinstance(row[c], float) else str(row[c]) for c in columns] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(columns)]
+    lines = ["  ".join(c.rjust(w) for c, w in zip(columns, widths))]
+    lines.append("  ".join("-" * w for w in widths))
+    lines.extend("  ".join(v.rjust(w) for v, w in zip(r, widths)) for r in cells)
+    return "\n".join(lines)
+
+
+def write_json(rows: List[Dict[str, Any]], settings: Dict[str, Any], path: str):
+    with open(path, "w") as f:
+        json.dump({"settings": settings, "results": rows}, f, indent=2)
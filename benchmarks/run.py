@@ -0,0 +1,145 @@
+"""
+DOC throughput benchmark.
+
+Starts the testbed stand-ins (benchmarks/stubs.py), points a DOC instance at
+them, drives it with the load generator and prints req/s, latency percentiles
+and event-loop lag per flow:
+
+    python -m benchmarks.run --flows single,multi,forward --requests 2000 --concurrency 50
+
+DOC, the stubs and the load generator each run on their own event loop, so
+the loop lag reported is DOC's own. By default Mongo is replaced with
+mongomock; pass --real-mongo to write to MONGO_URI instead.
+"""
+import argparse
+import asyncio
+import os
+import pathlib
+import sys
+import tempfile
+from urllib.parse import urlsplit
+
+import yaml
+
+from benchmarks import loadgen, report
+from benchmarks.stubs import ServerThread, StubBehaviour, start_stubs
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--flows", default="single,multi,forward", help="comma-separated subset of: " + ", ".join(loadgen.FLOWS))
+    parser.add_argument("--requests", type=int, default=1000, help="intents sent per flow")
+    parser.add_argument("--concurrency", type=int, default=32, help="intents in flight at once")
+    parser.add_argument("--warmup", type=int, default=50, help="unmeasured intents sent per flow first")
+    parser.add_argument("--latency", type=float, default=0.01, help="stub answer delay in seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="+/- random part of the stub delay")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of stub answers that are 503s")
+    parser.add_argument("--no-callbacks", action="store_true", help="omit callback_url from the intents")
+    parser.add_argument("--real-mongo", action="store_true", help="audit to MONGO_URI instead of mongomock")
+    parser.add_argument("--mongo-write-mode", help="MONGO_WRITE_MODE for the DOC under test")
+    parser.add_argument("--json", help="also write the results to this file")
+    return parser.parse_args(argv)
+
+
+def _rebase(url: str, base: str) -> str:
+    """Same path as `url`, served by `base`."""
+    return base + urlsplit(url).path
+
+
+def stub_config(stubs: ServerThread) -> pathlib.Path:
+    """config.yaml with every testbed, remote DOC and the current domain pointed at the stubs."""
+    from src import config_loader
+
+    spec = yaml.safe_load(config_loader._DEFAULT_YAML.read_text())
+    for name, cfg in spec["testbeds"].items():
+        base = stubs.urls.get(name, stubs.urls["upc"])
+        if "endpoints" in cfg:
+            cfg["endpoints"] = {action: _rebase(url, base) for action, url in cfg["endpoints"].items()}
+        if cfg.get("base_url"):
+            cfg["base_url"] = _rebase(cfg["base_url"], base)
+    routing = spec.setdefault("domain_routing", {})
+    routing["current_domain"] = "upc"
+    routing["doc_instances"] = {name: stubs.urls["doc"] for name in spec["testbeds"]}
+
+    path = pathlib.Path(tempfile.mkdtemp(prefix="doc-bench-")) / "config.yaml"
+    path.write_text(yaml.safe_dump(spec))
+    return path
+
+
+def _write_active_one_by_one(changes) -> int:
+    """
+    mongo.write_active() for mongomock: the same replaces and deletes, one
+    at a time. mongomock (up to 4.3) cannot run the ReplaceOne of a
+    bulk_write under pymongo >= 4.11, which passes it a `sort` argument.
+    """
+    from src.utils import mongo
+
+    for key, doc in changes.items():
+        if doc is None:
+            mongo._active_col.delete_one({"_id": key})
+        else:
+            mongo._active_col.replace_one({"_id": key}, {**doc, "_id": key}, upsert=True)
+    return len(changes)
+
+
+def start_doc(stubs: ServerThread, args: argparse.Namespace) -> ServerThread:
+    os.environ["CURRENT_TESTBED"] = "upc"
+    if args.mongo_write_mode:
+        os.environ["MONGO_WRITE_MODE"] = args.mongo_write_mode
+    if not args.real_mongo:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    # Reload before src.main is imported, so it binds the stub configuration
+    from src import config_loader
+    config_loader.reload_yaml(stub_config(stubs))
+    from src.main import app
+
+    if not args.real_mongo:
+        from src.utils import mongo
+        mongo.write_active = _write_active_one_by_one
+
+    return ServerThread({"doc": app}).start()
+
+
+async def run_flows(doc: ServerThread, stubs: ServerThread, args: argparse.Namespace):
+    callback_url = None if args.no_callbacks else f"{stubs.urls['rtr']}/update_action_status"
+    monitor = loadgen.LoopLagMonitor()
+    monitor.start(doc.loop)
+
+    rows = []
+    for flow in args.flows.split(","):
+        if args.warmup:
+            await loadgen.generate(doc.urls["doc"], flow, args.warmup, args.concurrency, callback_url)
+        monitor.collect()
+        result = await loadgen.generate(doc.urls["doc"], flow, args.requests, args.concurrency, callback_url)
+        result.loop_lag = monitor.collect()
+        rows.append(report.summarize(result))
+        print(f"{flow}: done", file=sys.stderr)
+    monitor.stop(doc.loop)
+    return rows
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    unknown = set(args.flows.split(",")) - set(loadgen.FLOWS)
+    if unknown:
+        sys.exit(f"Unknown flow(s): {sorted(unknown)}")
+
+    behaviour = StubBehaviour(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    stubs = start_stubs(upc=behaviour, umu=behaviour, doc=behaviour, rtr=StubBehaviour(latency=0.0))
+    doc = start_doc(stubs, args)
+    try:
+        rows = asyncio.run(run_flows(doc, stubs, args))
+    finally:
+        doc.stop()
+        stubs.stop()
+
+    print(report.render_table(rows))
+    if args.json:
+        report.write_json(rows, vars(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
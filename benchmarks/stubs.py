@@ -0,0 +1,147 @@
+"""
+In-process stand-ins for everything DOC talks to: the UPC JSON endpoints, the
+UMU `meservice` XML endpoint, a remote DOC instance and the RTR callback sink.
+
+Each stub answers after `latency` (+/- `jitter`) seconds and fails with a 503
+for a share `error_rate` of requests.
+"""
+import asyncio
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+UMU_REPLY = "<?xml version='1.0' encoding='UTF-8'?><response><status>OK</status></response>"
+
+
+@dataclass
+class StubBehaviour:
+    latency: float = 0.01
+    jitter: float = 0.0
+    error_rate: float = 0.0
+
+
+def _stub_app(name: str, behaviour: StubBehaviour) -> FastAPI:
+    app = FastAPI(title=f"{name} stub")
+    app.state.received = 0
+
+    @app.middleware("http")
+    async def misbehave(request: Request, call_next):
+        app.state.received += 1
+        delay = behaviour.latency + random.uniform(-behaviour.jitter, behaviour.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if random.random() < behaviour.error_rate:
+            return JSONResponse(status_code=503, content={"error": f"{name} stub: injected failure"})
+        return await call_next(request)
+
+    return app
+
+
+def upc_app(behaviour: StubBehaviour) -> FastAPI:
+    app = _stub_app("UPC", behaviour)
+
+    @app.api_route("/{endpoint}", methods=["POST", "DELETE"])
+    async def endpoint(endpoint: str, request: Request):
+        body = await request.json()
+        return {"message": f"UPC: {endpoint} applied", "fields": list(body.get("fields", {}))}
+
+    return app
+
+
+def umu_app(behaviour: StubBehaviour) -> FastAPI:
+    app = _stub_app("UMU", behaviour)
+
+    @app.api_route("/meservice", methods=["POST", "DELETE"])
+    async def meservice(request: Request):
+        await request.body()
+        return Response(content=UMU_REPLY, media_type="application/xml")
+
+    return app
+
+
+def doc_app(behaviour: StubBehaviour) -> FastAPI:
+    app = _stub_app("remote DOC", behaviour)
+
+    @app.post("/api/mitigate")
+    async def mitigate(request: Request):
+        body = await request.json()
+        return {
+            "status": "success",
+            "testbed": str(body.get("target_domain")),
+            "intent_id": body.get("intent_id"),
+            "message": "Action forwarded for processing.",
+            "upstream": {"message": "remote DOC stub"},
+        }
+
+    return app
+
+
+def rtr_app(behaviour: StubBehaviour) -> FastAPI:
+    app = _stub_app("RTR", behaviour)
+
+    @app.post("/update_action_status")
+    async def update_action_status(request: Request):
+        await request.json()
+        return {"status": "received"}
+
+    return app
+
+
+def free_socket() -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    return sock
+
+
+class ServerThread:
+    """
+    Serves one or more ASGI apps on an event loop of their own, so neither the
+    stubs nor the load generator steal time from the loop being measured.
+    """
+
+    def __init__(self, apps: Dict[str, FastAPI], log_level: str = "warning"):
+        self.apps = apps
+        self.urls: Dict[str, str] = {}
+        self.loop: asyncio.AbstractEventLoop = None
+        self._servers = []
+        for name, app in apps.items():
+            sock = free_socket()
+            self.urls[name] = f"http://127.0.0.1:{sock.getsockname()[1]}"
+            config = uvicorn.Config(app, log_level=log_level, lifespan="on", access_log=False)
+            self._servers.append((uvicorn.Server(config), sock))
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(asyncio.gather(*(s.serve(sockets=[sock]) for s, sock in self._servers)))
+
+    def start(self, timeout: float = 10):
+        self._thread.start()
+        for _ in range(int(timeout / 0.05)):
+            if all(s.started for s, _ in self._servers):
+                return self
+            time.sleep(0.05)
+        raise RuntimeError(f"Servers {list(self.apps)} did not start within {timeout}s")
+
+    def stop(self, timeout: float = 10):
+        for server, _ in self._servers:
+            server.should_exit = True
+        self._thread.join(timeout)
+
+
+def start_stubs(upc: StubBehaviour, umu: StubBehaviour, doc: StubBehaviour, rtr: StubBehaviour) -> ServerThread:
+    return ServerThread({
+        "upc": upc_app(upc),
+        "umu": umu_app(umu),
+        "doc": doc_app(doc),
+        "rtr": rtr_app(rtr),
+    }).start()
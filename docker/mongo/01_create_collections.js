@@ -68,6 +68,10 @@ db.createCollection("mitigation_actions", {
 // Add a unique index on "intent_id" to avoid duplicate intent_ids
 db.mitigation_actions.createIndex({ "intent_id": 1 }, { unique: true });
 
+// Rules currently enforced by DOC, _id "testbed|device|interface|target"
+db.createCollection("active_mitigations");
+db.active_mitigations.createIndex({ "testbed": 1 });
+
 
 // Create the "users" collection with updated schema validation
 db.createCollection("users", {
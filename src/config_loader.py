@@ -1,10 +1,13 @@
 import enum
+import logging
 import os
 import pathlib
-from typing import Any, Dict
+from typing import Any, Callable, Dict, List
 
 import yaml
 
+logger = logging.getLogger("uvicorn.error")
+
 ROOT = pathlib.Path(__file__).resolve().parent.parent
 _DEFAULT_YAML = ROOT / "config" / "config.yaml"
 
@@ -13,25 +16,65 @@ def _load_yaml(path: pathlib.Path = _DEFAULT_YAML) -> Dict[str, Any]:
     return yaml.safe_load(path.read_text())
 
 
-def reload_yaml(path: pathlib.Path = _DEFAULT_YAML):
-    global _SPEC, _TESTBED_SPEC, _ACTION_SPEC, ACTION_SCHEMAS, TESTBED_CFG, DOMAIN_ROUTING, RTR_API_CFG
+_RELOAD_HOOKS: List[Callable[[], None]] = []
+
+
+def on_reload(fn: Callable[[], None]) -> Callable[[], None]:
+    """Register `fn` to rebuild state derived from the config after reload_yaml()."""
+    _RELOAD_HOOKS.append(fn)
+    return fn
+
+
+def reload_yaml(path: pathlib.Path = _DEFAULT_YAML) -> Dict[str, str]:
+    """
+    Re-read the config and run every on_reload hook, even after one fails.
+    Returns the hooks that raised, by name, with their errors.
+    """
+    global _SPEC, _TESTBED_SPEC, _ACTION_SPEC, ACTION_SCHEMAS, TESTBED_CFG, DEFAULTS, DOMAIN_ROUTING, RTR_API_CFG, BATCH_CFG, JOBS_CFG, IDEMPOTENCY_CFG, BREAKER_CFG, ADMISSION_CFG, PRIORITY_CFG, ACTIVE_CFG, BUILDER_CACHE_CFG
     _SPEC = _load_yaml(path)
     _TESTBED_SPEC = _SPEC["testbeds"]
     _ACTION_SPEC = _SPEC["actions"]
     ACTION_SCHEMAS = {n: d["fields"] for n, d in _ACTION_SPEC.items()}
     TESTBED_CFG = _SPEC["testbeds"]
+    DEFAULTS = _SPEC.get("defaults", {})
     DOMAIN_ROUTING = _SPEC.get("domain_routing", {})
     RTR_API_CFG = _SPEC.get("rtr_api", {})
+    BATCH_CFG = _SPEC.get("batch", {})
+    JOBS_CFG = _SPEC.get("jobs", {})
+    IDEMPOTENCY_CFG = _SPEC.get("idempotency", {})
+    BREAKER_CFG = _SPEC.get("breaker", {})
+    ADMISSION_CFG = _SPEC.get("admission", {})
+    PRIORITY_CFG = _SPEC.get("priority", {})
+    ACTIVE_CFG = _SPEC.get("active", {})
+    BUILDER_CACHE_CFG = _SPEC.get("builder_cache", {})
     
     # Override current_domain from environment variable if set
     if "CURRENT_TESTBED" in os.environ:
         DOMAIN_ROUTING["current_domain"] = os.environ["CURRENT_TESTBED"].lower()
 
+    failures = {}
+    for hook in _RELOAD_HOOKS:
+        try:
+            hook()
+        except Exception as e:
+            name = f"{hook.__module__}.{hook.__qualname__}"
+            logger.error("Reload hook %s failed: %s", name, e)
+            failures[name] = str(e)
+    return failures
+
 
 _SPEC = _load_yaml()
 DEFAULTS = _SPEC.get("defaults", {})
 DOMAIN_ROUTING = _SPEC.get("domain_routing", {})
 RTR_API_CFG = _SPEC.get("rtr_api", {})
+BATCH_CFG = _SPEC.get("batch", {})
+JOBS_CFG = _SPEC.get("jobs", {})
+IDEMPOTENCY_CFG = _SPEC.get("idempotency", {})
+BREAKER_CFG = _SPEC.get("breaker", {})
+ADMISSION_CFG = _SPEC.get("admission", {})
+PRIORITY_CFG = _SPEC.get("priority", {})
+ACTIVE_CFG = _SPEC.get("active", {})
+BUILDER_CACHE_CFG = _SPEC.get("builder_cache", {})
 
 # Override current_domain from environment variable if set
 if "CURRENT_TESTBED" in os.environ:
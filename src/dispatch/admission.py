@@ -0,0 +1,203 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from src import config_loader
+from src.dispatch import priority
+from src.dispatch.errors import AdmissionRejected
+from src.dispatch.priority import Lane, LaneIndex
+from src.utils import metrics
+
+
+class Limiter:
+    """
+    At most `max_concurrent` holders at once; up to `max_queue` more wait, each
+    for at most `queue_timeout` seconds. Anyone beyond that is turned away with
+    AdmissionRejected instead of piling onto the upstream.
+
+    Waiters queue per priority lane (see priority.py) and a freed slot goes to
+    the lane head with the earliest LaneIndex.deadline(). When the queue is
+    full, a waiter of the lowest lower-priority lane is shed to make room.
+    """
+
+    def __init__(self, scope: str, max_concurrent: int = 32, max_queue: int = 256,
+                 queue_timeout: float = 10, retry_after: float = 1, reject_status: int = 503,
+                 lanes: Optional[LaneIndex] = None):
+        self.scope = scope
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.reject_status = reject_status
+        self.lanes = lanes or priority.index()
+
+        self.active = 0
+        # (deadline, future) in arrival order, per lane
+        self._waiters: Dict[Lane, Deque[Tuple[float, asyncio.Future]]] = {lane: deque() for lane in self.lanes.lanes}
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.shed = 0
+        self.timed_out = 0
+
+    @classmethod
+    def from_config(cls, scope: str, cfg: Dict[str, Any], retry_after: float, reject_status: int) -> "Limiter":
+        return cls(
+            scope,
+            max_concurrent=int(cfg.get("max_concurrent", 32)),
+            max_queue=int(cfg.get("max_queue", 256)),
+            queue_timeout=float(cfg.get("queue_timeout", 10)),
+            retry_after=retry_after,
+            reject_status=reject_status,
+        )
+
+    def _reject(self, reason: str) -> AdmissionRejected:
+        return AdmissionRejected(self.scope, reason, self.retry_after, self.reject_status)
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    async def acquire(self, lane: Optional[Lane] = None):
+        lane = lane if lane in self._waiters else self.lanes.default
+        if self.active < self.max_concurrent and not self.waiting:
+            self.active += 1
+            self.admitted += 1
+            return
+        if self.waiting >= self.max_queue and not self._shed_below(lane):
+            self.rejected += 1
+            raise self._reject("queue full")
+
+        waiter = asyncio.get_running_loop().create_future()
+        entry = (self.lanes.deadline(lane, time.monotonic()), waiter)
+        self._waiters[lane].append(entry)
+        self.queued += 1
+        started = time.perf_counter()
+        outcome = "admitted"
+        try:
+            # release() hands its slot straight to the waiter
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            self.timed_out += 1
+            raise self._reject(f"no slot within {self.queue_timeout:g}s")
+        except AdmissionRejected:
+            outcome = "shed"
+            raise
+        except BaseException:
+            outcome = "cancelled"
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                self.release()  # handed a slot we will not use
+            raise
+        finally:
+            self._discard(lane, entry)
+            if metrics.ENABLED:
+                metrics.ADMISSION_WAIT.observe(time.perf_counter() - started, self.scope, lane.name, outcome)
+        self.admitted += 1
+
+    def _discard(self, lane: Lane, entry: Tuple[float, asyncio.Future]):
+        try:
+            self._waiters[lane].remove(entry)
+        except ValueError:
+            pass
+
+    def _shed_below(self, lane: Lane) -> bool:
+        """Turn away the newest waiter of the lowest lane below `lane`, if any."""
+        for other in reversed(self.lanes.lanes):
+            if other.rank <= lane.rank:
+                return False
+            queue = self._waiters[other]
+            while queue:
+                _, waiter = queue.pop()
+                if not waiter.done():
+                    self.shed += 1
+                    waiter.set_exception(self._reject(f"shed for a '{lane.name}' dispatch"))
+                    return True
+        return False
+
+    def release(self):
+        head: Optional[Deque[Tuple[float, asyncio.Future]]] = None
+        for queue in self._waiters.values():
+            while queue and queue[0][1].done():
+                queue.popleft()
+            if queue and (head is None or queue[0][0] < head[0][0]):
+                head = queue
+        if head is None:
+            self.active -= 1
+            return
+        _, waiter = head.popleft()
+        waiter.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": self.active,
+            "waiting": {lane.name: len(queue) for lane, queue in self._waiters.items()},
+            "max_concurrent": self.max_concurrent,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "timed_out": self.timed_out,
+        }
+
+
+class AdmissionControl:
+    """
+    Per-testbed and per-endpoint Limiters in front of the upstream calls, built
+    on first use from the `admission` config: `testbeds` / `endpoints` hold a
+    `default` block plus overrides keyed by testbed name / endpoint URL. A
+    scope configured as null is not limited.
+    """
+
+    def __init__(self):
+        self._limiters: Dict[str, Optional[Limiter]] = {}
+
+    def _limiter(self, section: str, key: str) -> Optional[Limiter]:
+        scope = f"{section[:-1]}:{key}"
+        if scope not in self._limiters:
+            cfg = config_loader.ADMISSION_CFG
+            limits = cfg.get(section) or {}
+            settings = limits.get(key, limits.get("default"))
+            if settings is None:
+                self._limiters[scope] = None
+            else:
+                settings = {**(limits.get("default") or {}), **settings}
+                self._limiters[scope] = Limiter.from_config(
+                    scope, settings, float(cfg.get("retry_after", 1)), int(cfg.get("reject_status", 503)))
+        return self._limiters[scope]
+
+    @asynccontextmanager
+    async def slot(self, testbed: str, url: str, lane: Optional[Lane] = None):
+        """
+        Hold one endpoint and one testbed slot around an upstream call. The
+        endpoint slot is taken first, so callers queued on a busy endpoint
+        never sit on testbed slots the testbed's other endpoints could use.
+        """
+        held: List[Limiter] = []
+        try:
+            for limiter in (self._limiter("endpoints", url), self._limiter("testbeds", testbed)):
+                if limiter is not None:
+                    await limiter.acquire(lane)
+                    held.append(limiter)
+            yield
+        finally:
+            for limiter in reversed(held):
+                limiter.release()
+
+    def reset(self):
+        self._limiters.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {scope: l.stats() for scope, l in self._limiters.items() if l is not None}
+
+
+control = AdmissionControl()
+
+
+@config_loader.on_reload
+def _reset():
+    # Calls already holding a slot release it on the old limiter
+    control.reset()
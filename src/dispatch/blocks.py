@@ -0,0 +1,202 @@
+import ipaddress
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+# Actions whose targets are addresses (or pod names) to block
+BLOCK_ACTIONS = frozenset({"block_ip_addresses", "block_pod_addresses", "block_pod_address"})
+# In the order the builders read them
+_TARGET_FIELDS = ("blocked_pod", "blocked_ips")
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def block_targets(fields: Dict[str, Any]) -> Tuple[Optional[str], List[str]]:
+    """The field holding the blocked targets and its value as a list ([] if none)."""
+    for name in _TARGET_FIELDS:
+        value = fields.get(name)
+        if value:
+            return name, [value] if isinstance(value, str) else [str(v) for v in value]
+    return None, []
+
+
+def _network(target: str) -> Optional[Network]:
+    try:
+        return ipaddress.ip_network(target.strip(), strict=False)
+    except ValueError:
+        return None  # a pod name, not an address
+
+
+def canonical(target: str) -> str:
+    """`target` as BlockIndex.covering() names it: the network for an address or CIDR, else the name."""
+    net = _network(target)
+    return str(net) if net is not None else target
+
+
+class _Node:
+    __slots__ = ("children", "count")
+
+    def __init__(self):
+        self.children: List[Optional["_Node"]] = [None, None]
+        self.count = 0  # rules blocking exactly this prefix
+
+
+class PrefixTrie:
+    """
+    Binary radix trie of the networks of one address family. Each node is a
+    prefix; its count says how many rules block it. A lookup walks the bits of
+    an address or network and stops at the first blocked prefix on the way,
+    which covers it: at most 32 (IPv4) or 128 (IPv6) steps, whatever the size.
+    """
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.root = _Node()
+        self.prefixes = 0
+
+    def _bits(self, net: Network) -> Iterable[int]:
+        value = int(net.network_address)
+        return ((value >> (self.bits - 1 - i)) & 1 for i in range(net.prefixlen))
+
+    def add(self, net: Network):
+        node = self.root
+        for bit in self._bits(net):
+            if node.children[bit] is None:
+                node.children[bit] = _Node()
+            node = node.children[bit]
+        if node.count == 0:
+            self.prefixes += 1
+        node.count += 1
+
+    def remove(self, net: Network):
+        path = [self.root]
+        for bit in self._bits(net):
+            node = path[-1].children[bit]
+            if node is None:
+                return
+            path.append(node)
+        node = path[-1]
+        if node.count == 0:
+            return
+        node.count -= 1
+        if node.count:
+            return
+        self.prefixes -= 1
+        # Prune the branch that no longer leads to a blocked prefix
+        for depth in range(len(path) - 1, 0, -1):
+            child = path[depth]
+            if child.count or child.children[0] or child.children[1]:
+                break
+            path[depth - 1].children[child is path[depth - 1].children[1]] = None
+
+    def covering(self, net: Network) -> Optional[Network]:
+        """The blocked network containing `net`, or None."""
+        node = self.root
+        if node.count:
+            return net.supernet(new_prefix=0)
+        for depth, bit in enumerate(self._bits(net), start=1):
+            node = node.children[bit]
+            if node is None:
+                return None
+            if node.count:
+                return net.supernet(new_prefix=depth)
+        return None
+
+
+class BlockIndex:
+    """
+    Blocked targets currently enforced, per (testbed, device): addresses and
+    CIDRs in a PrefixTrie per address family, anything else (pod names) as
+    exact strings. Kept in step with the active-rule index.
+    """
+
+    def __init__(self):
+        self._tries: Dict[Tuple[str, str], Dict[int, PrefixTrie]] = {}
+        self._names: Dict[Tuple[str, str], Counter] = {}
+        self._counters = dict.fromkeys(("targets_skipped", "requests_skipped"), 0)
+
+    def add(self, testbed: str, device: str, targets: Iterable[str]):
+        for target in targets:
+            net = _network(target)
+            if net is None:
+                self._names.setdefault((testbed, device), Counter())[target] += 1
+                continue
+            tries = self._tries.setdefault((testbed, device), {})
+            trie = tries.get(net.version)
+            if trie is None:
+                trie = tries[net.version] = PrefixTrie(net.max_prefixlen)
+            trie.add(net)
+
+    def remove(self, testbed: str, device: str, targets: Iterable[str]):
+        for target in targets:
+            net = _network(target)
+            if net is None:
+                names = self._names.get((testbed, device))
+                if names and names[target] > 0:
+                    names[target] -= 1
+                    if not names[target]:
+                        del names[target]
+                continue
+            trie = self._tries.get((testbed, device), {}).get(net.version)
+            if trie is not None:
+                trie.remove(net)
+
+    def covering(self, testbed: str, device: str, target: str) -> Optional[str]:
+        """The enforced block (address, CIDR or name) that already covers `target`, or None."""
+        net = _network(target)
+        if net is None:
+            return target if self._names.get((testbed, device), {}).get(target) else None
+        trie = self._tries.get((testbed, device), {}).get(net.version)
+        covered_by = trie.covering(net) if trie is not None else None
+        return str(covered_by) if covered_by is not None else None
+
+    def split(self, testbed: str, device: str, targets: List[str]) -> Tuple[List[str], Dict[str, str]]:
+        """`targets` not covered yet, and the covered ones mapped to what covers them."""
+        key = (testbed, device)
+        if key not in self._tries and key not in self._names:
+            return targets, {}
+        remaining: List[str] = []
+        covered: Dict[str, str] = {}
+        for target in targets:
+            covered_by = self.covering(testbed, device, target)
+            if covered_by is None:
+                remaining.append(target)
+            else:
+                covered[target] = covered_by
+        return remaining, covered
+
+    def filter_request(self, req) -> Tuple[Optional[Any], Dict[str, str]]:
+        """
+        `req` with the blocked targets already enforced on its testbed/device
+        dropped, and the dropped ones mapped to what covers them. The request
+        comes back unchanged if nothing is covered, and as None if everything is.
+        """
+        fields = req.action.fields or {}
+        name, targets = block_targets(fields)
+        remaining, covered = self.split(req.testbed.value, str(fields.get("device") or ""), targets)
+        if not covered:
+            return req, {}
+
+        self._counters["targets_skipped"] += len(covered)
+        if not remaining:
+            self._counters["requests_skipped"] += 1
+            return None, covered
+
+        value = remaining if isinstance(fields[name], list) else remaining[0]
+        action = req.action.model_copy(update={"fields": {**fields, name: value}})
+        filtered = req.model_copy(update={"action": action})
+        filtered._envelope = None  # its cached encodings describe the unfiltered request
+        return filtered, covered
+
+    def clear(self):
+        self._tries.clear()
+        self._names.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        scopes = {}
+        for key in set(self._tries) | set(self._names):
+            prefixes = sum(t.prefixes for t in self._tries.get(key, {}).values())
+            scopes["|".join(key)] = prefixes + len(self._names.get(key, ()))
+        return {"blocked": scopes, **self._counters}
+
+
+index = BlockIndex()
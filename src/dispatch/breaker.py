@@ -0,0 +1,166 @@
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict
+
+from src import config_loader
+from src.dispatch.errors import CircuitOpenError
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class _Call:
+    """Handle yielded by CircuitBreaker.track(); set `failed` for a bad answer (e.g. a 5xx)."""
+    failed = False
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open breaker for one upstream URL.
+
+    The outcome of the last `window` calls is kept; a call is bad when it
+    raised, was marked failed, or took longer than `slow_call_s`. Once at
+    least `min_calls` are recorded and the bad share reaches `failure_rate`
+    the breaker opens and allow() refuses calls for `open_for` seconds. After
+    that, `half_open_calls` probes are let through: a good probe closes the
+    breaker, a bad one opens it again.
+
+    A probe slot is only ever taken by track(), around the upstream call
+    itself, and given back on any exit that records no outcome. permits()
+    answers the same question without taking one, for failing fast before
+    a call queues or joins another.
+    """
+
+    def __init__(self, name: str, window: int = 20, min_calls: int = 5, failure_rate: float = 0.5,
+                 slow_call_s: float = 10, open_for: float = 30, half_open_calls: int = 1):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_s = slow_call_s
+        self.open_for = open_for
+        self.half_open_calls = half_open_calls
+
+        self.state = CLOSED
+        self._outcomes = deque(maxlen=window)  # True for a bad call
+        self._opened_at = 0.0
+        self._probes = 0
+        self._counters = dict.fromkeys(("rejected", "opened"), 0)
+
+    @classmethod
+    def from_config(cls, name: str, cfg: Dict[str, Any]) -> "CircuitBreaker":
+        return cls(name, **cfg)
+
+    def permits(self) -> bool:
+        """Whether allow() would let a call through now, without taking a probe slot."""
+        if self.state == OPEN:
+            refused = time.monotonic() - self._opened_at < self.open_for
+        else:
+            refused = self.state == HALF_OPEN and self._probes >= self.half_open_calls
+        if refused:
+            self._counters["rejected"] += 1
+        return not refused
+
+    def allow(self) -> bool:
+        """Whether a call may go out now. A True in half-open state takes a probe slot."""
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < self.open_for:
+                self._counters["rejected"] += 1
+                return False
+            self.state = HALF_OPEN
+            self._probes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_calls:
+                self._counters["rejected"] += 1
+                return False
+            self._probes += 1
+        return True
+
+    def retry_after(self) -> float:
+        if self.state != OPEN:
+            return 0.0
+        return max(0.0, self.open_for - (time.monotonic() - self._opened_at))
+
+    @contextmanager
+    def track(self):
+        """
+        One upstream call: raises CircuitOpenError unless allow() lets it
+        through, then times it; an exception counts as a failure. An exit
+        with no verdict on the upstream (cancellation) gives back the probe
+        slot the call took.
+        """
+        if not self.allow():
+            raise CircuitOpenError(self.name, self.retry_after())
+        probe = self.state == HALF_OPEN
+        call = _Call()
+        started = time.monotonic()
+        try:
+            yield call
+        except Exception:
+            self._record(bad=True)
+            raise
+        except BaseException:
+            if probe and self.state == HALF_OPEN:
+                self._probes -= 1
+            raise
+        else:
+            self._record(bad=call.failed or time.monotonic() - started > self.slow_call_s)
+
+    def _record(self, bad: bool):
+        if self.state == OPEN:
+            # Outcome of a call sent before the breaker opened
+            return
+        if self.state == HALF_OPEN:
+            if bad:
+                self._open()
+            else:
+                self.state = CLOSED
+                self._outcomes.clear()
+            return
+        self._outcomes.append(bad)
+        if (len(self._outcomes) >= self.min_calls
+                and sum(self._outcomes) / len(self._outcomes) >= self.failure_rate):
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self._counters["opened"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        calls = len(self._outcomes)
+        return {
+            "state": self.state,
+            "calls": calls,
+            "failure_rate": sum(self._outcomes) / calls if calls else 0.0,
+            "retry_after_s": round(self.retry_after(), 1),
+            **self._counters,
+        }
+
+
+class BreakerRegistry:
+    """One CircuitBreaker per upstream URL, created on first use from the `breaker` config."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def get(self, url: str) -> CircuitBreaker:
+        breaker = self._breakers.get(url)
+        if breaker is None:
+            breaker = self._breakers[url] = CircuitBreaker.from_config(url, config_loader.BREAKER_CFG)
+        return breaker
+
+    def reset(self):
+        self._breakers.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {url: b.stats() for url, b in self._breakers.items()}
+
+
+breakers = BreakerRegistry()
+
+
+@config_loader.on_reload
+def _reset():
+    # Start over with the reloaded thresholds
+    breakers.reset()
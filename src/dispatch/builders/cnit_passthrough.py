@@ -1,7 +1,11 @@
-def build_cnit_passthrough(req):
+from src.dispatch.builders.result import BuilderResult
+
+
+def build_cnit_passthrough(req) -> BuilderResult:
     """
     CNIT passthrough builder - acknowledges the action without actual dispatch.
-    Returns a simple success message indicating the domain was handled.
+    Returns a simple success message indicating the domain was handled, as
+    data: it is answered locally and never needs encoding for a testbed.
     """
     response = {
         "status": "acknowledged",
@@ -9,6 +13,5 @@ def build_cnit_passthrough(req):
         "intent_id": req.action.intent_id,
         "action": req.action.name
     }
-    
-    import json
-    return json.dumps(response).encode("utf-8"), {"Content-Type": "application/json"}
+
+    return BuilderResult(data=response, headers={"Content-Type": "application/json"})
@@ -0,0 +1,52 @@
+from typing import Any, Dict, Optional
+
+from src.utils import codec
+
+
+class BuilderResult:
+    """
+    What a builder produced: the payload as data (JSON builders), as bytes,
+    or both, plus the headers to send it with. The missing form is derived on
+    first use and kept, so the HTTP send, the singleflight key and the debug
+    log share one encoding, and a payload only ever used as data (CNIT
+    passthrough) is never encoded at all. `method` is the HTTP method sending
+    it (see method_for).
+    """
+
+    __slots__ = ("_data", "_body", "headers", "method")
+
+    def __init__(self, data: Any = None, body: Optional[bytes] = None, headers: Optional[Dict[str, str]] = None,
+                 method: str = "POST"):
+        if data is None and body is None:
+            raise ValueError("A builder result needs data or a body")
+        self._data = data
+        self._body = body
+        self.headers = headers or {}
+        self.method = method
+
+    @property
+    def data(self) -> Any:
+        """The payload as data; JSON bodies are decoded on first use."""
+        if self._data is None:
+            self._data = codec.loads(self._body)
+        return self._data
+
+    @property
+    def body(self) -> bytes:
+        """The payload as sent; data is encoded on first use."""
+        if self._body is None:
+            self._body = codec.dumps(self._data)
+        return self._body
+
+    @property
+    def text(self) -> str:
+        """The body for log lines."""
+        return self.body.decode("utf-8", errors="replace")
+
+
+def method_for(req) -> str:
+    """
+    HTTP method carrying `req` to its testbed: a command delete sends the
+    payload of the rule it lifts with DELETE, anything else is POSTed.
+    """
+    return "DELETE" if str(getattr(req, "command", "")).lower() == "delete" else "POST"
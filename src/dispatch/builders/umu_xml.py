@@ -1,20 +1,87 @@
 import pathlib
 import logging
+from typing import Dict, List, Optional, Tuple
 
-from jinja2 import Environment, FileSystemLoader, select_autoescape
-from src.config_loader import DEFAULTS, ACTION_SCHEMAS
+from jinja2 import Environment, FileSystemLoader, StrictUndefined, Template, meta, select_autoescape
+from src import config_loader
+from src.dispatch.blocks import block_targets
+from src.dispatch.builders.result import BuilderResult, method_for
 
-logger = logging.getLogger("uvicorn.error")
+logger = logging.getLogger("uvicorn.error.builder")
 
 TEMPLATE_DIR = pathlib.Path(__file__).parent.parent / "templates"
 
-env = Environment(
-    loader=FileSystemLoader(str(TEMPLATE_DIR)),
-    autoescape=select_autoescape(enabled_extensions=("xml",))
-    # autoescape makes sure &, <, > in placeholders are properly escaped
-)
 
-def build_umu_xml(req):
+def compile_templates(directory: pathlib.Path = TEMPLATE_DIR) -> Tuple[Environment, Dict[str, Template]]:
+    """
+    Compile every *.j2 template under `directory` once, into memory: with
+    auto_reload off and an unbounded cache, rendering never goes back to the
+    disk. Each template is rendered with all its variables set to check it
+    leaves no placeholder unresolved; at request time a variable missing from
+    the context raises (StrictUndefined) instead of rendering empty.
+    """
+    compiled = Environment(
+        loader=FileSystemLoader(str(directory)),
+        autoescape=select_autoescape(enabled_extensions=("xml",)),
+        # autoescape makes sure &, <, > in placeholders are properly escaped
+        undefined=StrictUndefined,
+        auto_reload=False,
+        cache_size=-1,
+    )
+    templates = {}
+    for name in compiled.list_templates(extensions=["j2"]):
+        source, _, _ = compiled.loader.get_source(compiled, name)
+        variables = meta.find_undeclared_variables(compiled.parse(source))
+        template = compiled.get_template(name)
+        probe = template.render(**dict.fromkeys(variables, "x"))
+        if "{{" in probe or "}}" in probe:
+            raise ValueError(f"Unresolved placeholders in template {name}")
+        templates[name] = template
+    return compiled, templates
+
+
+env, _TEMPLATES = compile_templates()
+
+
+@config_loader.on_reload
+def _recompile():
+    # Template edits take effect on reload_config only
+    global env, _TEMPLATES
+    env, _TEMPLATES = compile_templates()
+
+
+def _filtering_ctx(req, target: str, policy_id: Optional[str] = None) -> dict:
+    flds = req.action.fields
+    return {
+        "id": policy_id or req.action.intent_id,
+        "device": flds["device"],
+        "input_interface": flds.get("input_interface", "*"),
+        "output_interface": flds["interface"],
+        "target": target,
+        "description": f"Block pod {target} at {flds['device']}",
+    }
+
+
+def build_umu_policies(req) -> Tuple[List[Tuple[str, bytes]], dict]:
+    """
+    block_pod_address with a list of targets: one filtering policy per
+    distinct target, rendered in one pass, as (target, XML body) pairs plus
+    the headers for them. Each policy id is the action intent_id suffixed
+    with the target's position.
+    """
+    _, targets = block_targets(req.action.fields)
+    targets = list(dict.fromkeys(targets))
+    template = _TEMPLATES["filtering.xml.j2"]
+    policies = [
+        (target, template.render(**_filtering_ctx(req, target, f"{req.action.intent_id}-{n}")).encode())
+        for n, target in enumerate(targets, start=1)
+    ]
+    logger.info("Generated %s filtering policies for UMU testbed (intent_id: %s)", len(policies), req.action.intent_id)
+    return policies, {"Content-Type": "application/xml"}
+
+
+def policy_context(req) -> Tuple[str, dict]:
+    """The template and the context rendering the policy of `req`."""
     name = req.action.name.lower()  # Convert to lowercase for case-insensitive comparison
     flds = req.action.fields
 
@@ -23,10 +90,10 @@ def build_umu_xml(req):
         tpl = "qos.xml.j2"
         ctx = {
             "id": req.action.intent_id,
-            "device": DEFAULTS["dns_device"],
-            "interface": DEFAULTS["dns_iface"],
+            "device": config_loader.DEFAULTS["dns_device"],
+            "interface": config_loader.DEFAULTS["dns_iface"],
             "throughput": flds["rate"],
-            "unit": DEFAULTS["qos_units"]["rps"],
+            "unit": config_loader.DEFAULTS["qos_units"]["rps"],
             "description": f"limit DNS to {flds['rate']} rps",
         }
 
@@ -39,36 +106,32 @@ def build_umu_xml(req):
             "device": flds["device"],
             "interface": flds["interface"],
             "throughput": rate_num,
-            "unit": rate_unit or DEFAULTS["qos_units"]["bw"],
+            "unit": rate_unit or config_loader.DEFAULTS["qos_units"]["bw"],
             "description": f"limit {flds['device']} {flds['interface']} to {flds['rate']}",
         }
 
     elif name == "block_pod_address":
-        # Support both blocked_pod and blocked_ips field names, handle both string and list
+        # Support both blocked_pod and blocked_ips field names, handle both string and list;
+        # a list of several targets goes through build_umu_policies instead
         blocked_target = flds.get("blocked_pod") or flds.get("blocked_ips")
         if isinstance(blocked_target, list):
-            # Take first element if list
             blocked_target = blocked_target[0] if blocked_target else ""
-        
+
         tpl = "filtering.xml.j2"
-        ctx = {
-            "id": req.action.intent_id,
-            "device": flds["device"],
-            "input_interface": flds.get("input_interface", "*"),
-            "output_interface": flds["interface"],
-            "target": blocked_target,
-            "description": f"Block pod {blocked_target} at {flds['device']}",
-        }
+        ctx = _filtering_ctx(req, blocked_target)
 
     else:
         raise ValueError(f"UMU does not support action: '{name}'")
 
-    xml = env.get_template(tpl).render(**ctx)
-    if "{{" in xml:
-        raise ValueError("Unresolved placeholders in generated XML")
-    
-    # Log the complete XML payload for UMU testbed
-    logger.info(f"Generated XML for UMU testbed (action: {name}, intent_id: {req.action.intent_id}):")
-    logger.info(f"\n{xml}")
-    
-    return xml.encode(), {"Content-Type": "application/xml"}
\ No newline at end of file
+    return tpl, ctx
+
+
+def build_umu_xml(req) -> BuilderResult:
+    tpl, ctx = policy_context(req)
+    xml = _TEMPLATES[tpl].render(**ctx)
+
+    logger.info("Generated XML for UMU testbed (action: %s, intent_id: %s)", req.action.name, req.action.intent_id)
+    logger.debug("\n%s", xml)
+
+    # The policy is lifted by sending it again with DELETE
+    return BuilderResult(body=xml.encode(), headers={"Content-Type": "application/xml"}, method=method_for(req))
\ No newline at end of file
@@ -1,16 +1,23 @@
-import json
+from src.dispatch.builders.result import BuilderResult, method_for
 
 
-def build_upc_json(req) -> tuple[bytes, dict]:
+def build_upc_json(req) -> BuilderResult:
     """
     UPC now wants only:
       {"fields": {...}}
+    POSTed to add the rule, sent with DELETE to lift it.
     """
+    headers = {"Content-Type": "application/json"}
+    envelope = getattr(req, "_envelope", None)
+    if envelope is not None:
+        # fields already encoded once for this request
+        return BuilderResult(body=b'{"fields":' + envelope.fields_json + b'}', headers=headers,
+                             method=method_for(req))
+
     # support both new (req.action.fields) and older (req.fields) shapes:
     if hasattr(req, "action") and hasattr(req.action, "fields"):
         fields = req.action.fields
     else:
         fields = req.fields  # fallback if model differs in tests
 
-    body = {"fields": fields}
-    return json.dumps(body).encode("utf-8"), {"Content-Type": "application/json"}
+    return BuilderResult(data={"fields": fields}, headers=headers, method=method_for(req))
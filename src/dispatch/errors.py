@@ -0,0 +1,19 @@
+class DispatchError(Exception):
+    """I use this to wrap any network / 4xx / 5xx errors we want to bubble up."""
+    pass
+
+class CircuitOpenError(DispatchError):
+    """Raised without contacting the upstream while its circuit breaker is open."""
+    def __init__(self, url: str, retry_after: float):
+        super().__init__(f"Circuit open for {url} (retry after {retry_after:.0f}s)")
+        self.url = url
+        self.retry_after = retry_after
+
+class AdmissionRejected(DispatchError):
+    """Raised without contacting the upstream when its dispatch queue is full or the wait ran out."""
+    def __init__(self, scope: str, reason: str, retry_after: float, status: int = 503):
+        super().__init__(f"Too many dispatches for {scope}: {reason} (retry after {retry_after:.0f}s)")
+        self.scope = scope
+        self.reason = reason
+        self.retry_after = retry_after
+        self.status = status
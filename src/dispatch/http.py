@@ -1,88 +1,201 @@
+import asyncio
 import httpx
 import logging
+import time
 
-from src.config_loader import TESTBED_CFG
-from src.dispatch.registry import BUILDER_REGISTRY
+from src.dispatch import admission, blocks, plan, pool, priority, singleflight
+from src.dispatch.errors import AdmissionRejected, CircuitOpenError, DispatchError
+from src.dispatch.breaker import CircuitBreaker, breakers
+from src.dispatch.builders.result import method_for
+from src.utils import codec, metrics
 
 logger = logging.getLogger("uvicorn.error")
+# Once-per-dispatch lines, so LOG_SAMPLING can thin them out on their own
+dispatch_log = logging.getLogger("uvicorn.error.dispatch")
 
-class DispatchError(Exception):
-    """I use this to wrap any network / 4xx / 5xx errors we want to bubble up."""
-    pass
+def check_circuit(url: str) -> CircuitBreaker:
+    """
+    Fail fast with CircuitOpenError if `url` is known to be down. Takes no
+    probe slot: the call itself does, in CircuitBreaker.track().
+    """
+    breaker = breakers.get(url)
+    if not breaker.permits():
+        logger.warning("Circuit open for %s; failing fast", url)
+        raise CircuitOpenError(url, breaker.retry_after())
+    return breaker
 
 def resolve_endpoint(testbed: str, action: str) -> str:
-    cfg = TESTBED_CFG[testbed]
-    # per-action mapping (UPC style)
-    if "endpoints" in cfg:
-        # Convert action to lowercase for case-insensitive lookup
-        action_lower = action.lower()
-        try:
-            return cfg["endpoints"][action_lower]
-        except KeyError:
-            raise ValueError(
-                f"Action '{action}' not allowed on test-bed '{testbed}'. "
-                f"Allowed: {list(cfg['endpoints'])}"
-            )
-
-    # single-URL test-bed (UMU style)
-    return cfg["base_url"]
+    return plan.lookup(testbed, action).url
 
 async def dispatch(req_model):
     """
-    1. Build payload via the registry
-    2. POST to the correct endpoint
-    3. Return tuple: (response_data, http_status_code, success_flag)
-    4. Raise DispatchError on non-2xx
+    1. Drop blocked targets already enforced on the testbed (see blocks.py)
+    2. Build payload via the compiled action plan
+    3. Send it to the correct endpoint, with the builder's method (POST, or
+       DELETE for a command delete); concurrent identical calls share one
+    4. Return tuple: (response_data, http_status_code, success_flag)
+    5. Raise DispatchError on non-2xx
     
-    Special case: CNIT passthrough returns immediately without HTTP call
+    Special cases: CNIT passthrough, and blocks that are already all in force,
+    return immediately without HTTP call; blocks of several targets on a
+    testbed taking one target per message are fanned out (see _fan_out)
     
     Returns:
         tuple: (response_dict, status_code, success_bool)
     """
-    builder = BUILDER_REGISTRY[req_model.message_type]
-    body_bytes, headers = builder(req_model)
+    if req_model.action.name.lower() in blocks.BLOCK_ACTIONS and str(req_model.command).lower() != "delete":
+        testbed = req_model.testbed.value
+        req_model, covered = blocks.index.filter_request(req_model)
+        if covered:
+            dispatch_log.info("Skipping targets already blocked on %s: %s", testbed, covered)
+        if req_model is None:
+            return {
+                "status": "already_enforced",
+                "message": f"All blocked targets are already in force on {testbed}",
+                "covered": covered,
+            }, 200, True
+    action_plan = plan.lookup(req_model.testbed.value, req_model.action.name)
+    if (action_plan.fanout is not None and action_plan.url is not None
+            and len(blocks.block_targets(req_model.action.fields or {})[1]) > 1):
+        return await _fan_out(action_plan, req_model)
+    if metrics.ENABLED:
+        started = time.perf_counter()
+        built = action_plan.builder(req_model)
+        metrics.BUILD_LATENCY.observe(time.perf_counter() - started, action_plan.testbed, action_plan.action)
+    else:
+        built = action_plan.builder(req_model)
+    headers = {**action_plan.headers, **built.headers}
     
     # Log the mitigation message before sending
-    logger.info(f"Dispatching mitigation action: testbed={req_model.testbed.value}, action={req_model.action.name}, intent_id={req_model.intent_id}")
-    logger.debug(f"Payload: {body_bytes.decode('utf-8')}")
-    logger.debug(f"Headers: {headers}")
+    dispatch_log.info("Dispatching mitigation action: testbed=%s, action=%s, intent_id=%s",
+                      req_model.testbed.value, req_model.action.name, req_model.intent_id,
+                      extra={"intent_id": req_model.intent_id})
+    if dispatch_log.isEnabledFor(logging.DEBUG):
+        dispatch_log.debug("Payload: %s", built.text)
+        dispatch_log.debug("Headers: %s", headers)
     
     # CNIT passthrough - return the built response directly without HTTP call
-    if req_model.message_type == "cnit_passthrough":
-        import json
-        response_data = json.loads(body_bytes.decode("utf-8"))
-        return response_data, 200, True
+    if action_plan.url is None:
+        return built.data, 200, True
     
-    url = resolve_endpoint(req_model.testbed.value, req_model.action.name)
-    logger.info(f"Sending mitigation request to: {url}")
+    body_bytes = built.body
+    url = action_plan.url
+    method = built.method
+    dispatch_log.info("Sending mitigation request to: %s %s", method, url)
+
+    check_circuit(url)
+
+    # Identical requests already on their way to the testbed are joined, not repeated
+    key = singleflight.request_key(url, body_bytes, method)
+    return await singleflight.inflight.do(
+        key, lambda: _admitted_post(action_plan.testbed, url, body_bytes, headers, action_plan.timeout,
+                                    priority.lane_for(req_model), method)
+    )
+
+
+async def _fan_out(action_plan: plan.ActionPlan, req_model):
+    """
+    One call per blocked target, at most `fanout_concurrency` at a time, each
+    through the same breaker, singleflight and admission slots as a single
+    dispatch. Succeeds only if every target does; per-target outcomes are
+    returned under `targets`.
+    """
+    url = action_plan.url
+    method = method_for(req_model)
+    started = time.perf_counter()
+    policies, headers = action_plan.fanout(req_model)
+    if metrics.ENABLED:
+        metrics.BUILD_LATENCY.observe(time.perf_counter() - started, action_plan.testbed, action_plan.action)
+    headers = {**action_plan.headers, **headers}
+    lane = priority.lane_for(req_model)
+    limit = asyncio.Semaphore(action_plan.fanout_concurrency)
+
+    dispatch_log.info("Dispatching mitigation action: testbed=%s, action=%s, intent_id=%s, targets=%s",
+                      req_model.testbed.value, req_model.action.name, req_model.intent_id, len(policies),
+                      extra={"intent_id": req_model.intent_id})
+    dispatch_log.info("Sending %s mitigation requests to: %s %s", len(policies), method, url)
+
+    async def send(body_bytes: bytes) -> dict:
+        async with limit:
+            try:
+                check_circuit(url)
+                key = singleflight.request_key(url, body_bytes, method)
+                reply, status_code, success = await singleflight.inflight.do(
+                    key, lambda: _admitted_post(action_plan.testbed, url, body_bytes, headers,
+                                                action_plan.timeout, lane, method)
+                )
+            except DispatchError as e:
+                return {"status": "error", "reason": str(e)}
+        return {"status": "success" if success else "error", "response": reply, "http_status": status_code}
+
+    results = await asyncio.gather(*(send(body) for _, body in policies))
+    targets = {target: result for (target, _), result in zip(policies, results)}
+    failed = [target for target, result in targets.items() if result["status"] != "success"]
+    if not failed:
+        return {"status": "success", "targets": targets}, 200, True
+
+    logger.warning("%s of %s targets failed on %s: %s", len(failed), len(targets), url, failed)
+    status_code = next((targets[t]["http_status"] for t in failed if "http_status" in targets[t]), 502)
+    return {
+        "status": "partial_success" if len(failed) < len(targets) else "error",
+        "error": f"{len(failed)} of {len(targets)} targets failed: {', '.join(failed)}",
+        "targets": targets,
+    }, status_code, False
+
+
+async def _admitted_post(testbed: str, url: str, body_bytes: bytes, headers: dict, timeout: float,
+                         lane: priority.Lane, method: str = "POST"):
+    # Waits (in the request's priority lane) for a testbed and an endpoint slot, or raises AdmissionRejected
+    async with admission.control.slot(testbed, url, lane):
+        return await _post(url, body_bytes, headers, timeout, method)
+
+
+async def _post(url: str, body_bytes: bytes, headers: dict, timeout: float, method: str = "POST"):
+    if not metrics.ENABLED:
+        return await _send(url, body_bytes, headers, timeout, method)
+
+    metrics.UPSTREAM_IN_FLIGHT.inc(url)
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result = await _send(url, body_bytes, headers, timeout, method)
+        outcome = f"{result[1] // 100}xx"
+        return result
+    finally:
+        metrics.UPSTREAM_IN_FLIGHT.dec(url)
+        metrics.UPSTREAM_LATENCY.observe(time.perf_counter() - started, url, outcome)
+
 
+async def _send(url: str, body_bytes: bytes, headers: dict, timeout: float, method: str = "POST"):
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(url, content=body_bytes, headers=headers, timeout=15)
+        with breakers.get(url).track() as call:
+            async with pool.client_for(url) as client:
+                resp = await client.request(method, url, content=body_bytes, headers=headers, timeout=timeout)
+            call.failed = resp.status_code >= 500
     except httpx.ConnectTimeout:
-        logger.error(f"Timeout connecting to {url}")
+        logger.error("Timeout connecting to %s", url)
         raise DispatchError(f"Timeout connecting to {url}")
     except httpx.ConnectError as e:
-        logger.error(f"Connection error while reaching {url}: {e}")
+        logger.error("Connection error while reaching %s: %s", url, e)
         raise DispatchError(f"Failed to connect to {url} — likely unreachable.")
     except httpx.RequestError as e:
-        logger.error(f"Unexpected request error during dispatch to {url}: {repr(e)}")
+        logger.error("Unexpected request error during dispatch to %s: %r", url, e)
         raise DispatchError(f"Error dispatching to {url}: {e.__class__.__name__}")
 
 
 
     if not resp.is_success:
-        logger.warning(f"Dispatch to {url} returned {resp.status_code}: {resp.text}")
+        logger.warning("Dispatch to %s returned %s: %s", url, resp.status_code, resp.text)
         # Return response data with failure status
         try:
-            response_data = resp.json()
+            response_data = codec.loads(resp.content)
         except ValueError:
             response_data = {"raw": resp.text, "error": f"HTTP {resp.status_code}"}
         return response_data, resp.status_code, False
 
     # Most UPC endpoints answer JSON; fall back to text
     try:
-        response_data = resp.json()
+        response_data = codec.loads(resp.content)
     except ValueError:
         response_data = {"raw": resp.text}
     
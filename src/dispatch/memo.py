@@ -0,0 +1,123 @@
+import hashlib
+import json
+import re
+from collections import OrderedDict
+from functools import wraps
+from typing import Any, Callable, Dict, Tuple
+from uuid import uuid4
+
+from src import config_loader
+from src.dispatch.builders.result import BuilderResult, method_for
+from src.utils import metrics
+
+# Rendered in place of the intent id; unique, and unchanged by XML or JSON escaping
+_MARKER = f"docid{uuid4().hex}"
+# Ids spliced into the cached bytes as they are: nothing in them to escape
+_SPLICEABLE = re.compile(r"[A-Za-z0-9._:@-]+")
+
+Segments = Tuple[bytes, ...]
+
+
+def payload_key(name: str, req) -> bytes:
+    """Hash of everything a builder reads except the intent id: the action name and its fields."""
+    blob = json.dumps([name, req.action.name.lower(), req.action.fields],
+                      sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(blob.encode(), digest_size=16).digest()
+
+
+class BuilderCache:
+    """
+    Bounded LRU of built payloads, for the steady stream of identical actions
+    (same rate limit on the same device and interface) that differ only by
+    intent id. A miss runs the builder once with a marker as action.intent_id
+    and keeps the payload cut at the marker; a hit joins the pieces with the
+    request's id, without running the builder.
+
+    Bounded by `max_entries` and by `max_bytes` of cached payload. Ids that
+    would need escaping in the payload skip the cache.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 8 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self._entries: "OrderedDict[bytes, Tuple[Segments, Dict[str, str]]]" = OrderedDict()
+        self._bytes = 0
+        self._counters = dict.fromkeys(("hits", "misses", "bypassed", "evictions"), 0)
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "BuilderCache":
+        return cls(**{k: int(cfg[k]) for k in ("max_entries", "max_bytes") if k in cfg})
+
+    def configure(self, cfg: Dict[str, Any]):
+        """Take new limits (config reload); cached payloads are dropped, as the config may change them."""
+        fresh = self.from_config(cfg)
+        self.max_entries, self.max_bytes = fresh.max_entries, fresh.max_bytes
+        self.clear()
+
+    def memoize(self, name: str, builder: Callable) -> Callable:
+        """`builder` behind this cache; `name` keeps the entries of different builders apart."""
+        @wraps(builder)
+        def build(req):
+            return self.build(name, builder, req)
+        return build
+
+    def build(self, name: str, builder: Callable, req) -> BuilderResult:
+        intent_id = req.action.intent_id
+        if self.max_entries <= 0 or not isinstance(intent_id, str) or not _SPLICEABLE.fullmatch(intent_id):
+            self._count("bypassed")
+            return builder(req)
+
+        key = payload_key(name, req)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self._count("hits")
+            segments, headers = entry
+            return BuilderResult(body=intent_id.encode().join(segments), headers=headers, method=method_for(req))
+
+        self._count("misses")
+        stand_in = req.model_copy(update={"action": req.action.model_copy(update={"intent_id": _MARKER})})
+        built = builder(stand_in)
+        segments = tuple(built.body.split(_MARKER.encode()))
+        self._put(key, segments, built.headers)
+        return BuilderResult(body=intent_id.encode().join(segments), headers=built.headers, method=built.method)
+
+    def _put(self, key: bytes, segments: Segments, headers: Dict[str, str]):
+        size = len(key) + sum(map(len, segments))
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (segments, headers)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            old_key, (old_segments, _) = self._entries.popitem(last=False)
+            self._bytes -= len(old_key) + sum(map(len, old_segments))
+            self._counters["evictions"] += 1
+
+    def _count(self, outcome: str):
+        self._counters[outcome] += 1
+        if metrics.ENABLED:
+            metrics.BUILDER_CACHE_LOOKUPS.inc(outcome)
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._counters["hits"] + self._counters["misses"]
+        return {
+            **self._counters,
+            "hit_rate": self._counters["hits"] / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
+
+
+payloads = BuilderCache.from_config(config_loader.BUILDER_CACHE_CFG)
+
+
+@config_loader.on_reload
+def _reconfigure():
+    payloads.configure(config_loader.BUILDER_CACHE_CFG)
@@ -0,0 +1,99 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from src import config_loader
+from src.dispatch.registry import BUILDER_REGISTRY, FANOUT_REGISTRY
+from src.model import validators
+
+# Message types answered locally by their builder, without an HTTP call
+PASSTHROUGH_TYPES = frozenset({"cnit_passthrough"})
+DEFAULT_TIMEOUT = 15
+DEFAULT_FANOUT_CONCURRENCY = 16
+
+
+@dataclass(frozen=True)
+class ActionPlan:
+    """Everything dispatch() needs for one (testbed, action) pair, resolved once."""
+    testbed: str
+    action: str
+    message_type: str
+    builder: Callable
+    url: Optional[str]  # None for passthrough testbeds
+    headers: Mapping[str, str]
+    timeout: float
+    validator: Optional[validators.FieldValidator]
+    fanout: Optional[Callable] = None  # per-target builder for requests blocking several targets
+    fanout_concurrency: int = DEFAULT_FANOUT_CONCURRENCY
+
+
+@dataclass(frozen=True)
+class PlanIndex:
+    plans: Mapping[Tuple[str, str], ActionPlan]
+    allowed: Mapping[str, Tuple[str, ...]]
+
+
+def _testbed_actions(cfg: Dict[str, Any], action_spec: Dict[str, Any]) -> Dict[str, Optional[str]]:
+    """action -> URL for one testbed."""
+    # per-action mapping (UPC style)
+    if "endpoints" in cfg:
+        return {a.lower(): url for a, url in cfg["endpoints"].items()}
+    # single-URL test-bed (UMU style), optionally restricted to allowed_actions
+    actions = cfg.get("allowed_actions") or list(action_spec)
+    return {a.lower(): cfg.get("base_url") for a in actions}
+
+
+def compile_index(testbed_cfg: Dict[str, Any], action_spec: Dict[str, Any],
+                  action_validators: Mapping[str, validators.FieldValidator]) -> PlanIndex:
+    plans = {}
+    allowed = {}
+    for testbed, cfg in testbed_cfg.items():
+        message_type = cfg["message_type"]
+        builder = BUILDER_REGISTRY[message_type]
+        headers = MappingProxyType(dict(cfg.get("headers", {})))
+        timeout = cfg.get("timeout", DEFAULT_TIMEOUT)
+        fanout_concurrency = int(cfg.get("fanout_concurrency", DEFAULT_FANOUT_CONCURRENCY))
+        actions = _testbed_actions(cfg, action_spec)
+        for action, url in actions.items():
+            plans[(testbed, action)] = ActionPlan(
+                testbed=testbed,
+                action=action,
+                message_type=message_type,
+                builder=builder,
+                url=None if message_type in PASSTHROUGH_TYPES else url,
+                headers=headers,
+                timeout=timeout,
+                validator=action_validators.get(action),
+                fanout=FANOUT_REGISTRY.get((message_type, action)),
+                fanout_concurrency=fanout_concurrency,
+            )
+        allowed[testbed] = tuple(actions)
+    return PlanIndex(plans=MappingProxyType(plans), allowed=MappingProxyType(allowed))
+
+
+def _compile_current() -> PlanIndex:
+    return compile_index(config_loader.TESTBED_CFG, config_loader._ACTION_SPEC, validators.VALIDATORS)
+
+
+_INDEX = _compile_current()
+
+
+@config_loader.on_reload
+def _recompile():
+    # Build the new index completely before swapping it in, so concurrent
+    # requests see either the old or the new config, never a mix.
+    global _INDEX
+    _INDEX = _compile_current()
+
+
+def lookup(testbed: str, action: str) -> ActionPlan:
+    index = _INDEX
+    plan = index.plans.get((testbed, action.lower()))
+    if plan is None:
+        if testbed not in index.allowed:
+            raise ValueError(f"Unknown test-bed '{testbed}'")
+        raise ValueError(
+            f"Action '{action}' not allowed on test-bed '{testbed}'. "
+            f"Allowed: {list(index.allowed[testbed])}"
+        )
+    return plan
@@ -0,0 +1,177 @@
+import contextlib
+import logging
+from collections import Counter
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from src import config_loader
+
+logger = logging.getLogger("uvicorn.error")
+
+# Used for any origin that has no `pool:` block under its testbed (remote
+# DOC instances), and for the one client shared by every other origin
+# (callback hosts supplied by RTR, ...).
+DEFAULT_POOL = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 30.0,
+    "http2": False,
+}
+# stats() key of the shared client
+SHARED = "shared"
+
+# One client per configured origin (testbeds, remote DOC instances)
+_clients: Dict[str, httpx.AsyncClient] = {}
+_shared: Optional[httpx.AsyncClient] = None
+# Clients replaced on config reload, closed once their last request is done
+_retired: List[httpx.AsyncClient] = []
+_in_use: Counter = Counter()
+_open = False
+_stale = False
+
+
+def _origin(url: str) -> str:
+    parts = urlsplit(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    return f"{parts.scheme}://{parts.hostname}:{port}"
+
+
+def _testbed_urls(cfg: Dict[str, Any]) -> list:
+    urls = list(cfg.get("endpoints", {}).values())
+    if cfg.get("base_url"):
+        urls.append(cfg["base_url"])
+    return urls
+
+
+def _pool_settings(origin: str) -> Dict[str, Any]:
+    """Merge DEFAULT_POOL with the `pool:` block of the testbed serving this origin."""
+    for cfg in config_loader.TESTBED_CFG.values():
+        if any(_origin(u) == origin for u in _testbed_urls(cfg)):
+            return {**DEFAULT_POOL, **cfg.get("pool", {})}
+    return dict(DEFAULT_POOL)
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def _make_client(origin: str) -> httpx.AsyncClient:
+    settings = _pool_settings(origin)
+    http2 = bool(settings["http2"])
+    if http2 and not _http2_available():
+        logger.warning("HTTP/2 requested for %s but 'h2' is not installed; using HTTP/1.1", origin)
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=settings["max_connections"],
+        max_keepalive_connections=settings["max_keepalive_connections"],
+        keepalive_expiry=settings["keepalive_expiry"],
+    )
+    return httpx.AsyncClient(limits=limits, http2=http2)
+
+
+def _configured_origins() -> List[str]:
+    urls = [u for cfg in config_loader.TESTBED_CFG.values() for u in _testbed_urls(cfg)]
+    urls += list(config_loader.DOMAIN_ROUTING.get("doc_instances", {}).values())
+    return sorted({_origin(u) for u in urls})
+
+
+async def open_pools():
+    """Create one pooled client per testbed host and remote DOC, plus the shared one. Called from the app lifespan."""
+    global _open, _clients, _shared, _stale
+    _clients = {origin: _make_client(origin) for origin in _configured_origins()}
+    _shared = _make_client(SHARED)
+    _open, _stale = True, False
+    logger.info("Opened HTTP connection pools for %s", sorted(_clients))
+
+
+async def close_pools():
+    global _open, _clients, _shared
+    _open = False
+    clients = [*_clients.values(), *_retired] + ([_shared] if _shared is not None else [])
+    _clients, _shared = {}, None
+    _retired.clear()
+    for client in clients:
+        await _close(client)
+
+
+async def _close(client: httpx.AsyncClient):
+    # One failing client must not keep the others open
+    try:
+        await client.aclose()
+    except Exception as e:
+        logger.error("Failed to close HTTP connection pool: %s", e)
+
+
+async def _rebuild():
+    """Swap in clients built from the reloaded config; the old ones are retired."""
+    global _clients, _stale
+    _stale = False
+    _retired.extend(_clients.values())
+    _clients = {origin: _make_client(origin) for origin in _configured_origins()}
+    logger.info("Rebuilt HTTP connection pools for %s", sorted(_clients))
+    for client in [c for c in _retired if not _in_use[c]]:
+        _retired.remove(client)
+        await _close(client)
+
+
+@config_loader.on_reload
+def _settings_changed():
+    # /reload_config runs off the event loop; client_for() rebuilds on it
+    global _stale
+    _stale = _open
+
+
+def stats() -> Dict[str, Dict[str, int]]:
+    """Connection usage of every open pool, per origin."""
+    usage = {}
+    clients = {**_clients, SHARED: _shared} if _shared is not None else _clients
+    for origin, client in clients.items():
+        # httpx exposes no public pool accessors; read httpcore's
+        connection_pool = getattr(client._transport, "_pool", None)
+        if connection_pool is None:
+            continue
+        connections = connection_pool.connections
+        idle = sum(1 for c in connections if c.is_idle())
+        usage[origin] = {
+            "active": len(connections) - idle,
+            "idle": idle,
+            "requests": len(connection_pool._requests),
+            "max_connections": connection_pool._max_connections,
+        }
+    return usage
+
+
+@contextlib.asynccontextmanager
+async def client_for(url: str):
+    """
+    Yield the pooled client for the host serving `url`: its own for a
+    configured origin, the shared one for any other.
+
+    Outside the app lifespan (scripts, bare TestClient) there is no pool to
+    borrow from, so a throwaway client is used instead.
+    """
+    if not _open:
+        async with httpx.AsyncClient() as client:
+            yield client
+        return
+
+    if _stale:
+        await _rebuild()
+    client = _clients.get(_origin(url)) or _shared
+    _in_use[client] += 1
+    try:
+        yield client
+    finally:
+        _in_use[client] -= 1
+        if not _in_use[client]:
+            del _in_use[client]
+            if client in _retired:
+                _retired.remove(client)
+                await _close(client)
@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from src import config_loader
+
+DEFAULT_LANE = "normal"
+
+
+@dataclass(frozen=True)
+class Lane:
+    """A priority lane; rank 0 is served first."""
+    name: str
+    rank: int
+
+
+@dataclass(frozen=True)
+class LaneIndex:
+    """
+    The `priority` config compiled for classification: command, threat and
+    action name (lower-cased) to the best-ranked lane listing them.
+    """
+    lanes: Tuple[Lane, ...]
+    default: Lane
+    aging: float
+    commands: Mapping[str, Lane]
+    threats: Mapping[str, Lane]
+    actions: Mapping[str, Lane]
+
+    def classify(self, command: Optional[str], threat: Optional[str], action: Optional[str]) -> Lane:
+        """The highest-priority lane any of the three values is listed under, else the default lane."""
+        best = self.default
+        for table, value in ((self.commands, command), (self.threats, threat), (self.actions, action)):
+            lane = table.get(str(value).lower()) if value else None
+            if lane is not None and lane.rank < best.rank:
+                best = lane
+        return best
+
+    def deadline(self, lane: Lane, enqueued_at: float) -> float:
+        """
+        Service order of a waiter: earlier first. Each rank adds `aging`
+        seconds, so a lower lane waiting that much longer than a higher one
+        goes ahead of it and no lane starves.
+        """
+        return enqueued_at + lane.rank * self.aging
+
+
+def compile_index(cfg: Dict[str, Any]) -> LaneIndex:
+    lane_specs = cfg.get("lanes") or [{"name": DEFAULT_LANE}]
+    lanes = tuple(Lane(str(spec["name"]), rank) for rank, spec in enumerate(lane_specs))
+    by_name = {lane.name: lane for lane in lanes}
+
+    default_name = cfg.get("default_lane", DEFAULT_LANE)
+    if default_name not in by_name:
+        raise ValueError(f"priority.default_lane '{default_name}' is not one of the lanes {list(by_name)}")
+
+    tables: Dict[str, Dict[str, Lane]] = {"commands": {}, "threats": {}, "actions": {}}
+    for lane, spec in zip(lanes, lane_specs):
+        for key, table in tables.items():
+            for value in spec.get(key) or ():
+                # Lanes are listed best first: keep the first lane naming a value
+                table.setdefault(str(value).lower(), lane)
+
+    return LaneIndex(
+        lanes=lanes,
+        default=by_name[default_name],
+        aging=float(cfg.get("aging", 2)),
+        **{key: MappingProxyType(table) for key, table in tables.items()},
+    )
+
+
+def _compile_current() -> LaneIndex:
+    return compile_index(config_loader.PRIORITY_CFG)
+
+
+_INDEX = _compile_current()
+
+
+@config_loader.on_reload
+def _recompile():
+    global _INDEX
+    _INDEX = _compile_current()
+
+
+def index() -> LaneIndex:
+    return _INDEX
+
+
+def lane_for(req) -> Lane:
+    """Lane of a MitigationActionRequest, from its command, threat and action name."""
+    return _INDEX.classify(getattr(req, "command", None), getattr(req, "threat", None), req.action.name)
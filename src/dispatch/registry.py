@@ -1,9 +1,18 @@
-from src.dispatch.builders.umu_xml import build_umu_xml
+from src.dispatch import memo
+from src.dispatch.builders.umu_xml import build_umu_xml, build_umu_policies
 from src.dispatch.builders.upc_json import build_upc_json
 from src.dispatch.builders.cnit_passthrough import build_cnit_passthrough
 
 BUILDER_REGISTRY = {
-    "umu_xml": build_umu_xml,
+    # Renders a template per request: identical actions reuse the payload
+    "umu_xml": memo.payloads.memoize("umu_xml", build_umu_xml),
+    # Splices the request's already encoded fields: nothing to save
     "upc_json": build_upc_json,
     "cnit_passthrough": build_cnit_passthrough,
 }
+
+# (message_type, action) -> builder of one (target, body) pair per blocked
+# target (plus headers), used when a request blocks more than one target
+FANOUT_REGISTRY = {
+    ("umu_xml", "block_pod_address"): build_umu_policies,
+}
@@ -0,0 +1,47 @@
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict
+
+
+def request_key(url: str, body: bytes, method: str = "POST") -> str:
+    """Identity of an upstream call: HTTP method and target URL plus the exact payload bytes."""
+    return hashlib.sha256(method.encode() + b" " + url.encode() + b"\0" + body).hexdigest()
+
+
+class SingleFlight:
+    """
+    Collapses concurrent identical calls into one.
+
+    The first caller for a key starts the call as a task; callers arriving
+    while it is in flight await the same task and get the same result (or
+    exception). A caller that gets cancelled (e.g. a fan-out deadline) does
+    not cancel the call for the others.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._counters = dict.fromkeys(("calls", "coalesced"), 0)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None or task.done():
+            self._counters["calls"] += 1
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        else:
+            self._counters["coalesced"] += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Every caller may have been cancelled; mark the outcome as retrieved
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "in_flight": len(self._calls)}
+
+
+inflight = SingleFlight()
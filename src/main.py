@@ -1,29 +1,66 @@
 import sys
 import time
+import asyncio
 import uvicorn
 import logging
 
-from uuid import uuid4
-from fastapi import FastAPI, Request
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+from fastapi import Body, FastAPI, Query, Request
 from fastapi.exceptions import RequestValidationError, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import ValidationError
 from pymongo.errors import WriteError
 
-from src.config_loader import reload_yaml, DOMAIN_ROUTING
+from src import config_loader
+from src.config_loader import reload_yaml, TestBedEnum
 from src.model.MitigationActionRequest import MitigationActionRequest
 from src.model.MitigationActionResponse import MitigationActionResponse
-from src.dispatch.http import dispatch, DispatchError
-from src.utils import mongo
-from src.utils.callback import send_status_update
+from src.model.BatchMitigationResponse import BatchMitigationResponse
+from src.model.JobStatus import JobStatus
+from src.model.envelope import RequestEnvelope
+from src.dispatch import admission, blocks, memo, pool, singleflight
+from src.dispatch.breaker import breakers
+from src.dispatch.http import dispatch, check_circuit, AdmissionRejected, CircuitOpenError, DispatchError
+from src.services.active import active
+from src.services.idempotency import idempotency
+from src.services.jobs import jobs, JobQueueFull
+from src.utils import codec, logs, metrics, mongo
+from src.utils.callback import delivery
 from bson import json_util
 import httpx
 
 logger = logging.getLogger("uvicorn.error")
+# Once-per-request lines, so LOG_SAMPLING can thin them out on their own
+request_log = logging.getLogger("uvicorn.error.request")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    logs.pipeline.start()
+    # Keep-alive connection pools to the testbeds live for the whole process
+    await pool.open_pools()
+    await mongo.start()
+    await delivery.start()
+    await jobs.start(execute_mitigation)
+    await active.start(execute_mitigation)
+    yield
+    await active.stop()
+    await jobs.stop()
+    await delivery.stop()
+    await mongo.drain()
+    await pool.close_pools()
+    logs.pipeline.stop()
+
+
 app = FastAPI(
     title="DOC API",
     description="Domain-Orchestrator-Connector API for 5G/6G Security Testbeds",
     version="1.0.0",
-    swagger_ui_parameters={"useLocalAssets": True}
+    swagger_ui_parameters={"useLocalAssets": True},
+    lifespan=lifespan,
+    default_response_class=codec.CodecResponse,
 )
 
 start_time = time.time()
@@ -32,45 +69,156 @@ start_time = time.time()
 @app.middleware("http")
 async def log_requests(request: Request, call_next):
     """Log all incoming requests to /api/mitigate for debugging"""
-    if request.url.path == "/api/mitigate" and request.method == "POST":
+    if (request.url.path == "/api/mitigate" and request.method == "POST"
+            and request_log.isEnabledFor(logging.INFO)):
         try:
             body = await request.body()
-            logger.info("=" * 80)
-            logger.info("RAW REQUEST received at /api/mitigate:")
-            logger.info(f"Body: {body.decode('utf-8')}")
-            logger.info("=" * 80)
+            request_log.info("RAW REQUEST received at /api/mitigate: %s", logs.Lazy(body.decode, "utf-8", "replace"))
             # Re-populate request body for downstream processing
             async def receive():
                 return {"type": "http.request", "body": body}
             request._receive = receive
         except Exception as e:
-            logger.error(f"Failed to log request body: {e}")
+            logger.error("Failed to log request body: %s", e)
     
     response = await call_next(request)
     return response
 
 
-async def forward_to_doc(target_domain: str, payload: dict) -> dict:
+async def forward_to_doc(target_domain: str, body: bytes) -> dict:
     """
-    Forward mitigation request to another DOC instance in a different domain.
+    Forward mitigation request (already JSON-encoded) to another DOC instance in a different domain.
     """
-    doc_url = DOMAIN_ROUTING.get("doc_instances", {}).get(target_domain.lower())
+    doc_url = config_loader.DOMAIN_ROUTING.get("doc_instances", {}).get(target_domain.lower())
     if not doc_url:
         raise ValueError(f"No DOC instance configured for domain '{target_domain}'")
     
     endpoint = f"{doc_url}/api/mitigate"
-    logger.info(f"Forwarding request to DOC in '{target_domain}' at {endpoint}")
+    logger.info("Forwarding request to DOC in '%s' at %s", target_domain, endpoint)
     
+    breaker = check_circuit(endpoint)
+    started = time.perf_counter() if metrics.ENABLED else 0.0
+    outcome = "error"
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.post(endpoint, json=payload, timeout=30)
-        
+        with breaker.track() as call:
+            async with pool.client_for(endpoint) as client:
+                resp = await client.post(
+                    endpoint, content=body, headers={"Content-Type": "application/json"}, timeout=30
+                )
+            call.failed = resp.status_code >= 500
+        outcome = f"{resp.status_code // 100}xx"
+
         if not resp.is_success:
             raise DispatchError(f"DOC at {endpoint} responded {resp.status_code}: {resp.text}")
         
-        return resp.json()
+        return codec.loads(resp.content)
     except httpx.RequestError as e:
         raise DispatchError(f"Failed to forward to DOC at {endpoint}: {str(e)}")
+    finally:
+        if metrics.ENABLED:
+            metrics.FORWARD_LATENCY.observe(time.perf_counter() - started, target_domain.lower(), outcome)
+
+
+async def execute_domain(req: MitigationActionRequest, domain: str, current_domain: str) -> dict:
+    """
+    Enforce (or forward) one domain of a multi-domain request.
+    Returns that domain's entry for the aggregated `upstream` dict.
+    """
+    domain_lower = domain.lower()
+    # Read at call time: /reload_config replaces the testbed config
+    testbeds = config_loader.TESTBED_CFG
+
+    # Check if domain is valid (exists in config)
+    if domain_lower not in testbeds:
+        logger.warning("Skipping invalid domain: %s", domain)
+        return {"status": "skipped", "reason": "Invalid domain"}
+
+    # Check if this domain should be forwarded to another DOC instance
+    if current_domain and domain_lower != current_domain:
+        logger.info("Forwarding domain '%s' to remote DOC instance", domain)
+        try:
+            # Same payload, but with this single target_domain for the remote DOC
+            forward_body = RequestEnvelope.of(req).json_for_domain(domain)
+
+            forwarded_response = await forward_to_doc(domain_lower, forward_body)
+            return {"status": "forwarded", "response": forwarded_response}
+        except CircuitOpenError as e:
+            return circuit_open_entry(e)
+        except DispatchError as e:
+            logger.error("Failed to forward to DOC in %s: %s", domain, e)
+            return {"status": "error", "reason": f"Forwarding failed: {str(e)}"}
+        except Exception as e:
+            logger.error("Unexpected error forwarding to %s: %s", domain, e)
+            return {"status": "error", "reason": str(e)}
+
+    # Shallow copy for this specific domain; it shares the request envelope
+    domain_req = req.model_copy(update={
+        "testbed": TestBedEnum[domain_lower.upper()],
+        "message_type": testbeds[domain_lower]["message_type"],
+    })
+
+    # Attempt dispatch to this domain
+    try:
+        upstream_reply, status_code, success = await dispatch(domain_req)
+        return {
+            "status": "success" if success else fan_out_status(upstream_reply),
+            "response": upstream_reply,
+            "http_status": status_code
+        }
+    except CircuitOpenError as e:
+        return circuit_open_entry(e)
+    except AdmissionRejected as e:
+        return admission_rejected_entry(e)
+    except DispatchError as e:
+        logger.error("Failed to dispatch to %s: %s", domain, e)
+        return {"status": "error", "reason": str(e)}
+    except Exception as e:
+        logger.error("Unexpected error dispatching to %s: %s", domain, e)
+        return {"status": "error", "reason": str(e)}
+
+
+def fan_out_status(upstream_reply) -> str:
+    """Status of a failed dispatch: partial_success for a fan-out some targets of which succeeded, else error."""
+    if isinstance(upstream_reply, dict) and "targets" in upstream_reply:
+        return "partial_success" if upstream_reply.get("status") == "partial_success" else "error"
+    return "error"
+
+
+def upstream_error(e: DispatchError) -> HTTPException:
+    """
+    502 for a failed upstream call; 503 with Retry-After while its circuit is
+    open, and the admission reject_status with Retry-After when its queue is full.
+    """
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    if isinstance(e, AdmissionRejected):
+        return HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(max(1, round(e.retry_after)))})
+    return HTTPException(status_code=502, detail=str(e))
+
+
+def circuit_open_entry(e: CircuitOpenError) -> dict:
+    logger.warning(str(e))
+    return {"status": "error", "reason": "circuit open", "retry_after": round(e.retry_after)}
+
+
+def admission_rejected_entry(e: AdmissionRejected) -> dict:
+    logger.warning(str(e))
+    return {"status": "error", "reason": f"admission rejected: {e.reason}", "retry_after": round(e.retry_after)}
+
+
+def validation_message(err: dict, action) -> str:
+    """Turn the first pydantic error of a request into the message returned to RTR."""
+    loc = err['loc']
+    msg = err['msg']
+
+    if err["type"] == "value_error.missing" and len(loc) >= 3:
+        missing_key = loc[-1]
+        if action:
+            return f"Missing field {missing_key} for action {action}"
+        return f"Missing field '{missing_key}'."
+    if err["type"].startswith("value_error") and msg.lower().startswith("value error,"):
+        return msg.split(",", 1)[1].strip()
+    return msg
 
 
 @app.exception_handler(RequestValidationError)
@@ -79,31 +227,18 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         payload = await request.json()
     except Exception:
         payload = {}
+    if not isinstance(payload, dict):
+        payload = {}
 
     # Log the full incoming payload and validation errors for debugging
     logger.error("=" * 80)
     logger.error("VALIDATION ERROR - Incoming RTR message:")
-    logger.error(f"Raw payload: {json_util.dumps(payload, indent=2)}")
-    logger.error(f"Validation errors: {exc.errors()}")
+    logger.error("Raw payload: %s", json_util.dumps(payload, indent=2))
+    logger.error("Validation errors: %s", exc.errors())
     logger.error("=" * 80)
 
     intent_id = payload.get('intent_id', 'unknown')
-    action = payload.get("action")
-
-    err = exc.errors()[0]
-    loc = err['loc']
-    msg = err['msg']
-
-    if err["type"] == "value_error.missing" and len(loc) >= 3:
-        missing_key = loc[-1]
-        if action:
-            final_msg = f"Missing field {missing_key} for action {action}"
-        else:
-            final_msg = f"Missing field '{missing_key}'."
-    elif err["type"].startswith("value_error") and msg.lower().startswith("value error,"):
-        final_msg = msg.split(",", 1)[1].strip()
-    else:
-        final_msg = msg
+    final_msg = validation_message(exc.errors()[0], payload.get("action"))
 
     body = {
         "status": "error",
@@ -111,12 +246,17 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         "message": final_msg,
     }
 
-    return JSONResponse(status_code=422, content=body)
+    return codec.CodecResponse(status_code=422, content=body)
 
 
 @app.get("/reload_config")
-def reload_config():
-    reload_yaml()
+async def reload_config():
+    # On the event loop, like the state the hooks rebuild (memo, admission, breakers)
+    failures = reload_yaml()
+    if failures:
+        raise HTTPException(status_code=500, detail={"error": "Config reloaded, but some hooks failed",
+                                                     "failed_hooks": failures})
+    return {"status": "reloaded"}
 
 
 @app.get("/ping")
@@ -124,99 +264,203 @@ def ping():
     return {"status": "ok"}
 
 
-@app.post("/api/mitigate", response_model=MitigationActionResponse)
-async def mitigate(req: MitigationActionRequest, request: Request):
+@app.get("/stats")
+def stats():
+    """Runtime counters of the background machinery (queues, caches, ...)."""
+    return {
+        "callbacks": delivery.stats(),
+        "jobs": jobs.stats(),
+        "idempotency": idempotency.stats(),
+        "singleflight": singleflight.inflight.stats(),
+        "breakers": breakers.stats(),
+        "pools": pool.stats(),
+        "admission": admission.control.stats(),
+        "active": active.stats(),
+        "blocks": blocks.index.stats(),
+        "builder_cache": memo.payloads.stats(),
+        "logging": logs.pipeline.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Counters and latency histograms in the Prometheus text format."""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled (METRICS_ENABLED=false)")
+    for origin, usage in pool.stats().items():
+        metrics.POOL_CONNECTIONS.set(usage["active"], origin, "active")
+        metrics.POOL_CONNECTIONS.set(usage["idle"], origin, "idle")
+        metrics.POOL_REQUESTS.set(usage["requests"], origin)
+    for scope, usage in admission.control.stats().items():
+        metrics.ADMISSION_SLOTS.set(usage["active"], scope)
+        for lane, waiting in usage["waiting"].items():
+            metrics.ADMISSION_QUEUED.set(waiting, scope, lane)
+    for lane, waiting in jobs.stats()["lanes"].items():
+        metrics.JOBS_QUEUED.set(waiting, lane)
+    metrics.BUILDER_CACHE_BYTES.set(memo.payloads.stats()["bytes"])
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.post(
+    "/api/mitigate",
+    response_model=MitigationActionResponse,
+    responses={202: {"model": JobStatus, "description": "Accepted for background enforcement (mode=async)"}},
+)
+async def mitigate(
+    req: MitigationActionRequest,
+    mode: str | None = Query(default=None, description="'async' to enqueue the intent and answer 202 right away"),
+):
+    if not metrics.ENABLED:
+        return await handle_mitigate(req, mode)
+
+    metrics.REQUESTS_IN_FLIGHT.inc()
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        response = await handle_mitigate(req, mode)
+        outcome = "accepted" if isinstance(response, JSONResponse) else response.status
+        return response
+    finally:
+        metrics.REQUESTS_IN_FLIGHT.dec()
+        metrics.REQUEST_LATENCY.observe(time.perf_counter() - started, testbed_label(req), req.action.name.lower(), outcome)
+
+
+def testbed_label(req: MitigationActionRequest) -> str:
+    if req.testbed:
+        return req.testbed.value
+    return "multi-domain" if isinstance(req.target_domain, list) else str(req.target_domain)
+
+
+async def handle_mitigate(req: MitigationActionRequest, mode: str | None):
     # Log incoming RTR message
-    logger.info("=" * 80)
-    logger.info("Received mitigation request from RTR:")
-    logger.info(f"Intent ID: {req.intent_id}")
-    logger.info(f"Command: {req.command} | Type: {req.intent_type}")
-    logger.info(f"Target Domain: {req.target_domain}")
-    logger.info(f"Action: {req.action.name}")
-    logger.info(f"Action Fields: {req.action.fields}")
-    logger.info("=" * 80)
+    request_log.info(
+        "Received mitigation request from RTR: intent_id=%s command=%s type=%s target_domain=%s action=%s fields=%s",
+        req.intent_id, req.command, req.intent_type, req.target_domain, req.action.name, req.action.fields,
+        extra={"intent_id": req.intent_id},
+    )
     
     # Log callback_url if provided by RTR
     if req.callback_url:
-        logger.info(f"Callback URL provided by RTR: {req.callback_url}")
+        request_log.info("Callback URL provided by RTR: %s", req.callback_url, extra={"intent_id": req.intent_id})
     else:
-        logger.info("No callback URL provided - status updates will be skipped")
-    
+        request_log.info("No callback URL provided - status updates will be skipped", extra={"intent_id": req.intent_id})
+
+    # A replay of an already completed intent (RTR retrying) gets the stored result
+    replay = idempotency.recent(req.intent_id)
+    if replay is not None:
+        logger.info("Intent %s already completed; returning stored result", req.intent_id)
+        return replay
+    pending = jobs.pending(req.intent_id)
+    if pending is not None:
+        logger.info("Intent %s is already %s; returning its job state", req.intent_id, pending.status)
+        return job_accepted(pending)
+
+    # Copies of one intent arriving together share a single persist and enforcement
+    return await idempotency.once(req.intent_id, lambda: admit_mitigation(req, mode))
+
+
+async def admit_mitigation(req: MitigationActionRequest, mode: str | None):
+    """Persist a new intent, then enforce it (or queue it as a job in async mode)."""
     # Persist for auditing
     try:
-        record = req.model_dump()
-        record["_id"] = str(uuid4())
-        raw_doc = req.model_dump()
-        raw_doc["action"] = json_util.dumps(raw_doc["action"])
-        mongo.insert_raw(record)
+        await mongo.persist(RequestEnvelope.of(req).audit_record())
     except WriteError as we:
+        if we.code == mongo.DUPLICATE_KEY:
+            # Not a new intent_id: it may have completed before this process remembered it
+            replay = await idempotency.stored(req.intent_id)
+            if replay is not None:
+                logger.info("Intent %s already completed; returning stored result", req.intent_id)
+                return replay
         logger.error(we.details)
 
+    run_async = mode == "async" if mode else config_loader.JOBS_CFG.get("async_by_default", False)
+    if run_async and jobs.running:
+        try:
+            state = await jobs.submit(req)
+        except JobQueueFull as e:
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+        return job_accepted(state)
+    if run_async:
+        logger.warning("Async mode requested but job workers are not running; processing synchronously")
+
+    return await execute_mitigation(req)
+
+
+def job_accepted(state: JobStatus) -> codec.CodecResponse:
+    return codec.CodecResponse(
+        status_code=202,
+        content=jsonable_encoder(state),
+        headers={"Location": f"/api/mitigate/{state.intent_id}"},
+    )
+
+
+@app.get("/api/mitigate/{intent_id}", response_model=JobStatus)
+async def mitigation_status(intent_id: str):
+    """State of an intent submitted in async mode (falls back to its audit record)."""
+    state = await jobs.lookup(intent_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail=f"Unknown intent_id '{intent_id}'")
+    return state
+
+
+async def execute_mitigation(req: MitigationActionRequest) -> MitigationActionResponse:
+    """
+    Enforce an already persisted request, remember the response for replays
+    and update the index of active rules.
+    """
+    response = await enforce_mitigation(req)
+    await idempotency.remember(response)
+    active.record(req, response)
+    return response
+
+
+async def enforce_mitigation(req: MitigationActionRequest) -> MitigationActionResponse:
+    """
+    Enforce, forward or fan out a request and notify RTR.
+    Single-domain failures are raised as HTTPException (502/500); a target
+    fan-out that only partly failed is a partial_success.
+    """
+    # Read at call time: /reload_config replaces the domain routing
+    routing = config_loader.DOMAIN_ROUTING
+
     # Handle multi-domain execution
     if isinstance(req.target_domain, list):
-        from src.config_loader import TESTBED_CFG, TestBedEnum
+        current_domain = routing.get("current_domain", "").lower()
+        fanout = routing.get("fanout", {})
+        domain_timeout = fanout.get("domain_timeout", 30)
+        overall_timeout = fanout.get("overall_timeout", 45)
+
+        # Every domain runs concurrently under its own deadline; the overall
+        # deadline caps the whole fan-out so one slow upstream can't hold the rest.
+        tasks = {
+            domain: asyncio.create_task(
+                asyncio.wait_for(execute_domain(req, domain, current_domain), domain_timeout)
+            )
+            for domain in req.target_domain
+        }
+        _, pending = await asyncio.wait(tasks.values(), timeout=overall_timeout)
+        for task in pending:
+            task.cancel()
+
         results = {}
-        failed_domains = []
-        current_domain = DOMAIN_ROUTING.get("current_domain", "").lower()
-        
-        for domain in req.target_domain:
-            domain_lower = domain.lower()
-            
-            # Check if domain is valid (exists in config)
-            if domain_lower not in TESTBED_CFG:
-                logger.warning(f"Skipping invalid domain: {domain}")
-                results[domain] = {"status": "skipped", "reason": "Invalid domain"}
-                continue
-            
-            # Check if this domain should be forwarded to another DOC instance
-            if current_domain and domain_lower != current_domain:
-                logger.info(f"Forwarding domain '{domain}' to remote DOC instance")
-                try:
-                    # Create payload for forwarding with single target_domain
-                    forward_payload = req.model_dump()
-                    forward_payload["target_domain"] = domain  # Single domain for remote DOC
-                    
-                    forwarded_response = await forward_to_doc(domain_lower, forward_payload)
-                    results[domain] = {"status": "forwarded", "response": forwarded_response}
-                except DispatchError as e:
-                    logger.error(f"Failed to forward to DOC in {domain}: {e}")
-                    results[domain] = {"status": "error", "reason": f"Forwarding failed: {str(e)}"}
-                    failed_domains.append(domain)
-                except Exception as e:
-                    logger.error(f"Unexpected error forwarding to {domain}: {e}")
-                    results[domain] = {"status": "error", "reason": str(e)}
-                    failed_domains.append(domain)
-                continue
-            
-            # Create a copy of the request for this specific domain
-            domain_req = req.model_copy()
-            # Convert string to TestBedEnum
-            domain_req.testbed = TestBedEnum[domain_lower.upper()]
-            domain_req.message_type = TESTBED_CFG[domain_lower]["message_type"]
-            
-            # Attempt dispatch to this domain
-            try:
-                upstream_reply, status_code, success = await dispatch(domain_req)
-                results[domain] = {
-                    "status": "success" if success else "error",
-                    "response": upstream_reply,
-                    "http_status": status_code
-                }
-                if not success:
-                    failed_domains.append(domain)
-            except DispatchError as e:
-                logger.error(f"Failed to dispatch to {domain}: {e}")
-                results[domain] = {"status": "error", "reason": str(e)}
-                failed_domains.append(domain)
-            except Exception as e:
-                logger.error(f"Unexpected error dispatching to {domain}: {e}")
-                results[domain] = {"status": "error", "reason": str(e)}
-                failed_domains.append(domain)
-        
+        for domain, task in tasks.items():
+            if task in pending:
+                logger.error("Overall deadline of %ss exceeded before %s answered", overall_timeout, domain)
+                results[domain] = {"status": "error", "reason": f"Overall deadline of {overall_timeout}s exceeded"}
+            elif isinstance(task.exception(), asyncio.TimeoutError):
+                logger.error("Domain %s did not answer within %ss", domain, domain_timeout)
+                results[domain] = {"status": "error", "reason": f"Timed out after {domain_timeout}s"}
+            else:
+                results[domain] = task.result()
+        failed_domains = [d for d, r in results.items() if r["status"] == "error"]
+        partial_domains = [d for d, r in results.items() if r["status"] == "partial_success"]
+
         # Return aggregated response
         overall_status = "partial_success" if failed_domains and len(failed_domains) < len(req.target_domain) else (
             "success" if not failed_domains else "error"
         )
+        if partial_domains and overall_status == "success":
+            overall_status = "partial_success"
         
         # Send callback to RTR if callback_url is provided
         if req.callback_url:
@@ -230,6 +474,8 @@ async def mitigate(req: MitigationActionRequest, request: Request):
                     info_parts.append(f"✓ Action enforced in {domain.upper()} testbed")
                 elif result["status"] == "forwarded":
                     info_parts.append(f"→ Action forwarded to {domain.upper()} domain")
+                elif result["status"] == "partial_success":
+                    info_parts.append(f"~ Action partially enforced in {domain.upper()} testbed: {result['response']['error']}")
                 else:
                     reason = result.get("reason", "Unknown error")
                     info_parts.append(f"✗ Action failed in {domain.upper()} testbed: {reason}")
@@ -239,7 +485,7 @@ async def mitigate(req: MitigationActionRequest, request: Request):
             )
             callback_info = " | ".join(info_parts)
             
-            await send_status_update(
+            await delivery.submit(
                 callback_url=req.callback_url,
                 intent_id=req.intent_id,
                 status=callback_status,
@@ -255,15 +501,14 @@ async def mitigate(req: MitigationActionRequest, request: Request):
         )
 
     # Single domain execution (original behavior)
-    current_domain = DOMAIN_ROUTING.get("current_domain", "").lower()
+    current_domain = routing.get("current_domain", "").lower()
     target_domain = req.target_domain.lower() if isinstance(req.target_domain, str) else ""
     
     # Check if we need to forward to another DOC instance
     if current_domain and target_domain and target_domain != current_domain:
-        logger.info(f"Forwarding single-domain request to DOC in '{target_domain}'")
+        logger.info("Forwarding single-domain request to DOC in '%s'", target_domain)
         try:
-            forward_payload = req.model_dump()
-            forwarded_response = await forward_to_doc(target_domain, forward_payload)
+            forwarded_response = await forward_to_doc(target_domain, RequestEnvelope.of(req).json)
             
             return MitigationActionResponse(
                 status="success",
@@ -273,15 +518,16 @@ async def mitigate(req: MitigationActionRequest, request: Request):
                 upstream={"forwarded": forwarded_response},
             )
         except DispatchError as e:
-            logger.error(f"Failed to forward to DOC in {target_domain}: {e}")
-            raise HTTPException(status_code=502, detail=str(e))
+            logger.error("Failed to forward to DOC in %s: %s", target_domain, e)
+            raise upstream_error(e)
         except Exception as e:
-            logger.error(f"Unexpected error forwarding to {target_domain}: {e}")
+            logger.error("Unexpected error forwarding to %s: %s", target_domain, e)
             raise HTTPException(status_code=500, detail=str(e))
     
     # Dispatch locally to the testbed in this domain
     try:
         upstream_reply, status_code, success = await dispatch(req)
+        status = "success" if success else fan_out_status(upstream_reply)
         
         # Send callback to RTR if callback_url is provided
         if req.callback_url:
@@ -289,44 +535,63 @@ async def mitigate(req: MitigationActionRequest, request: Request):
             if success:
                 callback_status = "completed"
                 callback_info = f"Action successfully enforced in {testbed_name} testbed"
+            elif status == "partial_success":
+                callback_status = "partial"
+                callback_info = f"Action partially enforced in {testbed_name} testbed: {upstream_reply['error']}"
             else:
                 callback_status = "failed"
                 error_msg = upstream_reply.get("error", upstream_reply.get("raw", "Unknown error"))
                 callback_info = f"Action failed in {testbed_name} testbed: {error_msg}"
             
-            await send_status_update(
+            await delivery.submit(
                 callback_url=req.callback_url,
                 intent_id=req.intent_id,
                 status=callback_status,
                 info=callback_info
             )
         
+        # A fan-out some targets of which succeeded is answered with the per-target breakdown
+        if status == "partial_success":
+            return MitigationActionResponse(
+                status=status,
+                testbed=req.testbed.value,
+                intent_id=req.intent_id,
+                message=upstream_reply["error"],
+                upstream=upstream_reply,
+            )
+
         # If dispatch was not successful, raise exception for proper error response
         if not success:
             error_detail = upstream_reply.get("error", upstream_reply.get("raw", f"Testbed responded with HTTP {status_code}"))
+            if "targets" in upstream_reply:
+                # Keep the per-target outcomes of a failed fan-out
+                error_detail = {"error": error_detail, "targets": upstream_reply["targets"]}
             raise HTTPException(status_code=502, detail=error_detail)
             
+    except HTTPException:
+        # The testbed's own failure, already reported to RTR above
+        raise
     except DispatchError as e:
         logger.error(e)
         
         # Send failure callback to RTR if callback_url is provided
         if req.callback_url:
             testbed_name = req.testbed.value.upper() if req.testbed else "unknown"
-            await send_status_update(
+            await delivery.submit(
                 callback_url=req.callback_url,
                 intent_id=req.intent_id,
                 status="failed",
                 info=f"Action failed in {testbed_name} testbed: {str(e)}"
             )
         
-        raise HTTPException(status_code=502, detail=str(e))
+        raise upstream_error(e)
     except Exception as e:
         logger.error(e)
         
         # Send failure callback to RTR if callback_url is provided
         if req.callback_url:
             testbed_name = req.testbed.value.upper() if req.testbed else "unknown"
-            await send_status_update(
+            await delivery.submit(
                 callback_url=req.callback_url,
                 intent_id=req.intent_id,
                 status="failed",
@@ -342,7 +607,135 @@ async def mitigate(req: MitigationActionRequest, request: Request):
         message="Action forwarded for processing.",
         upstream=upstream_reply,
     )
-#
+
+
+def batch_job_entry(req: MitigationActionRequest) -> MitigationActionResponse:
+    return MitigationActionResponse(
+        status="pending",
+        testbed=req.testbed.value if req.testbed else "multi-domain",
+        intent_id=req.intent_id,
+        message=f"Already accepted as an async job; see /api/mitigate/{req.intent_id}",
+    )
+
+
+async def admit_persisted(accepted: list, errors: List[dict], results: list) -> list:
+    """
+    Settle the intents whose audit insert was rejected, as /api/mitigate
+    does: a known intent_id with a stored result gets it back, one without
+    is enforced again. Any other rejection is reported in its result entry.
+    Returns the intents still to enforce.
+    """
+    rejected = {err["intent_id"]: err for err in errors}
+    known = [(i, req) for i, req in accepted if rejected.get(req.intent_id, {}).get("code") == mongo.DUPLICATE_KEY]
+    replays = dict(zip((i for i, _ in known), await asyncio.gather(*(idempotency.stored(req.intent_id) for _, req in known))))
+
+    admitted = []
+    for i, req in accepted:
+        err = rejected.get(req.intent_id)
+        if err is None or (err["code"] == mongo.DUPLICATE_KEY and replays[i] is None):
+            admitted.append((i, req))
+        elif err["code"] == mongo.DUPLICATE_KEY:
+            results[i] = replays[i]
+        else:
+            logger.error("Audit record for intent_id %s rejected (%s): %s", req.intent_id, err["code"], err["message"])
+            results[i] = MitigationActionResponse(
+                status="error",
+                testbed=req.testbed.value if req.testbed else "multi-domain",
+                intent_id=req.intent_id,
+                message=f"Audit record rejected ({err['code']}): {err['message']}",
+            )
+    return admitted
+
+
+@app.post("/api/mitigate/batch", response_model=BatchMitigationResponse)
+async def mitigate_batch(
+    items: List[Dict[str, Any]] = Body(..., description="Array of MitigationActionRequest objects"),
+):
+    """
+    Bulk variant of /api/mitigate. Every intent is validated on its own, the
+    valid ones are persisted with one bulk write and dispatched concurrently.
+    Results are returned in request order; repeats of an intent_id within
+    the batch get the result of its first copy.
+    """
+    max_items = config_loader.BATCH_CFG.get("max_items", 500)
+    if len(items) > max_items:
+        raise HTTPException(status_code=413, detail=f"Batch of {len(items)} exceeds the limit of {max_items} intents")
+
+    logger.info("Received batch of %s mitigation request(s) from RTR", len(items))
+
+    results: List[MitigationActionResponse | None] = [None] * len(items)
+    accepted = []
+    for i, item in enumerate(items):
+        try:
+            accepted.append((i, MitigationActionRequest.model_validate(item)))
+        except ValidationError as e:
+            results[i] = MitigationActionResponse(
+                status="error",
+                testbed=str(item.get("testbed") or item.get("target_domain") or "unknown"),
+                intent_id=str(item.get("intent_id") or "unknown"),
+                message=validation_message(e.errors()[0], item.get("action")),
+            )
+
+    # Copies of one intent_id in the batch are admitted once and share its result
+    firsts: Dict[str, int] = {}
+    copies: Dict[int, int] = {}
+    unique = []
+    for i, req in accepted:
+        if req.intent_id in firsts:
+            copies[i] = firsts[req.intent_id]
+        else:
+            firsts[req.intent_id] = i
+            unique.append((i, req))
+    accepted = unique
+
+    # Replays of completed intents are answered from the idempotency cache,
+    # intents still queued as async jobs with their job state
+    fresh = []
+    for i, req in accepted:
+        replay = idempotency.recent(req.intent_id)
+        if replay is None and jobs.pending(req.intent_id) is not None:
+            replay = batch_job_entry(req)
+        if replay is not None:
+            results[i] = replay
+        else:
+            fresh.append((i, req))
+    accepted = fresh
+
+    records = [RequestEnvelope.of(req).audit_record() for _, req in accepted]
+    if records:
+        summary = await mongo.persist_many(records)
+        if summary and summary["errors"]:
+            accepted = await admit_persisted(accepted, summary["errors"], results)
+
+    limit = asyncio.Semaphore(config_loader.BATCH_CFG.get("max_concurrency", 16))
+
+    async def run(req: MitigationActionRequest) -> MitigationActionResponse:
+        async with limit:
+            try:
+                # Joins a single /api/mitigate call already admitting the same intent
+                response = await idempotency.once(req.intent_id, lambda: execute_mitigation(req))
+            except HTTPException as e:
+                return MitigationActionResponse(
+                    status="error",
+                    testbed=req.testbed.value if req.testbed else "multi-domain",
+                    intent_id=req.intent_id,
+                    message=str(e.detail),
+                )
+        # That call may have queued it as an async job instead
+        return response if isinstance(response, MitigationActionResponse) else batch_job_entry(req)
+
+    responses = await asyncio.gather(*(run(req) for _, req in accepted))
+    for (i, _), response in zip(accepted, responses):
+        results[i] = response
+
+    for i, first in copies.items():
+        results[i] = results[first]
+
+    succeeded = sum(1 for r in results if r.status == "success")
+    status = "success" if succeeded == len(results) else ("error" if not succeeded else "partial_success")
+    return BatchMitigationResponse(status=status, total=len(results), succeeded=succeeded, results=results)
+
+
 if __name__ == '__main__':
     print(mongo)
     if not mongo.ping():
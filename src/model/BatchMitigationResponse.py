@@ -0,0 +1,11 @@
+from pydantic import BaseModel
+from typing import List
+
+from src.model.MitigationActionResponse import MitigationActionResponse
+
+
+class BatchMitigationResponse(BaseModel):
+    status: str
+    total: int
+    succeeded: int
+    results: List[MitigationActionResponse]
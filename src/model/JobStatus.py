@@ -0,0 +1,15 @@
+from datetime import datetime
+from pydantic import BaseModel
+from typing import Optional
+
+from src.model.MitigationActionResponse import MitigationActionResponse
+
+
+class JobStatus(BaseModel):
+    intent_id: str
+    status: str  # queued | running | completed | failed
+    submitted_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    result: Optional[MitigationActionResponse] = None
+    error: Optional[str] = None
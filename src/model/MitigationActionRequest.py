@@ -1,11 +1,13 @@
 from typing import Any, Optional, List
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, PrivateAttr, field_validator
 from pydantic import constr
 from typing_extensions import Annotated
 
-from src.config_loader import TestBedEnum, ACTION_SCHEMAS, TESTBED_CFG, DOMAIN_ROUTING
+from src import config_loader
+from src.config_loader import TestBedEnum
 from src.model.ActionModel import ActionObject
+from src.model.validators import validate_action
 
 
 class FieldPairs(BaseModel):
@@ -64,6 +66,9 @@ class MitigationActionRequest(BaseModel):
     status: Optional[str] = Field(default="pending")
     info: Optional[str] = Field(default="Awaiting enforcement")
 
+    # RequestEnvelope caching the dumped/encoded forms (see src/model/envelope.py)
+    _envelope: Any = PrivateAttr(default=None)
+
     def model_post_init(self, __context):
         # If action.intent_id is missing, use top-level intent_id
         if not self.action.intent_id:
@@ -71,7 +76,7 @@ class MitigationActionRequest(BaseModel):
         
         # If target_domain is empty or None, default to current domain
         if not self.target_domain or (isinstance(self.target_domain, str) and not self.target_domain.strip()):
-            current_domain = DOMAIN_ROUTING.get("current_domain", "")
+            current_domain = config_loader.DOMAIN_ROUTING.get("current_domain", "")
             if current_domain:
                 self.target_domain = current_domain
             elif not self.testbed:
@@ -85,63 +90,35 @@ class MitigationActionRequest(BaseModel):
         if isinstance(self.target_domain, str) and self.target_domain:
             domain_lower = self.target_domain.lower()
             # Validate it's a valid testbed
-            if domain_lower not in TESTBED_CFG:
+            testbeds = config_loader.TESTBED_CFG
+            if domain_lower not in testbeds:
                 raise ValueError(
-                    f"Invalid domain '{self.target_domain}'. Valid domains: {list(TESTBED_CFG.keys())}"
+                    f"Invalid domain '{self.target_domain}'. Valid domains: {list(testbeds.keys())}"
                 )
             # Convert string to TestBedEnum and set message_type
             self.testbed = TestBedEnum[domain_lower.upper()]
-            self.message_type = TESTBED_CFG[domain_lower]["message_type"]
+            self.message_type = testbeds[domain_lower]["message_type"]
         # If target_domain is a list (multi-domain mode)
         elif isinstance(self.target_domain, list):
-            valid_testbeds = set(TESTBED_CFG.keys())
-            invalid_domains = [d for d in self.target_domain if d.lower() not in valid_testbeds]
+            testbeds = config_loader.TESTBED_CFG
+            invalid_domains = [d for d in self.target_domain if d.lower() not in testbeds]
             if invalid_domains:
                 raise ValueError(
-                    f"Invalid domain(s) {invalid_domains}. Valid domains: {list(valid_testbeds)}"
+                    f"Invalid domain(s) {invalid_domains}. Valid domains: {list(testbeds.keys())}"
                 )
             # For multi-domain, we don't set message_type here
             # as it will be determined per-domain during dispatch
         elif self.testbed:
             # Single testbed mode (legacy - testbed field directly specified)
-            self.message_type = TESTBED_CFG[self.testbed.value]["message_type"]
+            self.message_type = config_loader.TESTBED_CFG[self.testbed.value]["message_type"]
         else:
             raise ValueError("Either 'testbed' or 'target_domain' field must be provided")
 
     @field_validator("action")
     @classmethod
     def validate_action_fields(cls, action: ActionObject) -> ActionObject:
-        # Convert action name to lowercase for case-insensitive lookup
-        action_name_lower = action.name.lower()
-        required_spec = ACTION_SCHEMAS[action_name_lower]  # <-- use .name
-        fields = action.fields
-
-        # Special handling for block_pod_address - requires EITHER blocked_pod OR blocked_ips
-        if action_name_lower == "block_pod_address":
-            has_blocked_pod = "blocked_pod" in fields and not cls._is_empty(fields["blocked_pod"])
-            has_blocked_ips = "blocked_ips" in fields and not cls._is_empty(fields["blocked_ips"])
-            
-            if not has_blocked_pod and not has_blocked_ips:
-                raise ValueError(
-                    "Missing blocked target - provide either 'blocked_pod' or 'blocked_ips' field for action 'block_pod_address'"
-                )
-            
-            # Check other required fields (device, interface)
-            missing = [
-                k for k in required_spec
-                if k not in ["blocked_pod", "blocked_ips"] and (k not in fields or cls._is_empty(fields[k]))
-            ]
-        else:
-            # Standard validation for other actions
-            missing = [
-                k for k in required_spec
-                if k not in fields or cls._is_empty(fields[k])
-            ]
-        
-        if missing:
-            raise ValueError(
-                f"Missing or empty field(s) {missing} for action '{action.name}'"
-            )
+        # Checks are compiled per action from config.yaml (case-insensitive name)
+        validate_action(action.name, action.fields)
         return action
 
     @field_validator("intent_id", mode="before")
@@ -150,13 +127,3 @@ class MitigationActionRequest(BaseModel):
         if not v or not v.strip():
             raise ValueError("Missing or empty field 'intent_id'")
         return v.strip()
-
-    @staticmethod
-    def _is_empty(v: Any) -> bool:
-        if v is None:
-            return True
-        if isinstance(v, (str, bytes)) and v.strip() == "":
-            return True
-        if isinstance(v, list) and len(v) == 0:
-            return True
-        return False
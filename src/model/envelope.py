@@ -0,0 +1,76 @@
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from src.utils import codec
+
+# Stands in for target_domain while the per-domain JSON template is encoded
+_DOMAIN_PLACEHOLDER = "\0doc:target_domain\0"
+
+
+def _encode(doc: Dict[str, Any]) -> bytes:
+    return codec.dumps(doc, default=str)
+
+
+class RequestEnvelope:
+    """
+    A validated MitigationActionRequest plus the forms the rest of DOC needs,
+    each computed at most once: the model dump (audit record, forwards) and
+    its JSON encoding.
+
+    The envelope is attached to the request, so copies made with
+    model_copy() (per-domain dispatch) share it. It describes the request as
+    validated; later changes to the model are not reflected.
+    """
+
+    __slots__ = ("req", "_doc", "_json", "_domain_template", "_fields_json")
+
+    def __init__(self, req):
+        self.req = req
+        self._doc: Optional[Dict[str, Any]] = None
+        self._json: Optional[bytes] = None
+        self._domain_template = None
+        self._fields_json: Optional[bytes] = None
+
+    @classmethod
+    def of(cls, req) -> "RequestEnvelope":
+        envelope = req._envelope
+        if envelope is None:
+            envelope = req._envelope = cls(req)
+        return envelope
+
+    @property
+    def doc(self) -> Dict[str, Any]:
+        """req.model_dump(), shared: copy before changing it."""
+        if self._doc is None:
+            self._doc = self.req.model_dump()
+        return self._doc
+
+    @property
+    def json(self) -> bytes:
+        if self._json is None:
+            self._json = _encode(self.doc)
+        return self._json
+
+    @property
+    def fields_json(self) -> bytes:
+        """JSON of action.fields."""
+        if self._fields_json is None:
+            self._fields_json = codec.dumps(self.req.action.fields)
+        return self._fields_json
+
+    def audit_record(self) -> Dict[str, Any]:
+        """A fresh top-level copy of the dump with its own Mongo _id."""
+        return {**self.doc, "_id": str(uuid4())}
+
+    def json_for_domain(self, domain: str) -> bytes:
+        """The JSON body with only target_domain replaced, for forwarding one domain of the intent."""
+        if self._domain_template is None:
+            encoded = _encode({**self.doc, "target_domain": _DOMAIN_PLACEHOLDER})
+            marker = codec.dumps(_DOMAIN_PLACEHOLDER)
+            parts = encoded.split(marker)
+            # Should the placeholder also occur in user data, give up on splicing
+            self._domain_template = tuple(parts) if len(parts) == 2 else ()
+        if not self._domain_template:
+            return _encode({**self.doc, "target_domain": domain})
+        head, tail = self._domain_template
+        return head + codec.dumps(domain) + tail
@@ -0,0 +1,129 @@
+import time
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional
+
+from src import config_loader
+from src.utils import metrics
+
+# Actions satisfied by ANY one of these fields rather than all of them
+ALTERNATIVE_FIELDS = {
+    "block_pod_address": ("blocked_pod", "blocked_ips"),
+}
+
+FieldValidator = Callable[[str, Dict[str, Any]], None]
+
+# Type names usable in `actions.<name>.fields` specs, e.g. `int|str|None`
+SPEC_TYPES = {
+    "int": (int,),
+    "float": (int, float),
+    "str": (str,),
+    "list": (list,),
+    "dict": (dict,),
+    "bool": (bool,),
+    "None": (type(None),),
+}
+
+
+def is_empty(v: Any) -> bool:
+    if v is None:
+        return True
+    if isinstance(v, (str, bytes)) and v.strip() == "":
+        return True
+    if isinstance(v, list) and len(v) == 0:
+        return True
+    return False
+
+
+def compile_check(action: str, field: str, spec: Any) -> Callable[[Any], Optional[str]]:
+    """
+    Turn one field spec into a check returning an error string, or None if the value is fine.
+    A YAML list (`[TCP, UDP]`) is a case-insensitive enum, a string is a `|`-separated type union.
+    """
+    if isinstance(spec, list):
+        choices = frozenset(str(c).upper() for c in spec)
+        shown = [str(c) for c in spec]
+
+        def check_enum(value):
+            if isinstance(value, str) and value.upper() in choices:
+                return None
+            return f"'{field}' must be one of {shown}, got {value!r}"
+        return check_enum
+
+    names = [n.strip() for n in str(spec).split("|")]
+    unknown = [n for n in names if n not in SPEC_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown type(s) {unknown} in spec of field '{field}' for action '{action}'")
+    types = tuple(t for n in names for t in SPEC_TYPES[n])
+    # bool is a subclass of int, but True is not a valid rate
+    allow_bool = "bool" in names
+
+    def check_type(value):
+        if isinstance(value, types) and (allow_bool or not isinstance(value, bool)):
+            return None
+        return f"'{field}' must be {spec}, got {type(value).__name__}"
+    return check_type
+
+
+def compile_validator(name: str, spec: Dict[str, Any]) -> FieldValidator:
+    """
+    Build the field check for one action from its `actions.<name>.fields` spec.
+    The returned function raises ValueError with the message returned to RTR.
+    """
+    alternatives = ALTERNATIVE_FIELDS.get(name, ())
+    required = tuple(k for k in spec if k not in alternatives)
+    alternatives_msg = " or ".join(repr(k) for k in alternatives)
+    checks = tuple((k, compile_check(name, k, field_spec)) for k, field_spec in spec.items())
+
+    def validate(action_name: str, fields: Dict[str, Any]):
+        if alternatives and all(k not in fields or is_empty(fields[k]) for k in alternatives):
+            raise ValueError(
+                f"Missing blocked target - provide either {alternatives_msg} field for action '{action_name}'"
+            )
+        missing = []
+        invalid = []
+        for k, check in checks:
+            value = fields.get(k)
+            if is_empty(value):
+                if k in required:
+                    missing.append(k)
+                continue
+            error = check(value)
+            if error:
+                invalid.append(error)
+        if missing:
+            raise ValueError(f"Missing or empty field(s) {missing} for action '{action_name}'")
+        if invalid:
+            raise ValueError(f"Invalid field(s) for action '{action_name}': {'; '.join(invalid)}")
+
+    return validate
+
+
+def compile_validators(action_spec: Dict[str, Any]) -> Mapping[str, FieldValidator]:
+    return MappingProxyType({
+        name: compile_validator(name, data["fields"]) for name, data in action_spec.items()
+    })
+
+
+VALIDATORS = compile_validators(config_loader._ACTION_SPEC)
+
+
+@config_loader.on_reload
+def _recompile():
+    global VALIDATORS
+    VALIDATORS = compile_validators(config_loader._ACTION_SPEC)
+
+
+def validate_action(action_name: str, fields: Dict[str, Any]):
+    validator = VALIDATORS.get(action_name.lower())
+    if validator is None:
+        raise ValueError(f"Unknown action '{action_name}'. Valid actions: {list(VALIDATORS)}")
+    if not metrics.ENABLED:
+        return validator(action_name, fields)
+
+    started = time.perf_counter()
+    outcome = "invalid"
+    try:
+        validator(action_name, fields)
+        outcome = "valid"
+    finally:
+        metrics.VALIDATION_LATENCY.observe(time.perf_counter() - started, action_name.lower(), outcome)
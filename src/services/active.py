@@ -0,0 +1,415 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from src import config_loader
+from src.config_loader import ACTIVE_CFG
+from src.dispatch import blocks
+from src.model.MitigationActionRequest import MitigationActionRequest
+from src.model.envelope import RequestEnvelope
+from src.services.timerwheel import TimerWheel
+from src.utils import codec, mongo
+
+logger = logging.getLogger("uvicorn.error")
+# Once-per-intent lines, sampled with the other per-request ones (LOG_SAMPLING)
+request_log = logging.getLogger("uvicorn.error.request")
+
+# (testbed, device, interface, target)
+RuleKey = Tuple[str, str, str, str]
+
+
+@dataclass
+class ActiveAction:
+    """One rule DOC has enforced on a testbed and not lifted yet."""
+    testbed: str
+    device: str
+    interface: str
+    target: str
+    intent_id: str
+    action: str
+    fields: Dict[str, Any]
+    request: Dict[str, Any] = field(repr=False)  # the enforcing request, JSON-safe
+    applied_at: float = 0.0
+    expires_at: Optional[float] = None
+
+    @property
+    def key(self) -> RuleKey:
+        return self.testbed, self.device, self.interface, self.target
+
+    @property
+    def document_id(self) -> str:
+        return "|".join(self.key)
+
+    def to_document(self) -> Dict[str, Any]:
+        return {
+            "testbed": self.testbed,
+            "device": self.device,
+            "interface": self.interface,
+            "target": self.target,
+            "intent_id": self.intent_id,
+            "action": self.action,
+            "fields": self.fields,
+            "request": self.request,
+            "applied_at": self.applied_at,
+            "expires_at": self.expires_at,
+        }
+
+    @classmethod
+    def from_document(cls, doc: Dict[str, Any]) -> "ActiveAction":
+        return cls(**{k: v for k, v in doc.items() if k != "_id"})
+
+
+def rule_key(testbed: str, action: str, fields: Dict[str, Any]) -> RuleKey:
+    """
+    Where a rule applies and what it hits. The target is the action name plus
+    the blocked addresses/pods when it has any, so a new rate limit on the same
+    testbed/device/interface replaces the previous one while blocks of
+    different addresses stay separate.
+    """
+    _, targets = blocks.block_targets(fields)
+    target = f"{action}:{','.join(sorted(targets))}" if targets else action
+    return testbed, str(fields.get("device") or ""), str(fields.get("interface") or ""), target
+
+
+def requested_duration(req) -> Optional[float]:
+    """Seconds the action should stay in force (top-level duration, else action.fields), or None."""
+    for value in (req.duration, (req.action.fields or {}).get("duration")):
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            continue
+        if seconds > 0:
+            return seconds
+    return None
+
+
+def enforced_testbeds(req, response) -> Dict[str, Optional[List[str]]]:
+    """
+    Testbeds on which this DOC itself applied `req`, or found it already in
+    force, with the targets enforced there when a fan-out only partly
+    succeeded (None: all of them); forwarded domains belong to their own DOC.
+    """
+    if isinstance(req.target_domain, list):
+        upstream = response.upstream if isinstance(response.upstream, dict) else {}
+        return {
+            d.lower(): None if r["status"] == "success" else succeeded_targets(r.get("response"))
+            for d, r in upstream.items() if isinstance(r, dict) and r.get("status") in ("success", "partial_success")
+        }
+    testbed = req.testbed.value if req.testbed else ""
+    current = config_loader.DOMAIN_ROUTING.get("current_domain", "").lower()
+    if response.status not in ("success", "partial_success") or not testbed or (current and testbed != current):
+        return {}
+    return {testbed: None if response.status == "success" else succeeded_targets(response.upstream)}
+
+
+def succeeded_targets(reply) -> List[str]:
+    """The targets of a fan-out reply (see http._fan_out) that the testbed accepted."""
+    targets = reply.get("targets", {}) if isinstance(reply, dict) else {}
+    return [target for target, result in targets.items() if result.get("status") == "success"]
+
+
+def expiry_request(entry: ActiveAction) -> MitigationActionRequest:
+    """
+    The intent lifting `entry`: its own request with command delete, aimed at
+    its testbed. The action keeps its intent_id, which the testbed payloads
+    use as the rule id (UMU policy ids), so the delete names the rule that
+    was installed. RTR never issued it, so it carries no callback_url.
+    """
+    intent_id = f"{entry.intent_id}-expiry-{entry.testbed}"
+    doc = {
+        **entry.request,
+        "command": "delete",
+        "intent_id": intent_id,
+        "target_domain": entry.testbed,
+        "testbed": entry.testbed,
+        "callback_url": None,
+        "status": "pending",
+        "info": f"Duration of intent {entry.intent_id} ended",
+    }
+    return MitigationActionRequest.model_validate(doc)
+
+
+class ActiveIndex:
+    """
+    In-memory index of the rules currently enforced, keyed by
+    (testbed, device, interface, target), mirrored to Mongo write-behind
+    every `persist_interval` seconds and reloaded on startup.
+
+    Block rules are also kept in blocks.index, so new blocks can skip the
+    targets they cover.
+
+    Rules with a duration get a timer on a hierarchical TimerWheel ticking
+    every `tick` seconds. When it fires the rule leaves the index and its
+    delete intent (see expiry_request) is run through the same path as an
+    RTR request, which sends the rule's payload with DELETE; a failed delete
+    puts the rule back to be retried after `retry_after` seconds.
+    """
+
+    def __init__(self, tick: float = 1.0, persist_interval: float = 1.0,
+                 max_concurrent_expiries: int = 32, retry_after: float = 60):
+        self.tick = tick
+        self.persist_interval = persist_interval
+        self.max_concurrent_expiries = max_concurrent_expiries
+        self.retry_after = retry_after
+
+        self._entries: Dict[RuleKey, ActiveAction] = {}
+        # Block rules per (testbed, device), by each target they name (blocks.canonical)
+        self._blocks: Dict[Tuple[str, str], Dict[str, Set[RuleKey]]] = {}
+        self._wheel = TimerWheel(tick=tick, now=time.time())
+        self._dirty: Dict[str, Optional[dict]] = {}
+        self._runner: Optional[Callable[[Any], Awaitable[Any]]] = None
+        self._tasks: List[asyncio.Task] = []
+        self._expiring = set()
+        self._limit: Optional[asyncio.Semaphore] = None
+        self._counters = dict.fromkeys(("recorded", "removed", "expired", "expiry_failures"), 0)
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "ActiveIndex":
+        keys = ("tick", "persist_interval", "max_concurrent_expiries", "retry_after")
+        return cls(**{k: cfg[k] for k in keys if k in cfg})
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, runner: Callable[[Any], Awaitable[Any]]):
+        """Reload the index from Mongo and start the expiry and persistence loops. `runner(req)` enforces a request."""
+        if self.running:
+            return
+        self._runner = runner
+        self._limit = asyncio.Semaphore(self.max_concurrent_expiries)
+        try:
+            for doc in await mongo.load_active_async():
+                self._add(ActiveAction.from_document(doc), persist=False)
+        except Exception as e:
+            logger.error("Failed to load active mitigations: %s", e)
+        self._tasks = [asyncio.create_task(self._tick_loop()), asyncio.create_task(self._flush_loop())]
+
+    async def stop(self):
+        for task in (*self._tasks, *self._expiring):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._expiring, return_exceptions=True)
+        self._tasks = []
+        await self.flush()
+
+    def record(self, req, response):
+        """
+        Index (command add) or drop (command delete) the rules `req` enforced
+        locally. Of a block, only the targets not yet covered by an indexed
+        block are recorded, as only those were sent (see blocks.filter_request);
+        the rules covering the others are kept in force at least as long as
+        `req` asks. Of a partly failed fan-out, only the targets the testbed
+        accepted count.
+        """
+        testbeds = enforced_testbeds(req, response)
+        if not testbeds:
+            return
+        action = req.action.name.lower()
+        requested = req.action.fields or {}
+        name = blocks.block_targets(requested)[0]
+
+        def fields_on(testbed: str) -> Dict[str, Any]:
+            accepted = testbeds[testbed]
+            if accepted is None:
+                return requested
+            return {**requested, name: accepted if isinstance(requested[name], list) else accepted[0]}
+
+        if str(req.command).lower() == "delete":
+            for testbed in testbeds:
+                if action in blocks.BLOCK_ACTIONS:
+                    self._remove_blocks(testbed, action, fields_on(testbed))
+                else:
+                    self.remove(rule_key(testbed, action, fields_on(testbed)))
+            return
+
+        duration = requested_duration(req)
+        now = time.time()
+        expires_at = now + duration if duration else None
+        # JSON-safe copy of the request, from the encoding it already has
+        request = codec.loads(RequestEnvelope.of(req).json)
+        for testbed in testbeds:
+            fields = fields_on(testbed)
+            targets = blocks.block_targets(fields)[1]
+            enforced = fields
+            if action in blocks.BLOCK_ACTIONS and targets:
+                device = str(fields.get("device") or "")
+                remaining, covered = blocks.index.split(testbed, device, targets)
+                if covered:
+                    self._extend(testbed, device, set(covered.values()), expires_at)
+                    if not remaining:
+                        continue
+                    enforced = {**fields, name: remaining if isinstance(fields[name], list) else remaining[0]}
+            self._add(ActiveAction(
+                *rule_key(testbed, action, enforced),
+                intent_id=req.intent_id,
+                action=action,
+                fields=enforced,
+                request=request if enforced is requested else {**request, "action": {**request["action"], "fields": enforced}},
+                applied_at=now,
+                expires_at=expires_at,
+            ))
+            self._counters["recorded"] += 1
+
+    def _blocks_naming(self, testbed: str, device: str, targets) -> List[ActiveAction]:
+        """The block rules on `testbed`/`device` naming any of `targets` (canonical form)."""
+        by_target = self._blocks.get((testbed, device), {})
+        keys = set().union(*(by_target.get(target, ()) for target in targets))
+        return [self._entries[key] for key in keys]
+
+    def _extend(self, testbed: str, device: str, covering: set, expires_at: Optional[float]):
+        """Push back the expiry of the block rules naming one of `covering` to `expires_at` (None: never)."""
+        for entry in self._blocks_naming(testbed, device, covering):
+            if entry.expires_at is None or (expires_at is not None and expires_at <= entry.expires_at):
+                continue
+            entry.expires_at = expires_at
+            self._add(entry)
+
+    def _remove_blocks(self, testbed: str, action: str, fields: Dict[str, Any]):
+        """
+        Lift the targets of a block delete from the rules naming them: a rule
+        left with no target is dropped, any other keeps its remaining ones.
+        """
+        device = str(fields.get("device") or "")
+        interface = str(fields.get("interface") or "")
+        lifted = set(map(blocks.canonical, blocks.block_targets(fields)[1]))
+        for entry in self._blocks_naming(testbed, device, lifted):
+            if entry.action != action or entry.interface != interface:
+                continue
+            self.remove(entry.key)
+            name, targets = blocks.block_targets(entry.fields)
+            remaining = [t for t in targets if blocks.canonical(t) not in lifted]
+            if not remaining:
+                continue
+            kept = {**entry.fields, name: remaining if isinstance(entry.fields[name], list) else remaining[0]}
+            request = {**entry.request, "action": {**entry.request["action"], "fields": kept}}
+            self._add(replace(entry, target=rule_key(testbed, action, kept)[3], fields=kept, request=request))
+
+    def get(self, key: RuleKey) -> Optional[ActiveAction]:
+        return self._entries.get(key)
+
+    def entries(self) -> Iterator[ActiveAction]:
+        return iter(self._entries.values())
+
+    def remove(self, key: RuleKey) -> Optional[ActiveAction]:
+        entry = self._pop(key)
+        if entry is not None:
+            self._wheel.cancel(key)
+            self._dirty[entry.document_id] = None
+            self._counters["removed"] += 1
+        return entry
+
+    def _pop(self, key: RuleKey) -> Optional[ActiveAction]:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._unblock(entry)
+        return entry
+
+    def _add(self, entry: ActiveAction, persist: bool = True):
+        previous = self._entries.get(entry.key)
+        if previous is not None:
+            self._unblock(previous)
+        self._entries[entry.key] = entry
+        if entry.action in blocks.BLOCK_ACTIONS:
+            targets = blocks.block_targets(entry.fields)[1]
+            blocks.index.add(entry.testbed, entry.device, targets)
+            by_target = self._blocks.setdefault((entry.testbed, entry.device), {})
+            for target in targets:
+                by_target.setdefault(blocks.canonical(target), set()).add(entry.key)
+        if entry.expires_at is not None:
+            self._wheel.schedule(entry.key, entry.expires_at)
+        else:
+            self._wheel.cancel(entry.key)
+        if persist:
+            self._dirty[entry.document_id] = entry.to_document()
+
+    def _unblock(self, entry: ActiveAction):
+        if entry.action in blocks.BLOCK_ACTIONS:
+            targets = blocks.block_targets(entry.fields)[1]
+            blocks.index.remove(entry.testbed, entry.device, targets)
+            by_target = self._blocks.get((entry.testbed, entry.device), {})
+            for target in map(blocks.canonical, targets):
+                keys = by_target.get(target)
+                if keys is not None:
+                    keys.discard(entry.key)
+                    if not keys:
+                        del by_target[target]
+
+    async def flush(self):
+        """Write the index changes made since the last flush."""
+        if not self._dirty:
+            return
+        changes, self._dirty = self._dirty, {}
+        try:
+            await mongo.write_active_async(changes)
+        except Exception as e:
+            logger.error("Failed to persist %s active mitigation change(s): %s", len(changes), e)
+            # Keep them for the next flush, behind anything newer
+            self._dirty = {**changes, **self._dirty}
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.persist_interval)
+            await self.flush()
+
+    async def _tick_loop(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            for key, _ in self._wheel.advance(time.time()):
+                entry = self._pop(key)
+                if entry is None:
+                    continue
+                self._dirty[entry.document_id] = None
+                task = asyncio.create_task(self._expire(entry))
+                self._expiring.add(task)
+                task.add_done_callback(self._expiring.discard)
+
+    async def _expire(self, entry: ActiveAction):
+        async with self._limit:
+            lifted = False
+            try:
+                req = expiry_request(entry)
+                try:
+                    await mongo.persist(RequestEnvelope.of(req).audit_record())
+                except Exception as e:
+                    # e.g. the audit record of an earlier attempt
+                    logger.warning("Audit write for expiry of intent_id %s failed: %s", entry.intent_id, e)
+                response = await self._runner(req)
+                lifted = response.status != "error"
+            except asyncio.CancelledError:
+                # Shutting down: keep the rule so the restarted DOC lifts it
+                if entry.key not in self._entries:
+                    self._add(entry)
+                raise
+            except Exception as e:
+                logger.error("Expiry of intent_id %s on %s failed: %s", entry.intent_id, entry.testbed, e)
+
+        if lifted:
+            self._counters["expired"] += 1
+            request_log.info("Lifted intent_id %s on %s after its duration", entry.intent_id, entry.testbed,
+                             extra={"intent_id": entry.intent_id})
+        else:
+            self._counters["expiry_failures"] += 1
+            if entry.key not in self._entries:
+                entry.expires_at = time.time() + self.retry_after
+                self._add(entry)
+
+    def clear(self):
+        self._entries.clear()
+        self._blocks.clear()
+        blocks.index.clear()
+        self._wheel = TimerWheel(tick=self.tick, now=time.time())
+        self._dirty.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "active": len(self._entries),
+            "scheduled": len(self._wheel),
+            "expiring": len(self._expiring),
+            "pending_writes": len(self._dirty),
+            **self._counters,
+        }
+
+
+active = ActiveIndex.from_config(ACTIVE_CFG)
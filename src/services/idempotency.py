@@ -0,0 +1,104 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from src.config_loader import IDEMPOTENCY_CFG
+from src.dispatch.singleflight import SingleFlight
+from src.model.MitigationActionResponse import MitigationActionResponse
+from src.utils import mongo
+
+logger = logging.getLogger("uvicorn.error")
+
+
+class IdempotencyCache:
+    """
+    Remembers the response of every completed intent_id so a replay (RTR
+    retrying after a timeout) is answered without dispatching again, and
+    lets a replay that arrives while its intent is still being enforced
+    join that enforcement instead of starting a second one.
+
+    Recent results live in an in-memory LRU whose entries expire after `ttl`
+    seconds. The result is also stored, with the time it was stored, on the
+    intent's audit record. That copy is only read back (and only within the
+    same `ttl`) once the audit insert has shown that the intent_id is not
+    new, so a new intent costs no extra Mongo round trip.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+        self._entries: "OrderedDict[str, Tuple[float, MitigationActionResponse]]" = OrderedDict()
+        self._running = SingleFlight()
+        self._counters = dict.fromkeys(("hits", "store_hits", "misses", "evictions", "expired"), 0)
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "IdempotencyCache":
+        return cls(**{k: cfg[k] for k in ("max_entries", "ttl") if k in cfg})
+
+    def recent(self, intent_id: str) -> Optional[MitigationActionResponse]:
+        """The response remembered in memory for `intent_id`, or None."""
+        entry = self._entries.get(intent_id)
+        if entry is not None:
+            stored_at, response = entry
+            if time.monotonic() - stored_at < self.ttl:
+                self._entries.move_to_end(intent_id)
+                self._counters["hits"] += 1
+                return response
+            del self._entries[intent_id]
+            self._counters["expired"] += 1
+        self._counters["misses"] += 1
+        return None
+
+    async def stored(self, intent_id: str) -> Optional[MitigationActionResponse]:
+        """The response stored on the audit record of `intent_id` less than `ttl` seconds ago, or None."""
+        try:
+            record = await mongo.find_record_async(intent_id)
+        except Exception as e:
+            logger.error("Idempotency lookup failed for intent_id %s: %s", intent_id, e)
+            return None
+        if not record or not record.get("result"):
+            return None
+        age = time.time() - float(record.get("result_at") or 0)
+        if age >= self.ttl:
+            self._counters["expired"] += 1
+            return None
+        response = MitigationActionResponse(**record["result"])
+        self._put(intent_id, response, age)
+        self._counters["store_hits"] += 1
+        return response
+
+    async def once(self, intent_id: str, fn: Callable[[], Awaitable[MitigationActionResponse]]) -> MitigationActionResponse:
+        """Run `fn` to admit or enforce `intent_id`, or join the run already in progress for it."""
+        return await self._running.do(intent_id, fn)
+
+    async def remember(self, response: MitigationActionResponse):
+        """
+        Store a completed response. Failures are not remembered, so a retry
+        after an error is enforced again.
+        """
+        if response.status == "error":
+            return
+        self._put(response.intent_id, response)
+        try:
+            # The $set runs behind the response, which is already remembered in memory
+            await mongo.persist_update_behind(response.intent_id, {"result": response.model_dump(), "result_at": time.time()})
+        except Exception as e:
+            logger.error("Failed to store result for intent_id %s: %s", response.intent_id, e)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._counters, "joined": self._running.stats()["coalesced"], "entries": len(self._entries)}
+
+    def clear(self):
+        self._entries.clear()
+
+    def _put(self, intent_id: str, response: MitigationActionResponse, age: float = 0.0):
+        self._entries[intent_id] = (time.monotonic() - age, response)
+        self._entries.move_to_end(intent_id)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+
+idempotency = IdempotencyCache.from_config(IDEMPOTENCY_CFG)
@@ -0,0 +1,179 @@
+import asyncio
+import itertools
+import logging
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi.exceptions import HTTPException
+
+from src.config_loader import JOBS_CFG
+from src.dispatch import priority
+from src.model.JobStatus import JobStatus
+from src.model.MitigationActionResponse import MitigationActionResponse
+from src.utils import mongo
+
+logger = logging.getLogger("uvicorn.error")
+
+# Job states mapped onto the `status` enum of the mitigation_actions collection
+_MONGO_STATUS = {"queued": "pending", "running": "pending", "completed": "completed", "failed": "error"}
+
+
+class JobQueueFull(Exception):
+    """Raised by submit() when the job queue is at capacity."""
+    pass
+
+
+class JobManager:
+    """
+    Runs accepted intents on a pool of background workers, taking queued
+    intents by priority lane (with aging, see priority.py) rather than in
+    arrival order.
+
+    The state of every job lives in an in-memory table (bounded to
+    `max_tracked` entries, oldest evicted first) and is mirrored onto the
+    intent's audit record in Mongo, which serves lookups after eviction or
+    a restart.
+    """
+
+    def __init__(self, workers: int = 8, queue_size: int = 1000, max_tracked: int = 10000):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_tracked = max_tracked
+
+        self._runner: Optional[Callable[[Any], Awaitable[Any]]] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._lanes: Counter = Counter()
+        self._states: "OrderedDict[str, JobStatus]" = OrderedDict()
+        self._tasks = []
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "JobManager":
+        return cls(**{k: cfg[k] for k in ("workers", "queue_size", "max_tracked") if k in cfg})
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self, runner: Callable[[Any], Awaitable[Any]]):
+        """`runner(req)` enforces one request and returns its MitigationActionResponse."""
+        if self.running:
+            return
+        self._runner = runner
+        self._queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, req) -> JobStatus:
+        if not self.running:
+            raise RuntimeError("Job workers are not running")
+        state = JobStatus(intent_id=req.intent_id, status="queued", submitted_at=_now())
+        lanes = priority.index()
+        lane = priority.lane_for(req)
+        try:
+            # The sequence number keeps equal deadlines in arrival order
+            self._queue.put_nowait((lanes.deadline(lane, time.monotonic()), next(self._seq), lane.name, req, state))
+        except asyncio.QueueFull:
+            raise JobQueueFull(f"Job queue is full ({self.queue_size} pending)")
+        self._lanes[lane.name] += 1
+        self._track(state)
+        return state
+
+    def pending(self, intent_id: str) -> Optional[JobStatus]:
+        """The state of `intent_id` if it is queued or running here, else None."""
+        state = self._states.get(intent_id)
+        if state is not None and state.status in ("queued", "running"):
+            return state
+        return None
+
+    async def lookup(self, intent_id: str) -> Optional[JobStatus]:
+        state = self._states.get(intent_id)
+        if state is not None:
+            return state
+
+        record = await mongo.find_record_async(intent_id)
+        if record is None:
+            return None
+        if record.get("job"):
+            return JobStatus(**record["job"])
+        # Intent processed synchronously: its stored response, if it completed (see idempotency.remember)
+        if record.get("result"):
+            result = MitigationActionResponse(**record["result"])
+            return JobStatus(intent_id=intent_id, status="failed" if result.status == "error" else "completed",
+                             result=result)
+        # Otherwise only the audit status is known
+        status = record.get("status", "pending")
+        if status == "error":
+            return JobStatus(intent_id=intent_id, status="failed", error=record.get("info"))
+        return JobStatus(intent_id=intent_id, status=status)
+
+    def stats(self) -> Dict[str, Any]:
+        counts = dict.fromkeys(_MONGO_STATUS, 0)
+        for state in self._states.values():
+            counts[state.status] += 1
+        return {
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "lanes": {lane.name: self._lanes[lane.name] for lane in priority.index().lanes},
+            "tracked": len(self._states),
+            **counts,
+        }
+
+    def _track(self, state: JobStatus):
+        self._states[state.intent_id] = state
+        self._states.move_to_end(state.intent_id)
+        while len(self._states) > self.max_tracked:
+            self._states.popitem(last=False)
+
+    async def _worker(self):
+        while True:
+            _, _, lane, req, state = await self._queue.get()
+            self._lanes[lane] -= 1
+            try:
+                await self._run(req, state)
+            except Exception as e:
+                logger.error("Job worker failed for intent_id %s: %s", state.intent_id, e)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, req, state: JobStatus):
+        state.status = "running"
+        state.started_at = _now()
+        await self._mirror(state)
+
+        try:
+            state.result = await self._runner(req)
+            state.status = "completed" if state.result.status != "error" else "failed"
+        except HTTPException as e:
+            state.status = "failed"
+            state.error = str(e.detail)
+        except Exception as e:
+            logger.error("Job for intent_id %s failed: %s", state.intent_id, e)
+            state.status = "failed"
+            state.error = str(e)
+        state.finished_at = _now()
+        await self._mirror(state)
+
+    async def _mirror(self, state: JobStatus):
+        info = state.error or (state.result.message if state.result else f"Job {state.status}")
+        try:
+            await mongo.persist_update(state.intent_id, {
+                "status": _MONGO_STATUS[state.status],
+                "info": info,
+                "job": state.model_dump(),
+            })
+        except Exception as e:
+            logger.error("Failed to persist job state for intent_id %s: %s", state.intent_id, e)
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+jobs = JobManager.from_config(JOBS_CFG)
@@ -0,0 +1,85 @@
+import math
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class TimerWheel:
+    """
+    Hierarchical timing wheel: `levels` wheels of `slots` buckets, level L
+    bucket spanning slots**L ticks of `tick` seconds. schedule() and cancel()
+    are O(1); advance() touches only the buckets whose time has come,
+    re-filing the entries of a higher-level bucket into lower levels when the
+    wheel below wraps around. Deadlines past the top level's range wait at the
+    top and are re-filed on each pass.
+
+    Not thread-safe: drive it from one event loop.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 256, levels: int = 4, now: float = 0.0):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._spans = [slots ** level for level in range(levels + 1)]
+        self._wheels: List[List[Dict[Hashable, Tuple[int, Any]]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self._where: Dict[Hashable, Tuple[int, int]] = {}
+        self._now = math.floor(now / tick)
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._where
+
+    def schedule(self, key: Hashable, when: float, item: Any = None):
+        """Fire `item` under `key` at time `when` (replacing any timer of that key)."""
+        self.cancel(key)
+        # Due no earlier than the next tick: the current one has been processed
+        self._file(key, max(math.ceil(when / self.tick), self._now + 1), item)
+
+    def cancel(self, key: Hashable) -> Optional[Any]:
+        """Drop the timer of `key`; returns its item, or None if there was none."""
+        where = self._where.pop(key, None)
+        if where is None:
+            return None
+        level, slot = where
+        return self._wheels[level][slot].pop(key)[1]
+
+    def advance(self, now: float) -> List[Tuple[Hashable, Any]]:
+        """Move the wheel up to time `now`; returns the (key, item) pairs that fell due, oldest first."""
+        fired: List[Tuple[Hashable, Any]] = []
+        target = math.floor(now / self.tick)
+        while self._now < target:
+            self._now += 1
+            for level in range(1, self.levels):
+                if self._now % self._spans[level]:
+                    break
+                bucket = self._take(level, (self._now // self._spans[level]) % self.slots)
+                for key, (due, item) in bucket.items():
+                    self._file(key, due, item)
+            for key, (_, item) in self._take(0, self._now % self.slots).items():
+                fired.append((key, item))
+            if not self._where:
+                # Nothing left to cascade: jump straight to the target
+                self._now = target
+        return fired
+
+    def _take(self, level: int, slot: int) -> Dict[Hashable, Tuple[int, Any]]:
+        bucket = self._wheels[level][slot]
+        if not bucket:
+            return bucket
+        self._wheels[level][slot] = {}
+        for key in bucket:
+            del self._where[key]
+        return bucket
+
+    def _file(self, key: Hashable, due: int, item: Any):
+        delta = due - self._now
+        level = 0
+        while level < self.levels - 1 and delta >= self._spans[level + 1]:
+            level += 1
+        # Beyond the top level's range: park in the farthest top bucket for now
+        at = min(due, self._now + self._spans[self.levels] - 1)
+        slot = (at // self._spans[level]) % self.slots
+        self._wheels[level][slot][key] = (due, item)
+        self._where[key] = (level, slot)
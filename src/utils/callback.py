@@ -1,8 +1,18 @@
+import asyncio
+import random
+import time
 import httpx
 import logging
-from typing import Optional
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from src.config_loader import RTR_API_CFG
+from src.dispatch import pool
+from src.utils import codec, metrics
 
 logger = logging.getLogger("uvicorn.error")
+# Once-per-callback lines, so LOG_SAMPLING can thin them out with the other per-request ones
+request_log = logging.getLogger("uvicorn.error.request")
 
 
 async def send_status_update(
@@ -14,53 +24,201 @@ async def send_status_update(
 ) -> bool:
     """
     Send status update to RTR API endpoint.
-    
+
     Args:
         callback_url: The RTR endpoint URL (e.g., http://rtr-api:8000/update_action_status)
         intent_id: The intent ID of the mitigation action
         status: Status of the action - "completed" or "failed"
         info: Information about the action result and testbed(s)
         timeout: Request timeout in seconds
-        
+
     Returns:
         bool: True if callback was successful, False otherwise
     """
     if not callback_url:
-        logger.warning(f"No callback URL provided for intent_id {intent_id}")
+        logger.warning("No callback URL provided for intent_id %s", intent_id)
         return False
-    
+    if not metrics.ENABLED:
+        return await _send_status_update(callback_url, intent_id, status, info, timeout)
+
+    started = time.perf_counter()
+    delivered = await _send_status_update(callback_url, intent_id, status, info, timeout)
+    metrics.CALLBACK_LATENCY.observe(time.perf_counter() - started, "delivered" if delivered else "failed")
+    return delivered
+
+
+async def _send_status_update(callback_url: str, intent_id: str, status: str, info: str, timeout: int) -> bool:
     payload = {
         "intent_id": intent_id,
         "status": status,
         "info": info
     }
-    
+
     try:
-        logger.info(f"Sending status update to RTR: {callback_url}")
-        logger.debug(f"Callback payload: {payload}")
-        
-        async with httpx.AsyncClient() as client:
+        request_log.info("Sending status update to RTR: %s", callback_url, extra={"intent_id": intent_id})
+        request_log.debug("Callback payload: %s", payload, extra={"intent_id": intent_id})
+
+        async with pool.client_for(callback_url) as client:
             resp = await client.post(
                 callback_url,
-                json=payload,
+                content=codec.dumps(payload),
+                headers={"Content-Type": "application/json"},
                 timeout=timeout
             )
-        
+
         if resp.is_success:
-            logger.info(f"Successfully sent status update to RTR for intent_id {intent_id}: {status}")
+            request_log.info("Successfully sent status update to RTR for intent_id %s: %s", intent_id, status,
+                             extra={"intent_id": intent_id})
             return True
         else:
-            logger.error(
-                f"RTR callback failed with status {resp.status_code} for intent_id {intent_id}: {resp.text}"
-            )
+            logger.error("RTR callback failed with status %s for intent_id %s: %s", resp.status_code, intent_id, resp.text)
             return False
-            
+
     except httpx.TimeoutException:
-        logger.error(f"Timeout sending callback to {callback_url} for intent_id {intent_id}")
+        logger.error("Timeout sending callback to %s for intent_id %s", callback_url, intent_id)
         return False
     except httpx.RequestError as e:
-        logger.error(f"Error sending callback to {callback_url} for intent_id {intent_id}: {e}")
+        logger.error("Error sending callback to %s for intent_id %s: %s", callback_url, intent_id, e)
         return False
     except Exception as e:
-        logger.error(f"Unexpected error sending callback for intent_id {intent_id}: {e}")
+        logger.error("Unexpected error sending callback for intent_id %s: %s", intent_id, e)
         return False
+
+
+class CallbackDelivery:
+    """
+    In-process delivery engine for RTR status updates.
+
+    Updates are queued per intent_id and sent by a pool of workers, so the
+    API response never waits on RTR. An update that is still queued when a
+    newer one for the same intent_id arrives is replaced (coalesced). Failed
+    sends are retried with exponential backoff and full jitter.
+    """
+
+    def __init__(self, workers: int = 4, queue_size: int = 1000, max_retries: int = 5,
+                 backoff_base: float = 0.5, backoff_max: float = 30.0, timeout: float = 10):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._tasks = []
+        self._counters = dict.fromkeys(
+            ("submitted", "delivered", "failed", "retries", "coalesced", "dropped"), 0
+        )
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._in_flight = 0
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any]) -> "CallbackDelivery":
+        return cls(**cfg)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, grace: float = 5.0):
+        """Give queued updates `grace` seconds to go out, then stop the workers."""
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), grace)
+        except asyncio.TimeoutError:
+            logger.warning("Dropping %s undelivered status update(s) on shutdown", len(self._pending))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._pending.clear()
+
+    async def submit(self, callback_url: str, intent_id: str, status: str, info: str) -> bool:
+        """
+        Queue a status update for delivery.
+
+        Outside the app lifespan the workers are not running, so the update is
+        sent inline instead.
+        """
+        if not self.running:
+            return await send_status_update(callback_url, intent_id, status, info, timeout=self.timeout)
+
+        self._counters["submitted"] += 1
+        update = {
+            "callback_url": callback_url,
+            "status": status,
+            "info": info,
+            "enqueued": time.monotonic(),
+        }
+        if intent_id in self._pending:
+            # Still waiting for a worker: the newer status supersedes it
+            self._pending[intent_id] = update
+            self._counters["coalesced"] += 1
+            return True
+
+        try:
+            self._queue.put_nowait(intent_id)
+        except asyncio.QueueFull:
+            self._counters["dropped"] += 1
+            logger.error("Callback queue full (%s); dropping status update for intent_id %s", self.queue_size, intent_id)
+            return False
+        self._pending[intent_id] = update
+        return True
+
+    async def _worker(self):
+        while True:
+            intent_id = await self._queue.get()
+            update = self._pending.pop(intent_id, None)
+            try:
+                if update is not None:
+                    self._in_flight += 1
+                    await self._deliver(intent_id, update)
+            except Exception as e:
+                logger.error("Callback worker failed for intent_id %s: %s", intent_id, e)
+            finally:
+                if update is not None:
+                    self._in_flight -= 1
+                self._queue.task_done()
+
+    async def _deliver(self, intent_id: str, update: Dict[str, Any]):
+        for attempt in range(self.max_retries + 1):
+            if attempt and intent_id in self._pending:
+                # A newer status was queued while we backed off; retrying this one is pointless
+                return
+            if await send_status_update(update["callback_url"], intent_id, update["status"],
+                                        update["info"], timeout=self.timeout):
+                latency = time.monotonic() - update["enqueued"]
+                self._counters["delivered"] += 1
+                self._latency_total += latency
+                self._latency_max = max(self._latency_max, latency)
+                return
+
+            if attempt == self.max_retries:
+                break
+            self._counters["retries"] += 1
+            await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt)))
+
+        self._counters["failed"] += 1
+        logger.error("Giving up on status update for intent_id %s after %s attempt(s)", intent_id, self.max_retries + 1)
+
+    def stats(self) -> Dict[str, Any]:
+        delivered = self._counters["delivered"]
+        return {
+            **self._counters,
+            "queue_depth": self._queue.qsize() if self._queue else 0,
+            "in_flight": self._in_flight,
+            "latency_avg_s": self._latency_total / delivered if delivered else 0.0,
+            "latency_max_s": self._latency_max,
+        }
+
+
+delivery = CallbackDelivery.from_config(RTR_API_CFG.get("delivery", {}))
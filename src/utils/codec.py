@@ -0,0 +1,65 @@
+import json
+import logging
+import os
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library codec is used instead
+    orjson = None
+
+logger = logging.getLogger("uvicorn.error")
+
+# Everything DOC encodes or decodes on the request path goes through here:
+# API responses, builder output, forwarded intents, RTR callbacks and upstream
+# replies. Both codecs write compact UTF-8 JSON, so their output is identical
+# for the plain dict/list/str/number documents DOC produces.
+#
+# Call as codec.dumps(...) / codec.loads(...): use() rebinds them.
+
+
+def _json_dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=default).encode("utf-8")
+
+
+CODECS: Dict[str, Tuple[Callable[..., bytes], Callable[[Any], Any]]] = {
+    "json": (_json_dumps, json.loads),
+}
+
+if orjson is not None:
+    def _orjson_dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    CODECS["orjson"] = (_orjson_dumps, orjson.loads)
+
+NAME: str = ""
+dumps: Callable[..., bytes]
+loads: Callable[[Any], Any]
+
+
+def use(name: Optional[str] = None) -> str:
+    """
+    Switch the codec: "orjson" or "json"; None picks orjson when installed.
+    Decode errors are ValueErrors with either codec.
+    """
+    global NAME, dumps, loads
+    if not name:
+        name = "orjson" if "orjson" in CODECS else "json"
+    if name not in CODECS:
+        logger.warning("JSON codec '%s' is not available, using 'json'", name)
+        name = "json"
+    NAME = name
+    dumps, loads = CODECS[name]
+    return name
+
+
+use(os.environ.get("JSON_CODEC"))
+
+
+class CodecResponse(JSONResponse):
+    """JSONResponse rendered with the active codec."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,185 @@
+import logging
+import os
+import queue
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.utils import codec
+
+# sync: handlers write on the calling thread (the event loop), as before.
+# queue: records go through a QueueHandler to a listener thread that formats and writes them.
+MODE = os.environ.get("LOG_MODE", "sync").lower()
+# text: the handlers' own format. json: one JSON object per record (JsonFormatter).
+FORMAT = os.environ.get("LOG_FORMAT", "text").lower()
+QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", "10000"))
+
+# Loggers whose handlers write DOC's lines (uvicorn.error and its children propagate
+# to "uvicorn") and uvicorn's access log
+SINKS = ("uvicorn", "uvicorn.access")
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "color_message"}
+
+
+def parse_sampling(spec: str) -> Dict[str, float]:
+    """'uvicorn.error.request=0.1,uvicorn.error.dispatch=0.5' -> {logger name: share of records kept}."""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, rate = item.partition("=")
+        rates[name.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class Lazy:
+    """An argument for %-style log calls computed only if the record is formatted."""
+
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn: Callable[..., Any], *args: Any):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.fn(*self.args))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps `rate` of a logger's records below WARNING, spread evenly (every
+    other one at 0.5); warnings and errors always pass.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self._credit = 1.0 - rate  # the first record passes
+        self.dropped = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        self._credit += self.rate
+        if self._credit >= 1.0:
+            self._credit -= 1.0
+            return True
+        self.dropped += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and any `extra=` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        doc = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                doc[key] = value
+        if record.exc_info:
+            doc["exc_info"] = self.formatException(record.exc_info)
+        return codec.dumps(doc, default=str).decode()
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: a record that finds the queue full is dropped and counted."""
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """
+    Installs the LOG_MODE / LOG_FORMAT / LOG_SAMPLING settings on the
+    loggers uvicorn configured, for the lifetime of the app, and puts them
+    back on stop().
+
+    In queue mode only the %-interpolation of the message happens on the
+    calling thread; formatting (JSON included) and the writes happen on the
+    listener thread. Sampling filters sit on the loggers themselves, so a
+    sampled-out record is never formatted.
+    """
+
+    def __init__(self, mode: str = "sync", fmt: str = "text", sampling: Optional[Dict[str, float]] = None,
+                 queue_size: int = 10000):
+        self.mode = mode
+        self.format = fmt
+        self.sampling = sampling or {}
+        self.queue_size = queue_size
+
+        self._filters: List[Tuple[logging.Logger, SamplingFilter]] = []
+        self._saved: List[Tuple[logging.Logger, List[logging.Handler], List[Tuple[logging.Handler, Any]]]] = []
+        self._queue_handlers: List[_DroppingQueueHandler] = []
+        self._listeners: List[QueueListener] = []
+
+    @classmethod
+    def from_env(cls) -> "LogPipeline":
+        return cls(MODE, FORMAT, parse_sampling(os.environ.get("LOG_SAMPLING", "")), QUEUE_SIZE)
+
+    @property
+    def running(self) -> bool:
+        return bool(self._filters or self._saved)
+
+    def start(self):
+        if self.running:
+            return
+        for name, rate in self.sampling.items():
+            sampler = SamplingFilter(rate)
+            logger = logging.getLogger(name)
+            logger.addFilter(sampler)
+            self._filters.append((logger, sampler))
+
+        formatter = JsonFormatter() if self.format == "json" else None
+        for name in SINKS:
+            logger = logging.getLogger(name)
+            handlers = list(logger.handlers)
+            if not handlers:
+                continue
+            self._saved.append((logger, handlers, [(h, h.formatter) for h in handlers]))
+            if formatter is not None:
+                for handler in handlers:
+                    handler.setFormatter(formatter)
+            if self.mode == "queue":
+                records: queue.Queue = queue.Queue(self.queue_size)
+                listener = QueueListener(records, *handlers, respect_handler_level=True)
+                queue_handler = _DroppingQueueHandler(records)
+                logger.handlers = [queue_handler]
+                listener.start()
+                self._queue_handlers.append(queue_handler)
+                self._listeners.append(listener)
+
+    def stop(self):
+        """Write out what is queued and restore the loggers as they were."""
+        for logger, handlers, _ in self._saved:
+            logger.handlers = handlers
+        for listener in self._listeners:
+            listener.stop()
+        for _, _, formatters in self._saved:
+            for handler, formatter in formatters:
+                handler.setFormatter(formatter)
+        for logger, sampler in self._filters:
+            logger.removeFilter(sampler)
+        self._filters, self._saved, self._queue_handlers, self._listeners = [], [], [], []
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "format": self.format,
+            "queued": sum(h.queue.qsize() for h in self._queue_handlers),
+            "dropped": sum(h.dropped for h in self._queue_handlers),
+            "sampled_out": {logger.name: sampler.dropped for logger, sampler in self._filters},
+        }
+
+
+pipeline = LogPipeline.from_env()
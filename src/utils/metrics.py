@@ -0,0 +1,155 @@
+import bisect
+import os
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+# Call sites check ENABLED before timing anything, so a disabled build does no
+# extra work (and allocates nothing) on the request path.
+ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Seconds. Wide enough for a 30 s forward, fine enough for a local Mongo insert.
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Pure CPU phases (validation, payload building)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.005, 0.01)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            samples = self._samples()
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + samples
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels: str, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value: float, *labels: str):
+        with self._lock:
+            self._values[labels] = value
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.label_names, k)} {v}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket (last one is +Inf), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += value
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                bucket_labels = _labels(self.label_names, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {total}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format (0.0.4)."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+REQUEST_LATENCY = Histogram(
+    "doc_request_duration_seconds", "Time to answer /api/mitigate", ("testbed", "action", "outcome"))
+REQUESTS_IN_FLIGHT = Gauge("doc_requests_in_flight", "Requests being handled by /api/mitigate")
+VALIDATION_LATENCY = Histogram(
+    "doc_validation_duration_seconds", "Time spent in the compiled action field checks", ("action", "outcome"),
+    buckets=FAST_BUCKETS)
+MONGO_LATENCY = Histogram(
+    "doc_mongo_write_duration_seconds", "Audit write latency", ("operation", "outcome"))
+BUILD_LATENCY = Histogram(
+    "doc_builder_render_duration_seconds", "Time to build the testbed payload", ("testbed", "action"),
+    buckets=FAST_BUCKETS)
+UPSTREAM_LATENCY = Histogram(
+    "doc_upstream_duration_seconds", "Testbed call latency per endpoint", ("endpoint", "outcome"))
+UPSTREAM_IN_FLIGHT = Gauge("doc_upstream_in_flight", "Testbed calls in flight per endpoint", ("endpoint",))
+FORWARD_LATENCY = Histogram(
+    "doc_forward_duration_seconds", "Latency of forwards to remote DOC instances", ("domain", "outcome"))
+CALLBACK_LATENCY = Histogram(
+    "doc_callback_duration_seconds", "Latency of RTR status update sends", ("outcome",))
+POOL_CONNECTIONS = Gauge(
+    "doc_pool_connections", "Connections held by the HTTP pool per origin", ("origin", "state"))
+ADMISSION_WAIT = Histogram(
+    "doc_admission_wait_seconds", "Time dispatches queued for a testbed/endpoint slot", ("scope", "lane", "outcome"))
+ADMISSION_SLOTS = Gauge(
+    "doc_admission_slots", "Dispatch slots in use per testbed/endpoint", ("scope",))
+ADMISSION_QUEUED = Gauge(
+    "doc_admission_queued", "Dispatches waiting for a testbed/endpoint slot per priority lane", ("scope", "lane"))
+JOBS_QUEUED = Gauge("doc_jobs_queued", "Async jobs waiting for a worker per priority lane", ("lane",))
+POOL_REQUESTS = Gauge("doc_pool_requests", "Requests active or waiting on the HTTP pool per origin", ("origin",))
+BUILDER_CACHE_LOOKUPS = Counter(
+    "doc_builder_cache_lookups_total", "Payload cache lookups by outcome (hits, misses, bypassed)", ("outcome",))
+BUILDER_CACHE_BYTES = Gauge("doc_builder_cache_bytes", "Payload bytes held by the builder cache")
@@ -1,19 +1,59 @@
+import asyncio
 import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
 
-from pymongo import MongoClient
+from pymongo import DeleteOne, MongoClient, ReplaceOne
+from pymongo.errors import BulkWriteError, WriteError
+from pymongo.write_concern import WriteConcern
+
+from src.utils import metrics
 
 logger = logging.getLogger("uvicorn.error")
 
 MONGO_URI = os.environ.get("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB = os.environ.get("MONGO_DB", "doc_database")
 MONGO_COLL = os.environ.get("MONGO_COLL", "mitigation_actions")
+# Actions currently enforced, one document per rule (see src/services/active.py)
+MONGO_ACTIVE_COLL = os.environ.get("MONGO_ACTIVE_COLL", "active_mitigations")
+
+# How persist() performs the audit write:
+#   sync       - insert_one on the event loop (blocks every in-flight request)
+#   executor   - insert_one on the writer thread pool, awaited by the request
+#   background - hand the record to the writer pool and return immediately
+#   batched    - buffer records and flush them with one unordered insert_many
+#                every MONGO_BATCH_SIZE records or MONGO_BATCH_INTERVAL seconds
+MONGO_WRITE_MODE = os.environ.get("MONGO_WRITE_MODE", "executor").lower()
+MONGO_WRITE_WORKERS = int(os.environ.get("MONGO_WRITE_WORKERS", "4"))
+# Max background writes in flight; past this persist() awaits the write instead
+MONGO_WRITE_QUEUE = int(os.environ.get("MONGO_WRITE_QUEUE", "1000"))
+MONGO_BATCH_SIZE = int(os.environ.get("MONGO_BATCH_SIZE", "100"))
+MONGO_BATCH_INTERVAL = float(os.environ.get("MONGO_BATCH_INTERVAL", "0.2"))
+# Write concern for audit writes: a node count ("0", "1", ...) or a tag such as "majority"
+MONGO_WRITE_CONCERN = os.environ.get("MONGO_WRITE_CONCERN", "1")
+
+# Error code of an insert refused because its intent_id already has an audit record
+DUPLICATE_KEY = 11000
+
+
+def _write_concern(w: str) -> WriteConcern:
+    return WriteConcern(w=int(w) if w.isdigit() else w)
+
 
 _client = MongoClient(MONGO_URI)
 _db = _client[MONGO_DB]
-_col = _db[MONGO_COLL]
+_col = _db.get_collection(MONGO_COLL, write_concern=_write_concern(MONGO_WRITE_CONCERN))
 
 _col.create_index("intent_id", unique=True)
+_active_col = _db.get_collection(MONGO_ACTIVE_COLL, write_concern=_write_concern(MONGO_WRITE_CONCERN))
+
+_executor = ThreadPoolExecutor(max_workers=MONGO_WRITE_WORKERS, thread_name_prefix="mongo-writer")
+_background = set()
+_buffer: List[dict] = []
+_flusher: Optional[asyncio.Task] = None
+
 
 def ping() -> bool:
     try:
@@ -23,6 +63,258 @@ def ping() -> bool:
         logger.error(e)
         return False
 
+
 def insert_raw(doc: dict) -> str:
-    result = _col.insert_one(doc)
-    return str(result.inserted_id)
+    if not metrics.ENABLED:
+        return str(_col.insert_one(doc).inserted_id)
+
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        result = _col.insert_one(doc)
+        outcome = "ok"
+        return str(result.inserted_id)
+    finally:
+        metrics.MONGO_LATENCY.observe(time.perf_counter() - started, "insert_one", outcome)
+
+
+def insert_many_raw(docs: List[dict]) -> Dict[str, Any]:
+    """
+    Unordered bulk insert. A failing document (e.g. a duplicate intent_id)
+    does not stop the others; each failure is reported with its intent_id.
+    """
+    started = time.perf_counter() if metrics.ENABLED else 0.0
+    try:
+        result = _col.insert_many(docs, ordered=False)
+        if metrics.ENABLED:
+            metrics.MONGO_LATENCY.observe(time.perf_counter() - started, "insert_many", "ok")
+        return {"inserted": len(result.inserted_ids), "errors": []}
+    except BulkWriteError as bwe:
+        if metrics.ENABLED:
+            metrics.MONGO_LATENCY.observe(time.perf_counter() - started, "insert_many", "partial")
+        errors = [
+            {
+                "intent_id": docs[err["index"]].get("intent_id"),
+                "code": err.get("code"),
+                "message": err.get("errmsg"),
+            }
+            for err in bwe.details.get("writeErrors", [])
+        ]
+        return {"inserted": bwe.details.get("nInserted", 0), "errors": errors}
+
+
+def update_record(intent_id: str, fields: dict):
+    _col.update_one({"intent_id": intent_id}, {"$set": fields})
+
+
+def find_record(intent_id: str) -> Optional[dict]:
+    return _col.find_one({"intent_id": intent_id}, {"_id": 0})
+
+
+def write_active(changes: Dict[str, Optional[dict]]) -> int:
+    """
+    Apply active-rule changes in one unordered bulk write: a document
+    replaces (or creates) the rule with that _id, None deletes it.
+    """
+    if not changes:
+        return 0
+    ops = [
+        ReplaceOne({"_id": key}, {**doc, "_id": key}, upsert=True) if doc is not None else DeleteOne({"_id": key})
+        for key, doc in changes.items()
+    ]
+    started = time.perf_counter() if metrics.ENABLED else 0.0
+    _active_col.bulk_write(ops, ordered=False)
+    if metrics.ENABLED:
+        metrics.MONGO_LATENCY.observe(time.perf_counter() - started, "active_bulk_write", "ok")
+    return len(ops)
+
+
+def load_active() -> List[dict]:
+    return list(_active_col.find())
+
+
+async def write_active_async(changes: Dict[str, Optional[dict]]) -> int:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, write_active, changes)
+
+
+async def load_active_async() -> List[dict]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, load_active)
+
+
+async def update_record_async(intent_id: str, fields: dict):
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_executor, update_record, intent_id, fields)
+
+
+async def find_record_async(intent_id: str) -> Optional[dict]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, find_record, intent_id)
+
+
+async def insert_raw_async(doc: dict) -> str:
+    """insert_raw() on the writer pool, so the event loop keeps serving requests."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, insert_raw, doc)
+
+
+async def insert_many_raw_async(docs: List[dict]) -> Dict[str, Any]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, insert_many_raw, docs)
+
+
+async def _write_in_background(doc: dict):
+    try:
+        await insert_raw_async(doc)
+    except WriteError as we:
+        logger.error(we.details)
+    except Exception as e:
+        logger.error("Background audit write failed for intent_id %s: %s", doc.get("intent_id"), e)
+
+
+async def _write_many_in_background(docs: List[dict]):
+    try:
+        _log_rejections(await insert_many_raw_async(docs))
+    except Exception as e:
+        logger.error("Audit batch of %s record(s) failed: %s", len(docs), e)
+
+
+def _log_rejections(result: Dict[str, Any]):
+    for err in result["errors"]:
+        logger.error("Audit record for intent_id %s rejected (%s): %s", err["intent_id"], err["code"], err["message"])
+
+
+async def flush():
+    """Write out everything buffered so far in one insert_many."""
+    global _buffer
+    if not _buffer:
+        return
+    batch, _buffer = _buffer, []
+    await _write_many_in_background(batch)
+
+
+async def _flush_periodically():
+    while True:
+        await asyncio.sleep(MONGO_BATCH_INTERVAL)
+        await flush()
+
+
+async def persist(doc: dict) -> Optional[str]:
+    """
+    Write an audit record according to MONGO_WRITE_MODE.
+
+    Returns the inserted id, or None when the write was handed off to the
+    background or the batch buffer. WriteError is raised to the caller only in
+    sync and executor mode; otherwise it is logged by the writer.
+    """
+    if MONGO_WRITE_MODE == "sync":
+        return insert_raw(doc)
+
+    # Without a running flusher (no app lifespan) batching degrades to an awaited write
+    if MONGO_WRITE_MODE == "batched" and _flusher is not None:
+        _buffer.append(doc)
+        if len(_buffer) >= MONGO_BATCH_SIZE:
+            _run_in_background(flush())
+        return None
+
+    if MONGO_WRITE_MODE == "background" and len(_background) < MONGO_WRITE_QUEUE:
+        _run_in_background(_write_in_background(doc))
+        return None
+
+    return await insert_raw_async(doc)
+
+
+async def persist_many(docs: List[dict]) -> Optional[Dict[str, Any]]:
+    """
+    Write several audit records with a single bulk insert, following
+    MONGO_WRITE_MODE like persist(). Returns the insert_many_raw() summary,
+    or None when the write was handed off.
+    """
+    if MONGO_WRITE_MODE == "sync":
+        return insert_many_raw(docs)
+
+    if MONGO_WRITE_MODE == "batched" and _flusher is not None:
+        _buffer.extend(docs)
+        if len(_buffer) >= MONGO_BATCH_SIZE:
+            _run_in_background(flush())
+        return None
+
+    if MONGO_WRITE_MODE == "background" and len(_background) < MONGO_WRITE_QUEUE:
+        _run_in_background(_write_many_in_background(docs))
+        return None
+
+    return await insert_many_raw_async(docs)
+
+
+async def persist_update(intent_id: str, fields: dict):
+    """
+    $set `fields` on an audit record, following MONGO_WRITE_MODE like persist().
+    A record still waiting in the batch buffer is amended in place, so the
+    update cannot overtake its insert.
+    """
+    if _amend_buffered(intent_id, fields):
+        return
+
+    if MONGO_WRITE_MODE == "sync":
+        return update_record(intent_id, fields)
+
+    if MONGO_WRITE_MODE in ("background", "batched") and len(_background) < MONGO_WRITE_QUEUE:
+        _run_in_background(_update_in_background(intent_id, fields))
+        return
+
+    await update_record_async(intent_id, fields)
+
+
+async def persist_update_behind(intent_id: str, fields: dict):
+    """
+    persist_update() kept off the request path whatever MONGO_WRITE_MODE
+    says: the $set goes to the writer pool without being awaited, unless
+    MONGO_WRITE_QUEUE background writes are already pending.
+    """
+    if _amend_buffered(intent_id, fields):
+        return
+    if len(_background) < MONGO_WRITE_QUEUE:
+        _run_in_background(_update_in_background(intent_id, fields))
+        return
+    await update_record_async(intent_id, fields)
+
+
+def _amend_buffered(intent_id: str, fields: dict) -> bool:
+    # A record still waiting in the batch buffer is amended in place
+    for doc in _buffer:
+        if doc.get("intent_id") == intent_id:
+            doc.update(fields)
+            return True
+    return False
+
+
+async def _update_in_background(intent_id: str, fields: dict):
+    try:
+        await update_record_async(intent_id, fields)
+    except Exception as e:
+        logger.error("Background audit update failed for intent_id %s: %s", intent_id, e)
+
+
+def _run_in_background(coro):
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def start():
+    """Start the batch flusher when MONGO_WRITE_MODE is batched. Called on startup."""
+    global _flusher
+    if MONGO_WRITE_MODE == "batched" and _flusher is None:
+        _flusher = asyncio.create_task(_flush_periodically())
+
+
+async def drain():
+    """Flush pending batched records and wait for background writes. Called on shutdown."""
+    global _flusher
+    if _flusher is not None:
+        _flusher.cancel()
+        _flusher = None
+    await flush()
+    if _background:
+        await asyncio.gather(*list(_background), return_exceptions=True)
@@ -21,6 +21,41 @@ def patch_mongo(mocker):
     return stub
 
 
+# Fixtures reuse intent_ids across tests; don't let one test replay another's result
+@pytest.fixture(autouse=True)
+def clear_idempotency_cache():
+    from src.services.idempotency import idempotency
+    idempotency.clear()
+
+
+# Failures against unreachable testbeds must not open breakers for later tests
+@pytest.fixture(autouse=True)
+def reset_circuit_breakers():
+    from src.dispatch.breaker import breakers
+    breakers.reset()
+
+
+# Rules enforced by one test must not be indexed (or expire) in another
+@pytest.fixture(autouse=True)
+def clear_active_index():
+    from src.services.active import active
+    active.clear()
+
+# Tests that shrink the admission limits must not leave them shrunk
+@pytest.fixture(autouse=True)
+def reset_admission_control():
+    from src.dispatch import admission
+    admission.control.reset()
+    yield
+    admission.control.reset()
+
+# Payloads cached by one test must not answer the next one
+@pytest.fixture(autouse=True)
+def clear_builder_cache():
+    from src.dispatch import memo
+    memo.payloads.clear()
+
+
 # Patch translator
 def patch_upstream(mocker):
     # Patch the dispatcher instead of build_dispatch_spec
@@ -1,4 +1,5 @@
 import json
+import httpx
 from lxml import etree
 
 import pytest
@@ -728,8 +729,1392 @@ def test_single_element_list_valid_domain(client, httpx_mock, patch_mongo):
     assert len(httpx_mock.get_requests()) == 1
 
 
+#### Connection pools ####
 
+UPC_BLOCK_IP_PAYLOAD = {
+    "command": "add",
+    "intent_type": "mitigation",
+    "intent_id": "pooled-block-ip-001",
+    "target_domain": "upc",
+    "threat": "attack",
+    "action": {
+        "name": "block_ip_addresses",
+        "fields": {"blocked_ips": ["192.168.1.100"]}
+    },
+}
 
 
+def test_dispatch_reuses_pooled_client(httpx_mock, patch_mongo):
+    """Inside the app lifespan every dispatch to a testbed host shares one client"""
+    from src.dispatch import pool
 
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked"},
+        is_reusable=True,
+    )
+
+    with TestClient(app) as client:
+        upc_client = pool._clients["http://10.19.2.1:8001"]
+        for i in range(2):
+            # Different addresses: a block already in force is not sent again
+            payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": f"pooled-block-ip-{i}",
+                       "action": {"name": "block_ip_addresses", "fields": {"blocked_ips": [f"192.168.1.{100 + i}"]}}}
+            resp = client.post("/api/mitigate", json=payload)
+            assert resp.status_code == 200
+        assert pool._clients["http://10.19.2.1:8001"] is upc_client
+
+    # Pools are closed on shutdown
+    assert pool._clients == {}
+    assert len(httpx_mock.get_requests()) == 2
+
+
+def test_pools_are_bounded_rebuilt_on_reload_and_all_closed(monkeypatch, mocker):
+    """Unknown origins share one client; reloaded pool settings apply; a failing close leaves no client open"""
+    import asyncio
+    from src import config_loader
+    from src.dispatch import pool
+
+    upc = "http://10.19.2.1:8001/block_ip_addresses"
+
+    async def scenario():
+        await pool.open_pools()
+        async with pool.client_for("http://rtr-a:8000/cb") as a, pool.client_for("http://rtr-b:9000/cb") as b:
+            assert a is b is pool._shared
+        origins = set(pool._clients)
+
+        testbeds = {**config_loader.TESTBED_CFG, "upc": {**config_loader.TESTBED_CFG["upc"], "pool": {"max_connections": 7}}}
+        monkeypatch.setattr(config_loader, "TESTBED_CFG", testbeds)
+        old = pool._clients["http://10.19.2.1:8001"]
+        async with pool.client_for(upc) as busy:
+            pool._settings_changed()
+            async with pool.client_for(upc) as fresh:
+                assert fresh is not busy
+                assert fresh._transport._pool._max_connections == 7
+            assert not old.is_closed
+        assert old.is_closed and set(pool._clients) == origins
+
+        clients = [*pool._clients.values(), pool._shared]
+        mocker.patch.object(clients[0], "aclose", side_effect=RuntimeError("boom"))
+        await pool.close_pools()
+        return clients[1:]
+
+    rest = asyncio.run(scenario())
+    assert all(c.is_closed for c in rest)
+    assert pool._clients == {} and pool._shared is None
+
+
+#### Multi-domain fan-out ####
+
+def test_multi_domain_slow_domain_returns_partial(client, httpx_mock, patch_mongo, monkeypatch):
+    """A domain that misses its deadline is reported without holding up the others"""
+    import asyncio
+    import time
+    from src import config_loader
+
+    # Rebound as /reload_config does: the deadlines are read per request
+    monkeypatch.setattr(config_loader, "DOMAIN_ROUTING", {
+        **config_loader.DOMAIN_ROUTING,
+        "current_domain": "upc",
+        "fanout": {"domain_timeout": 0.2, "overall_timeout": 5},
+    })
+
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/dns_rate_limiting",
+        status_code=200,
+        json={"message": "UPC: Rate limiting applied"}
+    )
+
+    async def slow_remote_doc(request):
+        await asyncio.sleep(2)
+        return httpx.Response(200, json={"status": "success"})
+
+    httpx_mock.add_callback(slow_remote_doc, url="http://10.208.11.73:8001/api/mitigate")
+
+    started = time.monotonic()
+    resp = client.post("/api/mitigate", json=VALID_PAYLOAD_MULTI_DOMAIN_DNS_RATE_LIMITING)
+    assert time.monotonic() - started < 2
+
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["status"] == "partial_success"
+    assert list(body["upstream"]) == ["upc", "umu"]
+    assert body["upstream"]["upc"]["status"] == "success"
+    assert body["upstream"]["umu"] == {"status": "error", "reason": "Timed out after 0.2s"}
+
+
+def test_domain_fan_out_reads_the_reloaded_testbed_config(monkeypatch, mocker):
+    """Testbed settings replaced by /reload_config apply to the next multi-domain intent"""
+    import asyncio
+    from src import config_loader
+    from src.main import execute_domain
+    from src.model.MitigationActionRequest import MitigationActionRequest
+
+    req = MitigationActionRequest.model_validate(UPC_BLOCK_IP_PAYLOAD)
+    dispatched = mocker.patch("src.main.dispatch", return_value=({"result": "ok"}, 200, True))
+    monkeypatch.setattr(config_loader, "TESTBED_CFG", {
+        **config_loader.TESTBED_CFG, "umu": {**config_loader.TESTBED_CFG["umu"], "message_type": "upc_json"},
+    })
+
+    entry = asyncio.run(execute_domain(req, "umu", "umu"))
+
+    assert entry["status"] == "success"
+    assert dispatched.call_args.args[0].message_type == "upc_json"
+
+    monkeypatch.setattr(config_loader, "TESTBED_CFG", {"upc": config_loader.TESTBED_CFG["upc"]})
+    assert asyncio.run(execute_domain(req, "umu", "umu")) == {"status": "skipped", "reason": "Invalid domain"}
+
+
+#### Audit persistence ####
+
+def test_background_audit_write_is_off_the_request_path(httpx_mock, patch_mongo, monkeypatch):
+    """In background mode the response does not wait for Mongo; shutdown drains the write"""
+    import threading
+    import time
+    from src.utils import mongo
+
+    monkeypatch.setattr(mongo, "MONGO_WRITE_MODE", "background")
+    released = threading.Event()
+    patch_mongo.side_effect = lambda doc: released.wait(5) and "fake-mongo-id"
+
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked"},
+    )
+
+    with TestClient(app) as client:
+        started = time.monotonic()
+        resp = client.post("/api/mitigate", json=UPC_BLOCK_IP_PAYLOAD)
+        assert time.monotonic() - started < 1
+        assert resp.status_code == 200
+        released.set()
+
+    patch_mongo.assert_called_once()
+
+
+def test_stored_result_update_is_off_the_request_path(httpx_mock, patch_mongo, mocker):
+    """In the default executor mode the result $set runs behind the response; shutdown drains it"""
+    import threading
+    import time
+
+    released = threading.Event()
+    update = mocker.patch("src.utils.mongo.update_record", side_effect=lambda *a: released.wait(5))
+
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked"},
+    )
+
+    with TestClient(app) as client:
+        started = time.monotonic()
+        resp = client.post("/api/mitigate", json=UPC_BLOCK_IP_PAYLOAD)
+        assert time.monotonic() - started < 1
+        assert resp.status_code == 200
+        released.set()
+
+    assert update.call_args.args[1]["result"]["status"] == "success"
+
+
+def test_batched_audit_writes_flush_on_shutdown(httpx_mock, patch_mongo, monkeypatch, mocker):
+    """Batched mode groups records into one insert_many, flushed at the latest on shutdown"""
+    from src.utils import mongo
+
+    monkeypatch.setattr(mongo, "MONGO_WRITE_MODE", "batched")
+    monkeypatch.setattr(mongo, "MONGO_BATCH_INTERVAL", 60)
+    bulk = mocker.patch("src.utils.mongo.insert_many_raw", return_value={"inserted": 2, "errors": []})
+
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked"},
+        is_reusable=True,
+    )
+
+    with TestClient(app) as client:
+        for i in range(2):
+            payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": f"batched-block-ip-{i}"}
+            assert client.post("/api/mitigate", json=payload).status_code == 200
+        bulk.assert_not_called()
+
+    bulk.assert_called_once()
+    assert [d["intent_id"] for d in bulk.call_args.args[0]] == ["batched-block-ip-0", "batched-block-ip-1"]
+    patch_mongo.assert_not_called()
+
+
+def test_insert_many_reports_duplicates_per_document(mocker):
+    from pymongo.errors import BulkWriteError
+    from src.utils import mongo
+
+    mocker.patch.object(mongo._col, "insert_many", side_effect=BulkWriteError({
+        "nInserted": 1,
+        "writeErrors": [{"index": 1, "code": 11000, "errmsg": "E11000 duplicate key error"}],
+    }))
+
+    result = mongo.insert_many_raw([{"intent_id": "a"}, {"intent_id": "b"}])
+    assert result == {
+        "inserted": 1,
+        "errors": [{"intent_id": "b", "code": 11000, "message": "E11000 duplicate key error"}],
+    }
+
+
+#### Callback delivery ####
+
+RTR_CALLBACK_URL = "http://rtr-api:8000/update_action_status"
+
+
+def test_callback_delivery_coalesces_and_retries(httpx_mock):
+    """Only the latest queued status per intent is sent, and a failed send is retried"""
+    import asyncio
+    from src.utils.callback import CallbackDelivery
+
+    httpx_mock.add_response(method="POST", url=RTR_CALLBACK_URL, status_code=503)
+    httpx_mock.add_response(method="POST", url=RTR_CALLBACK_URL, status_code=200)
+
+    async def scenario():
+        delivery = CallbackDelivery(workers=1, backoff_base=0.01)
+        await delivery.start()
+        # Both are queued before the worker runs, so the second supersedes the first
+        await delivery.submit(RTR_CALLBACK_URL, "cb-001", "partial", "first")
+        await delivery.submit(RTR_CALLBACK_URL, "cb-001", "completed", "second")
+        await delivery.stop()
+        return delivery.stats()
+
+    stats = asyncio.run(scenario())
+
+    sent = [json.loads(r.content) for r in httpx_mock.get_requests()]
+    assert sent == [{"intent_id": "cb-001", "status": "completed", "info": "second"}] * 2
+    assert stats["coalesced"] == 1
+    assert stats["retries"] == 1
+    assert stats["delivered"] == 1
+    assert stats["queue_depth"] == 0
+
+
+#### Batch endpoint ####
+
+def test_batch_mitigate_returns_results_in_order(client, httpx_mock, mocker):
+    """Invalid intents are reported in place; valid ones share one bulk write"""
+    bulk = mocker.patch("src.utils.mongo.insert_many_raw", return_value={"inserted": 2, "errors": []})
+
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked"},
+    )
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/dns_rate_limiting",
+        status_code=200,
+        json={"message": "UPC: Rate limiting applied"},
+    )
+
+    dns_limit = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": "batch-dns-001", "action": {
+        "name": "dns_rate_limiting",
+        "fields": {"rate": "20", "duration": "60", "source_ip_filter": ["10.0.0.5"]},
+    }}
+    missing_fields = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": "batch-bad-001", "action": {
+        "name": "block_ip_addresses",
+        "fields": {},
+    }}
+    items = [{**UPC_BLOCK_IP_PAYLOAD, "intent_id": "batch-block-001"}, missing_fields, dns_limit]
+
+    resp = client.post("/api/mitigate/batch", json=items)
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["status"] == "partial_success"
+    assert (body["total"], body["succeeded"]) == (3, 2)
+    assert [r["intent_id"] for r in body["results"]] == ["batch-block-001", "batch-bad-001", "batch-dns-001"]
+    assert [r["status"] for r in body["results"]] == ["success", "error", "success"]
+    assert body["results"][1]["message"] == "Missing or empty field(s) ['blocked_ips'] for action 'block_ip_addresses'"
+    assert body["results"][2]["upstream"] == {"message": "UPC: Rate limiting applied"}
+
+    bulk.assert_called_once()
+    assert [d["intent_id"] for d in bulk.call_args.args[0]] == ["batch-block-001", "batch-dns-001"]
+
+
+def test_batch_collapses_repeats_and_reports_rejected_audit_records(client, httpx_mock, mocker):
+    """Repeated intent_ids run once; a known intent replays its stored result; other rejections are reported"""
+    import time
+
+    bulk = mocker.patch("src.utils.mongo.insert_many_raw", return_value={"inserted": 1, "errors": [
+        {"intent_id": "batch-known-001", "code": 11000, "message": "E11000 duplicate key error"},
+        {"intent_id": "batch-invalid-001", "code": 121, "message": "Document failed validation"},
+    ]})
+    stored = {"status": "success", "testbed": "upc", "intent_id": "batch-known-001", "message": "stored"}
+    mocker.patch("src.utils.mongo.find_record", return_value={"result": stored, "result_at": time.time()})
+    httpx_mock.add_response(method="POST", url="http://10.19.2.1:8001/block_ip_addresses",
+                            status_code=200, json={"message": "UPC: IPs blocked"})
+
+    def intent(intent_id, ip):
+        return {**UPC_BLOCK_IP_PAYLOAD, "intent_id": intent_id,
+                "action": {"name": "block_ip_addresses", "fields": {"blocked_ips": [ip]}}}
+
+    items = [intent("batch-new-001", "10.7.0.1"), intent("batch-known-001", "10.7.0.2"),
+             intent("batch-new-001", "10.7.0.1"), intent("batch-invalid-001", "10.7.0.3")]
+    body = client.post("/api/mitigate/batch", json=items).json()
+
+    assert [d["intent_id"] for d in bulk.call_args.args[0]] == ["batch-new-001", "batch-known-001", "batch-invalid-001"]
+    assert len(httpx_mock.get_requests()) == 1
+    assert [r["status"] for r in body["results"]] == ["success", "success", "success", "error"]
+    assert body["results"][2] == body["results"][0]
+    assert body["results"][1]["message"] == "stored"
+    assert body["results"][3]["message"] == "Audit record rejected (121): Document failed validation"
+
+
+#### Async job mode ####
+
+def test_async_mode_accepts_then_reports_result(httpx_mock, patch_mongo, mocker):
+    """mode=async answers 202 immediately; the result is served by the status lookup"""
+    import time
+
+    mirror = mocker.patch("src.utils.mongo.update_record")
+    mocker.patch("src.utils.mongo.find_record", return_value=None)
+
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked"},
+    )
+
+    with TestClient(app) as client:
+        payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": "async-block-ip-001"}
+        resp = client.post("/api/mitigate?mode=async", json=payload)
+        assert resp.status_code == 202
+        assert resp.headers["Location"] == "/api/mitigate/async-block-ip-001"
+        assert resp.json()["status"] == "queued"
+
+        deadline = time.monotonic() + 5
+        while True:
+            job = client.get("/api/mitigate/async-block-ip-001").json()
+            if job["status"] == "completed" or time.monotonic() > deadline:
+                break
+            time.sleep(0.01)
+
+        assert job["status"] == "completed"
+        assert job["result"]["upstream"] == {"message": "UPC: IPs blocked"}
+        assert client.get("/api/mitigate/unknown-intent").status_code == 404
+
+    patch_mongo.assert_called_once()
+    # The stored-result $set runs in the background, so the job mirror need not be the last update
+    assert [c.args[1]["status"] for c in mirror.call_args_list if "status" in c.args[1]][-1] == "completed"
+
+
+def test_status_lookup_of_a_synchronous_intent_reports_its_stored_response(client, mocker):
+    """An intent enforced synchronously is completed (or failed) as its stored response says, not as the audit status"""
+    stored = {"status": "success", "testbed": "upc", "intent_id": "sync-lookup-001", "message": "done"}
+    find = mocker.patch("src.utils.mongo.find_record",
+                        return_value={"intent_id": "sync-lookup-001", "status": "pending", "result": stored})
+
+    job = client.get("/api/mitigate/sync-lookup-001").json()
+    assert job["status"] == "completed" and job["result"]["message"] == "done"
+
+    find.return_value = {"intent_id": "sync-lookup-002", "status": "pending"}
+    assert client.get("/api/mitigate/sync-lookup-002").json()["status"] == "pending"
+
+
+#### Compiled action plans ####
+
+def test_reload_swaps_action_plan_index(tmp_path):
+    """reload_yaml rebuilds the (testbed, action) index; unknown pairs are rejected"""
+    import yaml
+    from src import config_loader
+    from src.dispatch import plan
+
+    assert plan.lookup("upc", "BLOCK_IP_ADDRESSES").url == "http://10.19.2.1:8001/block_ip_addresses"
+    with pytest.raises(ValueError, match="not allowed on test-bed 'upc'"):
+        plan.lookup("upc", "block_pod_address")
+
+    spec = yaml.safe_load(config_loader._DEFAULT_YAML.read_text())
+    spec["testbeds"]["upc"]["endpoints"]["block_ip_addresses"] = "http://10.19.2.2:8001/block"
+    moved = tmp_path / "config.yaml"
+    moved.write_text(yaml.safe_dump(spec))
+    try:
+        config_loader.reload_yaml(moved)
+        assert plan.lookup("upc", "block_ip_addresses").url == "http://10.19.2.2:8001/block"
+    finally:
+        config_loader.reload_yaml()
+    assert plan.lookup("upc", "block_ip_addresses").url == "http://10.19.2.1:8001/block_ip_addresses"
+
+
+def test_reload_runs_every_hook_and_reports_the_failed_ones(client, monkeypatch):
+    """A raising reload hook does not stop the others; /reload_config names it in a 500"""
+    from src import config_loader
+
+    ran = []
+
+    def broken():
+        raise RuntimeError("bad setting")
+
+    monkeypatch.setattr(config_loader, "_RELOAD_HOOKS", [broken, lambda: ran.append("after"), *config_loader._RELOAD_HOOKS])
+    resp = client.get("/reload_config")
+
+    assert resp.status_code == 500
+    assert resp.json()["detail"]["failed_hooks"] == {f"{__name__}.{broken.__qualname__}": "bad setting"}
+    assert ran == ["after"]
+
+    monkeypatch.setattr(config_loader, "_RELOAD_HOOKS", config_loader._RELOAD_HOOKS[1:])
+    assert client.get("/reload_config").json() == {"status": "reloaded"}
 
+
+#### Field type validation ####
+
+def test_mistyped_fields_rejected_before_dispatch(client, httpx_mock, patch_mongo):
+    """Type and enum specs from config.yaml are enforced locally, without an upstream call"""
+    payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": "typed-001", "action": {
+        "name": "udp_traffic_filter",
+        "fields": {"protocol": "icmp", "source_ip_filter": ["10.0.0.5"], "destination_port": True},
+    }}
+
+    resp = client.post("/api/mitigate", json=payload)
+    assert resp.status_code == 422
+    assert resp.json()["message"] == (
+        "Invalid field(s) for action 'udp_traffic_filter': 'protocol' must be one of ['TCP', 'UDP'], "
+        "got 'icmp'; 'destination_port' must be int|str, got bool"
+    )
+    assert httpx_mock.get_requests() == []
+    patch_mongo.assert_not_called()
+
+
+#### Idempotency ####
+
+def test_replayed_intent_returns_stored_result(client, httpx_mock, patch_mongo):
+    """A retried intent_id is answered from the cache without a second dispatch"""
+    from src.services.idempotency import idempotency
+
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked"},
+    )
+    payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": "replay-001"}
+
+    first = client.post("/api/mitigate", json=payload)
+    replay = client.post("/api/mitigate", json=payload)
+
+    assert first.status_code == replay.status_code == 200
+    assert replay.json() == first.json()
+    assert len(httpx_mock.get_requests()) == 1
+    patch_mongo.assert_called_once()
+    assert idempotency.stats()["hits"] == 1
+
+
+def test_replays_consult_mongo_only_for_known_intents_and_never_enforce_twice(client, httpx_mock, patch_mongo, mocker):
+    """New intents skip the Mongo lookup; stored results honour the ttl; a queued job is not enqueued again"""
+    import time
+    from pymongo.errors import WriteError
+
+    url = "http://10.19.2.1:8001/block_ip_addresses"
+    httpx_mock.add_response(method="POST", url=url, status_code=200, json={"message": "UPC: IPs blocked"}, is_reusable=True)
+    find = mocker.patch("src.utils.mongo.find_record", return_value=None)
+
+    assert client.post("/api/mitigate", json={**UPC_BLOCK_IP_PAYLOAD, "intent_id": "fresh-001"}).status_code == 200
+    find.assert_not_called()
+
+    # The audit insert says the intent_id is known: its stored result answers only while within the ttl
+    patch_mongo.side_effect = WriteError("E11000 duplicate key error", 11000, {})
+    stored = client.post("/api/mitigate", json={**UPC_BLOCK_IP_PAYLOAD, "intent_id": "fresh-001"}).json()
+    find.return_value = {"intent_id": "known-001", "result": {**stored, "intent_id": "known-001"}, "result_at": time.time()}
+    assert client.post("/api/mitigate", json={**UPC_BLOCK_IP_PAYLOAD, "intent_id": "known-001"}).json()["intent_id"] == "known-001"
+    assert len(httpx_mock.get_requests()) == 1
+    find.return_value = {**find.return_value, "intent_id": "stale-001", "result_at": time.time() - 7200}
+    stale = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": "stale-001",
+             "action": {"name": "block_ip_addresses", "fields": {"blocked_ips": ["10.9.9.9"]}}}
+    assert client.post("/api/mitigate", json=stale).status_code == 200
+    assert len(httpx_mock.get_requests()) == 2
+    patch_mongo.side_effect = None
+
+
+def test_replay_of_a_queued_async_intent_returns_its_job(httpx_mock, patch_mongo, mocker):
+    """RTR retrying an intent whose job has not finished gets the job state; the intent is enforced once"""
+    import asyncio
+    import time
+
+    mocker.patch("src.utils.mongo.update_record")
+    mocker.patch("src.utils.mongo.find_record", return_value=None)
+
+    async def slow_upc(request):
+        await asyncio.sleep(0.3)
+        return httpx.Response(200, json={"message": "UPC: IPs blocked"})
+
+    httpx_mock.add_callback(slow_upc, url="http://10.19.2.1:8001/block_ip_addresses", is_reusable=True)
+    payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": "async-replay-001"}
+
+    with TestClient(app) as client:
+        first = client.post("/api/mitigate?mode=async", json=payload)
+        replay = client.post("/api/mitigate?mode=async", json=payload)
+        assert first.status_code == replay.status_code == 202
+        assert replay.json()["status"] in ("queued", "running")
+
+        deadline = time.monotonic() + 5
+        while client.get("/api/mitigate/async-replay-001").json()["status"] != "completed" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        done = client.post("/api/mitigate?mode=async", json=payload)
+
+    assert done.status_code == 200 and done.json()["status"] == "success"
+    assert len(httpx_mock.get_requests()) == 1
+    patch_mongo.assert_called_once()
+
+
+#### Single-flight dispatch ####
+
+def test_concurrent_identical_dispatches_share_one_call(client, httpx_mock, patch_mongo, mocker):
+    """Identical payloads to the same endpoint in flight together reach the testbed once"""
+    import asyncio
+    mocker.patch("src.utils.mongo.insert_many_raw", return_value={"inserted": 2, "errors": []})
+
+    async def slow_upc(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"message": "UPC: IPs blocked"})
+
+    httpx_mock.add_callback(slow_upc, url="http://10.19.2.1:8001/block_ip_addresses")
+
+    items = [{**UPC_BLOCK_IP_PAYLOAD, "intent_id": f"burst-{n:03}"} for n in range(2)]
+    resp = client.post("/api/mitigate/batch", json=items)
+
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["succeeded"] == 2
+    assert all(r["upstream"] == {"message": "UPC: IPs blocked"} for r in body["results"])
+    assert len(httpx_mock.get_requests()) == 1
+
+
+#### Circuit breakers ####
+
+def test_open_circuit_fails_fast(client, httpx_mock, patch_mongo, monkeypatch):
+    """After repeated connection failures the endpoint is skipped until open_for elapses"""
+    from src import config_loader
+
+    monkeypatch.setattr(config_loader, "BREAKER_CFG", {"window": 4, "min_calls": 2, "failure_rate": 0.5, "open_for": 60})
+
+    url = "http://10.19.2.1:8001/block_ip_addresses"
+    httpx_mock.add_exception(httpx.ConnectError("Connection refused"), url=url, is_reusable=True)
+
+    for n in range(2):
+        resp = client.post("/api/mitigate", json={**UPC_BLOCK_IP_PAYLOAD, "intent_id": f"breaker-{n}"})
+        assert resp.status_code == 502
+
+    resp = client.post("/api/mitigate", json={**UPC_BLOCK_IP_PAYLOAD, "intent_id": "breaker-open"})
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == "60"
+    assert resp.json()["detail"].startswith(f"Circuit open for {url}")
+    assert len(httpx_mock.get_requests()) == 2
+    assert client.get("/stats").json()["breakers"][url]["state"] == "open"
+
+
+def test_half_open_probe_is_taken_only_by_the_call_and_given_back():
+    """Fail-fast checks take no probe; a probe call cancelled before its verdict frees the slot"""
+    import asyncio
+    from src.dispatch.breaker import CLOSED, HALF_OPEN, CircuitBreaker
+    from src.dispatch.errors import CircuitOpenError
+
+    breaker = CircuitBreaker("http://upstream", min_calls=1, open_for=0)
+    with pytest.raises(httpx.ConnectError):
+        with breaker.track():
+            raise httpx.ConnectError("Connection refused")
+
+    # Admission rejects, queue waits and singleflight joiners only ever see permits()
+    assert all(breaker.permits() for _ in range(3))
+
+    with pytest.raises(asyncio.CancelledError):
+        with breaker.track():
+            assert breaker.state == HALF_OPEN
+            assert not breaker.permits()
+            with pytest.raises(CircuitOpenError):
+                with breaker.track():
+                    pass
+            raise asyncio.CancelledError()
+
+    assert breaker.permits()
+    with breaker.track():
+        pass
+    assert breaker.state == CLOSED
+
+
+#### Metrics ####
+
+def test_metrics_exposes_phase_latencies(httpx_mock, patch_mongo):
+    """/metrics reports request, validation, build and upstream latency after a dispatch"""
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked"},
+    )
+
+    with TestClient(app) as client:
+        assert client.post("/api/mitigate", json={**UPC_BLOCK_IP_PAYLOAD, "intent_id": "metrics-001"}).status_code == 200
+        resp = client.get("/metrics")
+
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = resp.text
+    assert 'doc_request_duration_seconds_count{testbed="upc",action="block_ip_addresses",outcome="success"}' in text
+    assert 'doc_validation_duration_seconds_count{action="block_ip_addresses",outcome="valid"}' in text
+    assert 'doc_builder_render_duration_seconds_count{testbed="upc",action="block_ip_addresses"}' in text
+    assert 'doc_upstream_duration_seconds_bucket{endpoint="http://10.19.2.1:8001/block_ip_addresses",outcome="2xx",le="+Inf"}' in text
+    assert 'doc_pool_connections{origin="http://10.19.2.1:8001",state="idle"}' in text
+
+
+#### Request envelope ####
+
+def test_request_is_serialized_once_across_persist_forward_and_build(client, httpx_mock, patch_mongo, monkeypatch, mocker):
+    """One model_dump feeds the audit record, the per-domain forward body and the UPC payload"""
+    from src import config_loader, main
+    from src.model.MitigationActionRequest import MitigationActionRequest
+    from src.utils import codec
+
+    monkeypatch.setitem(config_loader.DOMAIN_ROUTING, "current_domain", "upc")
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/dns_rate_limiting",
+        status_code=200,
+        json={"message": "UPC: Rate limiting applied"}
+    )
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.208.11.73:8001/api/mitigate",
+        status_code=200,
+        json={"status": "success"}
+    )
+    dump = mocker.spy(MitigationActionRequest, "model_dump")
+
+    resp = client.post("/api/mitigate", json=VALID_PAYLOAD_MULTI_DOMAIN_DNS_RATE_LIMITING)
+
+    assert resp.status_code == 200
+    assert resp.json()["status"] == "success"
+    assert dump.call_count == 1
+
+    upc_req = httpx_mock.get_request(url="http://10.19.2.1:8001/dns_rate_limiting")
+    doc_req = httpx_mock.get_request(url="http://10.208.11.73:8001/api/mitigate")
+    fields = VALID_PAYLOAD_MULTI_DOMAIN_DNS_RATE_LIMITING["action"]["fields"]
+    assert upc_req.content == codec.dumps({"fields": fields})
+    forwarded = json.loads(doc_req.content)
+    assert forwarded["target_domain"] == "umu"
+    assert forwarded["action"] == patch_mongo.call_args.args[0]["action"]
+
+
+#### JSON codec ####
+
+@pytest.mark.parametrize("name", ["json", "orjson"])
+def test_codecs_produce_identical_payloads(name, client, httpx_mock, patch_mongo, monkeypatch):
+    """Builder output, upstream reply parsing and the API response behave the same with either codec"""
+    from src.utils import codec
+
+    if name not in codec.CODECS:
+        pytest.skip("orjson is not installed")
+    monkeypatch.setattr(codec, "NAME", codec.NAME)
+    monkeypatch.setattr(codec, "dumps", codec.dumps)
+    monkeypatch.setattr(codec, "loads", codec.loads)
+    codec.use(name)
+
+    httpx_mock.add_response(
+        method="POST",
+        url="http://10.19.2.1:8001/block_ip_addresses",
+        status_code=200,
+        json={"message": "UPC: IPs blocked", "blocked": ["10.0.0.1", "10.0.0.5"]},
+    )
+
+    resp = client.post("/api/mitigate", json={**UPC_BLOCK_IP_PAYLOAD, "intent_id": f"codec-{name}"})
+
+    assert resp.status_code == 200
+    assert resp.json()["upstream"] == {"message": "UPC: IPs blocked", "blocked": ["10.0.0.1", "10.0.0.5"]}
+    sent = httpx_mock.get_requests()[0].content
+    assert sent == json.dumps({"fields": UPC_BLOCK_IP_PAYLOAD["action"]["fields"]}, separators=(",", ":")).encode()
+
+
+#### Admission control ####
+
+def test_full_dispatch_queue_rejects_with_retry_after(client, httpx_mock, patch_mongo, monkeypatch, mocker):
+    """Dispatches beyond an endpoint's slots and queue are turned away instead of reaching the testbed"""
+    import asyncio
+    from src import config_loader
+
+    monkeypatch.setattr(config_loader, "ADMISSION_CFG", {
+        "reject_status": 429,
+        "retry_after": 2,
+        "endpoints": {"default": {"max_concurrent": 1, "max_queue": 1, "queue_timeout": 5}},
+    })
+    mocker.patch("src.utils.mongo.insert_many_raw", return_value={"inserted": 3, "errors": []})
+
+    async def slow_upc(request):
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"message": "UPC: IPs blocked"})
+
+    url = "http://10.19.2.1:8001/block_ip_addresses"
+    httpx_mock.add_callback(slow_upc, url=url, is_reusable=True)
+
+    # Distinct IPs, so single-flight does not merge them
+    items = [
+        {**UPC_BLOCK_IP_PAYLOAD, "intent_id": f"admit-{n}",
+         "action": {"name": "block_ip_addresses", "fields": {"blocked_ips": [f"10.0.0.{n}"]}}}
+        for n in range(3)
+    ]
+    body = client.post("/api/mitigate/batch", json=items).json()
+
+    assert body["succeeded"] == 2
+    rejected = [r for r in body["results"] if r["status"] == "error"]
+    assert len(rejected) == 1
+    assert rejected[0]["message"].startswith(f"Too many dispatches for endpoint:{url}: queue full")
+    assert len(httpx_mock.get_requests()) == 2
+
+    limits = client.get("/stats").json()["admission"][f"endpoint:{url}"]
+    assert limits["admitted"] == 2 and limits["rejected"] == 1 and limits["active"] == 0
+
+    # /api/mitigate answers a rejection with the configured status and Retry-After
+    from src.dispatch.http import AdmissionRejected
+    from src.main import upstream_error
+    error = upstream_error(AdmissionRejected(f"endpoint:{url}", "queue full", 2, 429))
+    assert error.status_code == 429 and error.headers == {"Retry-After": "2"}
+
+
+def test_flood_to_one_endpoint_leaves_testbed_slots_for_the_others(monkeypatch):
+    """Callers queued for a busy endpoint hold no testbed slot, so the testbed's other endpoints get through"""
+    import asyncio
+    from src import config_loader
+    from src.dispatch.admission import control
+
+    monkeypatch.setattr(config_loader, "ADMISSION_CFG", {
+        "testbeds": {"default": {"max_concurrent": 2, "max_queue": 8, "queue_timeout": 5}},
+        "endpoints": {"default": {"max_concurrent": 1, "max_queue": 8, "queue_timeout": 0.5}},
+    })
+
+    async def scenario():
+        busy = asyncio.Event()
+
+        async def call(url, hold):
+            async with control.slot("upc", url):
+                if hold:
+                    await busy.wait()
+            return url
+
+        flood = [asyncio.create_task(call("http://upc/busy", True)) for _ in range(4)]
+        await asyncio.sleep(0)
+        other = await call("http://upc/other", False)
+        stats = control.stats()
+        busy.set()
+        await asyncio.gather(*flood)
+        return other, stats
+
+    other, stats = asyncio.run(scenario())
+    assert other == "http://upc/other"
+    assert stats["testbed:upc"]["active"] == 1
+    assert stats["endpoint:http://upc/busy"]["waiting"]["normal"] == 3
+
+
+#### Priority lanes ####
+
+def test_priority_lanes_order_and_shed_waiters():
+    """A revocation jumps queued rate-limit updates and, with the queue full, displaces the newest of them"""
+    import asyncio
+    from src.dispatch import priority
+    from src.dispatch.admission import Limiter
+    from src.dispatch.errors import AdmissionRejected
+
+    lanes = priority.compile_index({
+        "aging": 60,
+        "lanes": [{"name": "revoke", "commands": ["delete"]}, {"name": "normal"}],
+    })
+    revoke, normal = lanes.classify("delete", None, "block_ip_addresses"), lanes.classify("add", "ddos", "dns_rate_limiting")
+    assert (revoke.name, normal.name) == ("revoke", "normal")
+    # Starvation protection: a normal intent queued over `aging` seconds earlier goes first
+    assert lanes.deadline(normal, 0) < lanes.deadline(revoke, 61)
+
+    async def scenario():
+        limiter = Limiter("endpoint:test", max_concurrent=1, max_queue=2, queue_timeout=5, lanes=lanes)
+        served = []
+
+        async def dispatch(name, lane):
+            try:
+                await limiter.acquire(lane)
+            except AdmissionRejected as e:
+                served.append(f"{name}: {e.reason}")
+                return
+            served.append(name)
+            await asyncio.sleep(0)
+            limiter.release()
+
+        await limiter.acquire(normal)  # the testbed is busy
+        tasks = [asyncio.create_task(dispatch(f"rate-{n}", normal)) for n in range(2)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(dispatch("delete", revoke)))
+        await asyncio.sleep(0)
+        limiter.release()
+        await asyncio.gather(*tasks)
+        return served, limiter.stats()
+
+    served, stats = asyncio.run(scenario())
+    assert served == ["rate-1: shed for a 'revoke' dispatch", "delete", "rate-0"]
+    assert stats["shed"] == 1 and stats["active"] == 0
+    assert stats["waiting"] == {"revoke": 0, "normal": 0}
+
+
+#### Active mitigations ####
+
+def test_rule_is_indexed_and_lifted_when_its_duration_ends(httpx_mock, patch_mongo, monkeypatch, mocker):
+    """An enforced block with a duration is tracked, persisted, and deleted on the testbed when it ends"""
+    import time
+    from src.services.active import active
+
+    stored = {}
+
+    def write_active(changes):
+        for key, doc in changes.items():
+            if doc is None:
+                stored.pop(key, None)
+            else:
+                stored[key] = doc
+        return len(changes)
+
+    mocker.patch("src.utils.mongo.load_active", return_value=[])
+    mocker.patch("src.utils.mongo.write_active", side_effect=write_active)
+
+    monkeypatch.setattr(active, "tick", 0.05)
+    monkeypatch.setattr(active, "persist_interval", 0.05)
+    active.clear()
+    url = "http://10.19.2.1:8001/block_ip_addresses"
+    httpx_mock.add_response(method="POST", url=url, status_code=200, json={"message": "UPC: done"})
+    httpx_mock.add_response(method="DELETE", url=url, status_code=200, json={"message": "UPC: lifted"})
+    callback = mocker.patch("src.utils.callback.delivery.submit")
+
+    with TestClient(app) as client:
+        resp = client.post("/api/mitigate", json={**UPC_BLOCK_IP_PAYLOAD, "intent_id": "timed-001", "duration": 1,
+                                                  "callback_url": RTR_CALLBACK_URL})
+        assert resp.status_code == 200
+
+        rule = active.get(("upc", "", "", "block_ip_addresses:192.168.1.100"))
+        assert rule.intent_id == "timed-001" and rule.expires_at is not None
+        time.sleep(0.2)
+        assert list(stored) == ["upc|||block_ip_addresses:192.168.1.100"]
+
+        deadline = time.monotonic() + 5
+        while active.stats()["expired"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        stats = client.get("/stats").json()["active"]
+
+    assert stats["expired"] == 1 and stats["active"] == 0
+    add, delete = httpx_mock.get_requests()
+    assert (add.method, delete.method) == ("POST", "DELETE")
+    assert json.loads(delete.content) == json.loads(add.content) == {"fields": {"blocked_ips": ["192.168.1.100"]}}
+    expiry_audit = patch_mongo.call_args_list[-1].args[0]
+    assert expiry_audit["intent_id"] == "timed-001-expiry-upc" and expiry_audit["command"] == "delete"
+    assert stored == {}
+    # RTR hears about its own intent only, not about the synthetic expiry intent
+    assert [c.kwargs["intent_id"] for c in callback.call_args_list] == ["timed-001"]
+
+
+def test_expiry_delete_names_the_installed_umu_policy(httpx_mock):
+    """The delete lifting an expired UMU rule sends the policy it installed, same id, with DELETE"""
+    import asyncio
+    from src.dispatch.http import dispatch
+    from src.model.MitigationActionRequest import MitigationActionRequest
+    from src.model.envelope import RequestEnvelope
+    from src.services.active import ActiveAction, expiry_request, rule_key
+    from src.utils import codec
+
+    url = "http://10.208.11.79:8002/meservice"
+    httpx_mock.add_response(method="DELETE", url=url, text="removed")
+    req = MitigationActionRequest.model_validate({
+        "command": "add",
+        "intent_type": "mitigation",
+        "intent_id": "umu-expiry-001",
+        "target_domain": "umu",
+        "duration": 60,
+        "action": {
+            "name": "block_pod_address",
+            "intent_id": "umu-expiry-action-001",
+            "fields": {"blocked_pod": "10.3.0.1", "device": "ceos1", "interface": "eth1"},
+        },
+    })
+    fields = req.action.fields
+    entry = ActiveAction(*rule_key("umu", "block_pod_address", fields), intent_id=req.intent_id,
+                         action="block_pod_address", fields=fields, request=codec.loads(RequestEnvelope.of(req).json))
+
+    delete = expiry_request(entry)
+    reply, status, success = asyncio.run(dispatch(delete))
+
+    assert delete.intent_id == "umu-expiry-001-expiry-umu" and delete.command == "delete"
+    assert success and status == 200
+    sent = httpx_mock.get_request()
+    assert sent.method == "DELETE"
+    policy = etree.fromstring(sent.content)
+    assert policy.get("id") == "omspl_umu-expiry-action-001" and policy.findtext(".//{*}target") == "10.3.0.1"
+
+
+def test_timer_wheel_fires_across_levels_and_cancels():
+    """Timers beyond the first wheel cascade down and fire on their tick; cancelled ones never fire"""
+    from src.services.timerwheel import TimerWheel
+
+    wheel = TimerWheel(tick=1, slots=4, levels=3, now=0)
+    for when in (1, 3, 5, 17, 63, 200):  # levels 0, 0, 1, 2, 2 and past the top
+        wheel.schedule(when, when)
+    wheel.schedule("cancelled", 17)
+    assert wheel.cancel("cancelled") is None and len(wheel) == 6
+
+    fired = {key: t for t in range(1, 201) for key, _ in wheel.advance(t)}
+    assert fired == {1: 1, 3: 3, 5: 5, 17: 17, 63: 63, 200: 200}
+    assert len(wheel) == 0
+
+
+#### Enforced block index ####
+
+def test_blocks_already_in_force_are_filtered_or_skipped(httpx_mock, patch_mongo):
+    """Targets covered by an enforced block (or CIDR) are dropped; a fully covered block makes no upstream call"""
+    url = "http://10.19.2.1:8001/block_ip_addresses"
+    httpx_mock.add_response(method="POST", url=url, status_code=200, json={"message": "UPC: done"}, is_reusable=True)
+
+    def block(intent_id, ips):
+        payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": intent_id,
+                   "action": {"name": "block_ip_addresses", "fields": {"blocked_ips": ips}}}
+        return client.post("/api/mitigate", json=payload)
+
+    with TestClient(app) as client:
+        before = client.get("/stats").json()["blocks"]
+        assert block("cidr-001", ["10.0.0.0/24"]).status_code == 200
+        assert block("partial-001", ["10.0.0.7", "172.16.0.1"]).status_code == 200
+        resp = block("redundant-001", ["10.0.0.9", "172.16.0.1"])
+        stats = client.get("/stats").json()["blocks"]
+
+    sent = [json.loads(r.content)["fields"]["blocked_ips"] for r in httpx_mock.get_requests()]
+    assert sent == [["10.0.0.0/24"], ["172.16.0.1"]]
+    assert resp.status_code == 200
+    assert resp.json()["upstream"]["status"] == "already_enforced"
+    assert resp.json()["upstream"]["covered"] == {"10.0.0.9": "10.0.0.0/24", "172.16.0.1": "172.16.0.1/32"}
+    # 10.0.0.7 was never sent on its own, so only the /24 and 172.16.0.1 are indexed
+    assert stats["blocked"] == {"upc|": 2}
+    assert stats["requests_skipped"] - before["requests_skipped"] == 1
+    assert stats["targets_skipped"] - before["targets_skipped"] == 3
+
+
+def test_covered_blocks_record_what_was_sent_and_extend_the_covering_rule(httpx_mock, patch_mongo):
+    """Only uncovered targets are indexed; a covered request asking for longer keeps the covering rule longer"""
+    import time
+    from src.services.active import active
+
+    url = "http://10.19.2.1:8001/block_ip_addresses"
+    httpx_mock.add_response(method="POST", url=url, status_code=200, json={"message": "UPC: done"}, is_reusable=True)
+    httpx_mock.add_response(method="DELETE", url=url, status_code=200, json={"message": "UPC: lifted"})
+    cidr = ("upc", "", "", "block_ip_addresses:10.0.0.0/24")
+
+    def block(intent_id, ips, command="add", **extra):
+        payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": intent_id, "command": command, **extra,
+                   "action": {"name": "block_ip_addresses", "fields": {"blocked_ips": ips}}}
+        return client.post("/api/mitigate", json=payload)
+
+    with TestClient(app) as client:
+        assert block("extend-001", ["10.0.0.0/24"], duration=60).status_code == 200
+        assert block("extend-002", ["10.0.0.7", "172.16.0.1"], duration=600).status_code == 200
+        partial = active.get(("upc", "", "", "block_ip_addresses:172.16.0.1"))
+        assert partial.fields == {"blocked_ips": ["172.16.0.1"]}
+        assert partial.request["action"]["fields"] == {"blocked_ips": ["172.16.0.1"]}
+        assert active.get(("upc", "", "", "block_ip_addresses:10.0.0.7,172.16.0.1")) is None
+        assert active.get(cidr).expires_at > time.time() + 500
+
+        # Fully covered and asking for no end at all: nothing is sent, the /24 stays until deleted
+        assert block("extend-003", ["10.0.0.9"]).json()["upstream"]["status"] == "already_enforced"
+        assert active.get(cidr).expires_at is None
+        assert client.get("/stats").json()["blocks"]["blocked"] == {"upc|": 2}
+
+        # Deleting the partially covered block lifts the rule recorded for it
+        assert block("extend-004", ["10.0.0.7", "172.16.0.1"], command="delete").status_code == 200
+        assert active.get(("upc", "", "", "block_ip_addresses:172.16.0.1")) is None
+        assert client.get("/stats").json()["blocks"]["blocked"] == {"upc|": 1}
+
+    assert [r.method for r in httpx_mock.get_requests()] == ["POST", "POST", "DELETE"]
+
+
+def test_partial_block_delete_keeps_the_rest_and_lets_the_lifted_targets_be_blocked_again(httpx_mock, patch_mongo):
+    """Deleting some targets of a block shrinks its rule; a later block of a lifted target is sent again"""
+    from src.dispatch import blocks
+    from src.services.active import active
+
+    url = "http://10.19.2.1:8001/block_ip_addresses"
+    httpx_mock.add_response(method="POST", url=url, status_code=200, json={"message": "UPC: done"}, is_reusable=True)
+    httpx_mock.add_response(method="DELETE", url=url, status_code=200, json={"message": "UPC: lifted"})
+
+    def block(intent_id, ips, command="add"):
+        payload = {**UPC_BLOCK_IP_PAYLOAD, "intent_id": intent_id, "command": command,
+                   "action": {"name": "block_ip_addresses", "fields": {"blocked_ips": ips}}}
+        return client.post("/api/mitigate", json=payload)
+
+    with TestClient(app) as client:
+        assert block("partial-del-001", ["10.0.0.1", "10.0.0.2"]).status_code == 200
+        assert block("partial-del-002", ["10.0.0.1"], command="delete").status_code == 200
+
+        assert blocks.index.covering("upc", "", "10.0.0.1") is None
+        assert blocks.index.covering("upc", "", "10.0.0.2") == "10.0.0.2/32"
+        assert active.get(("upc", "", "", "block_ip_addresses:10.0.0.1,10.0.0.2")) is None
+        kept = active.get(("upc", "", "", "block_ip_addresses:10.0.0.2"))
+        assert kept.intent_id == "partial-del-001" and kept.fields == {"blocked_ips": ["10.0.0.2"]}
+        assert active.stats()["active"] == 1
+
+        resp = block("partial-del-003", ["10.0.0.1"])
+        assert resp.json()["upstream"] == {"message": "UPC: done"}
+        assert active.stats()["active"] == 2
+
+    sent = [json.loads(r.content)["fields"]["blocked_ips"] for r in httpx_mock.get_requests()]
+    assert sent[-1] == ["10.0.0.1"] and len(sent) == 3
+
+
+def test_prefix_trie_covers_and_prunes():
+    """A prefix covers the addresses and longer prefixes under it, until its last rule is removed"""
+    import ipaddress
+    from src.dispatch.blocks import PrefixTrie
+
+    net = ipaddress.ip_network
+    trie = PrefixTrie(32)
+    trie.add(net("10.1.0.0/16"))
+    trie.add(net("10.1.0.0/16"))
+    trie.add(net("10.2.3.4/32"))
+    assert trie.covering(net("10.1.200.0/24")) == net("10.1.0.0/16")
+    assert trie.covering(net("10.2.3.4/32")) == net("10.2.3.4/32")
+    assert trie.covering(net("10.0.0.0/8")) is None
+
+    trie.remove(net("10.1.0.0/16"))
+    assert trie.covering(net("10.1.2.3/32")) == net("10.1.0.0/16")
+    trie.remove(net("10.1.0.0/16"))
+    trie.remove(net("10.2.3.4/32"))
+    assert trie.covering(net("10.1.2.3/32")) is None and trie.prefixes == 0
+    assert trie.root.children == [None, None]
+
+
+#### UMU block fan-out ####
+
+def test_umu_block_pod_list_fans_out_one_policy_per_target(httpx_mock):
+    """Every pod of a block_pod_address list gets its own policy; results come back per target"""
+    import asyncio
+    from src.dispatch.http import dispatch
+    from src.model.MitigationActionRequest import MitigationActionRequest
+
+    url = "http://10.208.11.79:8002/meservice"
+
+    def meservice(request):
+        target = etree.fromstring(request.content).findtext(".//{*}target")
+        if target == "10.1.0.3":
+            return httpx.Response(500, text="policy rejected")
+        return httpx.Response(200, text=f"enforced {target}")
+
+    httpx_mock.add_callback(meservice, url=url, is_reusable=True)
+    req = MitigationActionRequest.model_validate({
+        "command": "add",
+        "intent_type": "mitigation",
+        "intent_id": "umu-fanout-001",
+        "target_domain": "umu",
+        "action": {
+            "name": "block_pod_address",
+            "intent_id": "umu-fanout-action-001",
+            "fields": {"blocked_pod": ["10.1.0.1", "10.1.0.2", "10.1.0.1", "10.1.0.3"],
+                       "device": "ceos1", "interface": "eth1"},
+        },
+    })
+
+    reply, status, success = asyncio.run(dispatch(req))
+
+    sent = [etree.fromstring(r.content) for r in httpx_mock.get_requests()]
+    assert sorted(x.findtext(".//{*}target") for x in sent) == ["10.1.0.1", "10.1.0.2", "10.1.0.3"]
+    assert len({x.get("id") for x in sent}) == 3
+    assert not success and status == 500 and reply["status"] == "partial_success"
+    assert reply["targets"]["10.1.0.1"] == {"status": "success", "response": {"raw": "enforced 10.1.0.1"}, "http_status": 200}
+    assert reply["targets"]["10.1.0.3"]["status"] == "error"
+    assert reply["error"] == "1 of 3 targets failed: 10.1.0.3"
+
+
+def test_partly_failed_fan_out_answers_the_breakdown_and_indexes_what_succeeded(httpx_mock, patch_mongo, monkeypatch):
+    """A fan-out some pods of which are rejected is a partial_success with per-target outcomes; only the rest is indexed"""
+    from src import config_loader
+    from src.services.active import active
+
+    monkeypatch.setattr(config_loader, "DOMAIN_ROUTING", {**config_loader.DOMAIN_ROUTING, "current_domain": "umu"})
+    url = "http://10.208.11.79:8002/meservice"
+
+    def meservice(request):
+        target = etree.fromstring(request.content).findtext(".//{*}target")
+        return httpx.Response(500 if target == "10.4.0.3" else 200, text=f"policy for {target}")
+
+    httpx_mock.add_callback(meservice, url=url, is_reusable=True)
+    payload = {
+        "command": "add",
+        "intent_type": "mitigation",
+        "intent_id": "umu-partial-001",
+        "target_domain": "umu",
+        "action": {
+            "name": "block_pod_address",
+            "intent_id": "umu-partial-action-001",
+            "fields": {"blocked_pod": ["10.4.0.1", "10.4.0.2", "10.4.0.3"], "device": "ceos1", "interface": "eth1"},
+        },
+    }
+
+    with TestClient(app) as client:
+        resp = client.post("/api/mitigate", json=payload)
+
+    body = resp.json()
+    assert resp.status_code == 200 and body["status"] == "partial_success"
+    assert body["message"] == "1 of 3 targets failed: 10.4.0.3"
+    assert {t: r["status"] for t, r in body["upstream"]["targets"].items()} == {
+        "10.4.0.1": "success", "10.4.0.2": "success", "10.4.0.3": "error"}
+    rule = active.get(("umu", "ceos1", "eth1", "block_pod_address:10.4.0.1,10.4.0.2"))
+    assert rule.fields["blocked_pod"] == ["10.4.0.1", "10.4.0.2"]
+    assert rule.request["action"]["fields"]["blocked_pod"] == ["10.4.0.1", "10.4.0.2"]
+    assert active.stats()["active"] == 1
+
+
+def test_umu_fan_out_through_a_half_open_breaker_recovers(httpx_mock, monkeypatch):
+    """A fan-out after open_for spends the one probe on a real POST, which closes the breaker"""
+    import asyncio
+    from src import config_loader
+    from src.dispatch.breaker import CLOSED, breakers
+    from src.dispatch.http import dispatch
+    from src.model.MitigationActionRequest import MitigationActionRequest
+
+    monkeypatch.setattr(config_loader, "BREAKER_CFG", {"min_calls": 1, "open_for": 0})
+    url = "http://10.208.11.79:8002/meservice"
+    httpx_mock.add_response(url=url, text="enforced", is_reusable=True)
+    breaker = breakers.get(url)
+    with pytest.raises(httpx.ConnectError):
+        with breaker.track():
+            raise httpx.ConnectError("Connection refused")
+
+    def block(n, pods):
+        return MitigationActionRequest.model_validate({
+            "command": "add",
+            "intent_type": "mitigation",
+            "intent_id": f"umu-half-open-{n}",
+            "target_domain": "umu",
+            "action": {
+                "name": "block_pod_address",
+                "intent_id": f"umu-half-open-action-{n}",
+                "fields": {"blocked_pod": pods, "device": "ceos1", "interface": "eth1"},
+            },
+        })
+
+    reply, _, _ = asyncio.run(dispatch(block(1, ["10.2.0.1", "10.2.0.2"])))
+    assert breaker.state == CLOSED
+    assert [r["status"] for r in reply["targets"].values()].count("success") >= 1
+
+    reply, status, success = asyncio.run(dispatch(block(2, ["10.2.1.1", "10.2.1.2"])))
+    assert success and status == 200
+
+
+#### UMU templates ####
+
+def test_umu_templates_are_checked_when_compiled(tmp_path):
+    """A template that would leave a placeholder in its output is rejected when compiled, not per request"""
+    from jinja2 import UndefinedError
+    from src.dispatch.builders.umu_xml import compile_templates
+
+    (tmp_path / "ok.xml.j2").write_text("<id>{{ id }}</id>")
+    _, templates = compile_templates(tmp_path)
+    assert templates["ok.xml.j2"].render(id="7") == "<id>7</id>"
+    with pytest.raises(UndefinedError):
+        templates["ok.xml.j2"].render()
+
+    (tmp_path / "bad.xml.j2").write_text("<id>{% raw %}{{ id }}{% endraw %}</id>")
+    with pytest.raises(ValueError, match="bad.xml.j2"):
+        compile_templates(tmp_path)
+
+
+def test_umu_templates_reload_only_with_config(mocker):
+    """Templates are compiled once; reload_config recompiles them"""
+    from src.config_loader import reload_yaml
+    from src.dispatch.builders import umu_xml
+    from src.model.MitigationActionRequest import MitigationActionRequest
+
+    req = MitigationActionRequest.model_validate({
+        "command": "add", "intent_type": "mitigation", "intent_id": "tpl-001", "target_domain": "umu",
+        "action": {"name": "block_pod_address", "intent_id": "tpl-001",
+                   "fields": {"blocked_pod": "10.1.0.1", "device": "ceos1", "interface": "eth1"}},
+    })
+    compiled = umu_xml._TEMPLATES
+    spy = mocker.spy(umu_xml, "compile_templates")
+    assert b"<target>10.1.0.1</target>" in umu_xml.build_umu_xml(req).body
+    assert spy.call_count == 0 and umu_xml._TEMPLATES is compiled
+
+    reload_yaml()
+    assert spy.call_count == 1 and umu_xml._TEMPLATES is not compiled
+
+
+#### Builder cache ####
+
+def test_identical_actions_reuse_the_rendered_payload(mocker):
+    """Same action and fields under a new intent_id: the cached payload with the id spliced in, no render"""
+    from src.dispatch import memo, plan
+    from src.dispatch.builders import umu_xml
+    from src.model.MitigationActionRequest import MitigationActionRequest
+
+    def intent(intent_id, rate="100kbps"):
+        return MitigationActionRequest.model_validate({
+            "command": "add", "intent_type": "mitigation", "intent_id": intent_id, "target_domain": "umu",
+            "action": {"name": "router_rate_limiting", "intent_id": intent_id,
+                       "fields": {"device": "ceos1", "interface": "eth1", "rate": rate, "duration": "60"}},
+        })
+
+    builder = plan.lookup("umu", "router_rate_limiting").builder
+    before = memo.payloads.stats()
+    first = builder(intent("rl-001")).body
+    renders = mocker.spy(umu_xml, "policy_context")
+    second = builder(intent("rl-002"))
+
+    assert renders.call_count == 0
+    assert second.body == umu_xml.build_umu_xml(intent("rl-002")).body
+    assert b"rl-001" not in second.body and second.body.count(b"rl-002") == first.count(b"rl-001")
+    assert second.headers == {"Content-Type": "application/xml"}
+
+    builder(intent("rl-003", rate="200kbps"))  # other fields: rendered
+    builder(intent("rl <004>"))                # id needing escaping: not cached
+    # Counters run across tests (only the entries are cleared between them)
+    stats = memo.payloads.stats()
+    assert tuple(stats[k] - before[k] for k in ("hits", "misses", "bypassed")) == (1, 2, 1)
+    assert stats["entries"] == 2 and stats["bytes"] > len(second.body)
+
+
+def test_builder_cache_is_bounded():
+    """Least recently used payloads are evicted past max_entries / max_bytes"""
+    from src.dispatch.builders.result import BuilderResult
+    from src.dispatch.memo import BuilderCache
+    from src.model.MitigationActionRequest import MitigationActionRequest
+
+    cache = BuilderCache(max_entries=2, max_bytes=1000)
+    build = cache.memoize("test", lambda req: BuilderResult(
+        body=b"<p id='%s'>%s</p>" % (req.action.intent_id.encode(), req.action.fields["rate"].encode())))
+
+    def intent(rate):
+        return MitigationActionRequest.model_validate({
+            "command": "add", "intent_type": "mitigation", "intent_id": "x-1", "target_domain": "upc",
+            "action": {"name": "dns_rate_limiting", "intent_id": "x-1",
+                       "fields": {"rate": rate, "duration": "60", "source_ip_filter": ["10.0.0.1"]}},
+        })
+
+    for rate in ("1", "2", "1", "3"):
+        assert build(intent(rate)).body == b"<p id='x-1'>%s</p>" % rate.encode()
+    assert cache.stats()["entries"] == 2 and cache.stats()["evictions"] == 1
+    assert build(intent("1")).body == b"<p id='x-1'>1</p>" and cache.stats()["hits"] == 2
+
+    build(intent("9" * 2000))  # larger than max_bytes on its own
+    assert cache.stats()["entries"] == 2
+
+
+#### Builder results ####
+
+def test_passthrough_payload_is_never_encoded(mocker):
+    """A CNIT acknowledgement stays data from the builder to the reply: no dumps/loads round trip"""
+    import asyncio
+    from src.dispatch.http import dispatch
+    from src.model.MitigationActionRequest import MitigationActionRequest
+    from src.utils import codec
+
+    req = MitigationActionRequest.model_validate(VALID_PAYLOAD_SINGLE_STRING_CNIT)
+    dumps = mocker.spy(codec, "dumps")
+    loads = mocker.spy(codec, "loads")
+
+    reply, status, success = asyncio.run(dispatch(req))
+
+    assert (status, success) == (200, True)
+    assert reply == {"status": "acknowledged", "message": "Domain already handled or not within reachable domains",
+                     "intent_id": "block-ip-string-001", "action": "block_ip_addresses"}
+    assert dumps.call_count == 0 and loads.call_count == 0
+
+
+def test_builder_result_derives_each_form_once(mocker):
+    """The missing form of a payload is derived on first use and reused"""
+    from src.dispatch.builders.result import BuilderResult
+    from src.utils import codec
+
+    dumps = mocker.spy(codec, "dumps")
+    result = BuilderResult(data={"fields": {"rate": "10"}})
+    assert result.body == result.body == b'{"fields":{"rate":"10"}}'
+    assert result.text == '{"fields":{"rate":"10"}}' and dumps.call_count == 1
+
+    loads = mocker.spy(codec, "loads")
+    result = BuilderResult(body=b'{"a":1}')
+    assert result.data is result.data and loads.call_count == 1
+
+
+#### Logging pipeline ####
+
+def test_queue_logging_formats_json_off_the_calling_thread_and_samples():
+    """In queue mode records are formatted and written by the listener thread, as JSON, sampled per logger"""
+    import logging
+    import threading
+    from src.utils.logs import LogPipeline
+
+    class Capture(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.lines, self.threads = [], set()
+
+        def emit(self, record):
+            self.threads.add(threading.get_ident())
+            self.lines.append(self.format(record))
+
+    sink, capture = logging.getLogger("uvicorn"), Capture()
+    request_log = logging.getLogger("uvicorn.error.request")
+    level = logging.getLogger("uvicorn.error").level
+    sink.addHandler(capture)
+    logging.getLogger("uvicorn.error").setLevel(logging.INFO)
+
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("formatted although DEBUG is disabled")
+
+    pipeline = LogPipeline("queue", "json", {"uvicorn.error.request": 0.5})
+    try:
+        pipeline.start()
+        assert sink.handlers != [capture]
+        for n in range(4):
+            request_log.info("request %s", n, extra={"intent_id": f"log-{n}"})
+        request_log.warning("never sampled out")
+        request_log.debug("%s", Expensive())
+        stats = pipeline.stats()
+    finally:
+        pipeline.stop()
+        sink.removeHandler(capture)
+        logging.getLogger("uvicorn.error").setLevel(level)
+
+    records = [json.loads(line) for line in capture.lines]
+    assert [r["message"] for r in records] == ["request 0", "request 2", "never sampled out"]
+    assert records[0]["intent_id"] == "log-0" and records[0]["logger"] == "uvicorn.error.request"
+    assert records[2]["level"] == "WARNING"
+    assert capture.threads and threading.get_ident() not in capture.threads
+    assert stats["sampled_out"] == {"uvicorn.error.request": 2} and stats["dropped"] == 0
+    assert capture.formatter is None and not request_log.filters
+
+
+def test_callback_lines_go_to_the_sampled_request_logger(httpx_mock):
+    """Per-callback INFO lines are on uvicorn.error.request, tagged with the intent_id, so LOG_SAMPLING thins them"""
+    import asyncio
+    import logging
+    from src.utils.callback import send_status_update
+
+    class Capture(logging.Handler):
+        def __init__(self):
+            super().__init__()
+            self.records = []
+
+        def emit(self, record):
+            self.records.append(record)
+
+    request_log, capture = logging.getLogger("uvicorn.error.request"), Capture()
+    level = request_log.level
+    request_log.addHandler(capture)
+    request_log.setLevel(logging.INFO)
+    httpx_mock.add_response(method="POST", url=RTR_CALLBACK_URL, status_code=200)
+    try:
+        assert asyncio.run(send_status_update(RTR_CALLBACK_URL, "log-cb-001", "completed", "done"))
+    finally:
+        request_log.removeHandler(capture)
+        request_log.setLevel(level)
+
+    assert [r.getMessage() for r in capture.records] == [
+        f"Sending status update to RTR: {RTR_CALLBACK_URL}",
+        "Successfully sent status update to RTR for intent_id log-cb-001: completed",
+    ]
+    assert {r.intent_id for r in capture.records} == {"log-cb-001"}